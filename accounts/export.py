@@ -0,0 +1,69 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from tweets.models import Tweet, TweetLike
+
+from .models import FollowUser, User
+
+# One JSON object per line, each tagged with its "type". manage.py import_data
+# reads the same format.
+RECORDS = {
+    "user": ("id", "username", "email", "date_joined"),
+    "tweet": ("id", "user_id", "title", "content", "created_at"),
+    "like": ("tweet_id", "user_id", "created_at"),
+    "follow": ("follower_id", "following_id", "created_at"),
+}
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; an import must get back the exact value.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def keyset_batches(queryset, batch_size):
+    """
+    Yield the rows of a ``values()`` queryset in primary key order.
+
+    Each batch is its own short ``pk > last`` query, streamed with
+    ``iterator()``, so neither memory nor the time any one query holds the
+    database grows with the number of rows.
+    """
+    queryset = queryset.order_by("pk")
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(pk__gt=last)
+        count = 0
+        for row in batch[:batch_size].iterator(chunk_size=batch_size):
+            count += 1
+            last = row["pk"]
+            yield row
+        if count < batch_size:
+            return
+
+
+def _records(record_type, queryset, batch_size, fields=None):
+    fields = fields or RECORDS[record_type]
+    for row in keyset_batches(queryset.values("pk", *fields), batch_size):
+        yield {"type": record_type, **{field: row[field] for field in fields}}
+
+
+def export_user(user, batch_size=None, include_password=False):
+    """The user, their tweets, the likes they gave and their follow edges in both directions, as NDJSON lines."""
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    user_fields = RECORDS["user"] + (("password",) if include_password else ())
+    records = [
+        _records("user", User.objects.filter(pk=user.pk), batch_size, fields=user_fields),
+        _records("tweet", Tweet.objects.filter(user=user), batch_size),
+        _records("like", TweetLike.objects.filter(user=user), batch_size),
+        _records("follow", FollowUser.objects.filter(follower=user), batch_size),
+        _records("follow", FollowUser.objects.filter(following=user), batch_size),
+    ]
+    for source in records:
+        for record in source:
+            yield json.dumps(record, cls=ExportEncoder, ensure_ascii=False) + "\n"
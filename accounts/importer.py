@@ -0,0 +1,271 @@
+import csv
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from tweets.models import Tweet, TweetLike
+
+from .export import RECORDS
+from .models import FollowUser, User
+
+MODELS = {"user": User, "tweet": Tweet, "like": TweetLike, "follow": FollowUser}
+# Rows are written parents first, so a batch may refer to rows earlier in itself.
+ORDER = ("user", "tweet", "like", "follow")
+REFERENCES = {
+    "tweet": {"user_id": User},
+    "like": {"tweet_id": Tweet, "user_id": User},
+    "follow": {"follower_id": User, "following_id": User},
+}
+OPTIONAL = {"email": str, "title": lambda: None, "date_joined": timezone.now, "created_at": timezone.now}
+# Fewer fsyncs and a larger page cache while importing. A crashed import can
+# be resumed from its checkpoint, but with synchronous=OFF a power loss may
+# lose batches the checkpoint already counts.
+SQLITE_PRAGMAS = {"synchronous": "OFF", "temp_store": "MEMORY", "cache_size": "-200000"}
+
+
+class ImportDataError(Exception):
+    pass
+
+
+class InsertedRows:
+    """
+    Execute wrapper adding up the rows the INSERTs it sees actually wrote;
+    ``INSERT OR IGNORE`` reports no row for a conflict.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.count += max(context["cursor"].rowcount, 0)
+        return result
+
+
+def read_records(path, format=None, record_type=None):
+    """Yield ``(line_number, record)`` from an NDJSON file, or a CSV file with a header row."""
+    format = format or ("csv" if path.endswith(".csv") else "ndjson")
+    with open(path, newline="", encoding="utf-8") as f:
+        if format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                if record_type:
+                    row.setdefault("type", record_type)
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ImportDataError(f"line {number}: {e}")
+            yield number, record
+
+
+@contextmanager
+def relaxed_sqlite_pragmas():
+    # SQLite refuses to change them inside a transaction.
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        saved = {}
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}")
+            saved[name] = cursor.fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@contextmanager
+def imported_timestamps():
+    # bulk_create() would otherwise stamp every row with the current time.
+    fields = [model._meta.get_field("created_at") for model in (Tweet, TweetLike, FollowUser)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Importer:
+    """
+    Load ``read_records()`` output with one ``bulk_create(ignore_conflicts=True)``
+    per record type and batch, so rows that already exist, including
+    duplicate likes and follows, are skipped rather than failing the batch.
+
+    Each batch commits in its own transaction and then moves the checkpoint
+    forward; running again with the same checkpoint file resumes after the
+    last committed batch. Counters and timelines are not maintained here;
+    rebuild them once the import is done.
+
+    Rows keep their source ids, so a user whose id or username already
+    belongs to another user fails the import: skipping it would attach its
+    tweets, likes and follows to whoever holds the id.
+    """
+
+    def __init__(self, batch_size=5000, checkpoint=None, report=None, report_interval=5.0):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.report = report
+        self.report_interval = report_interval
+        self.imported = Counter()
+        self.skipped = Counter()
+        self.duplicates = Counter()
+        self._batch = defaultdict(list)
+        self._user_lines = []
+
+    def run(self, records, source):
+        source = os.path.abspath(source)
+        resume_after = self._load_checkpoint(source)
+        self._started = self._reported = time.perf_counter()
+        position = resume_after
+        with relaxed_sqlite_pragmas(), imported_timestamps():
+            for position, record in records:
+                if position <= resume_after:
+                    continue
+                self._add(position, record)
+                if sum(len(rows) for rows in self._batch.values()) >= self.batch_size:
+                    self._flush(source, position)
+            self._flush(source, position)
+        self._reset_sequences()
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self._report(final=True)
+
+    def _add(self, position, record):
+        record_type = record.get("type")
+        if record_type not in MODELS:
+            raise ImportDataError(f"line {position}: unknown record type {record_type!r}")
+        values = {}
+        for field in RECORDS[record_type]:
+            value = record.get(field)
+            if value in (None, "") and field in OPTIONAL:
+                value = OPTIONAL[field]()
+            elif value is None:
+                raise ImportDataError(f"line {position}: {record_type} record is missing {field!r}")
+            elif field == "id" or field.endswith("_id"):
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ImportDataError(f"line {position}: {field} is not an integer: {value!r}")
+            values[field] = value
+        if record_type == "user":
+            values["password"] = record.get("password") or make_password(None)
+            self._user_lines.append(position)
+        self._batch[record_type].append(MODELS[record_type](**values))
+
+    def _flush(self, source, position):
+        if not self._batch:
+            return
+        with transaction.atomic():
+            self._check_user_conflicts(self._batch.get("user", []))
+            for record_type in ORDER:
+                objs = self._without_missing_references(record_type, self._batch.get(record_type, []))
+                inserted = InsertedRows()
+                with connection.execute_wrapper(inserted):
+                    MODELS[record_type].objects.bulk_create(objs, batch_size=self.batch_size, ignore_conflicts=True)
+                self.imported[record_type] += inserted.count
+                self.duplicates[record_type] += len(objs) - inserted.count
+        self._batch.clear()
+        self._user_lines.clear()
+        self._save_checkpoint(source, position)
+        if time.perf_counter() - self._reported >= self.report_interval:
+            self._report()
+
+    def _check_user_conflicts(self, users):
+        # A row matching an existing user on both id and username is one a
+        # previous run imported, and is left to ignore_conflicts.
+        if not users:
+            return
+        existing = User.objects.filter(
+            Q(pk__in=[user.pk for user in users]) | Q(username__in=[user.username for user in users])
+        ).values_list("pk", "username")
+        by_id = dict(existing)
+        by_username = {username: pk for pk, username in by_id.items()}
+        conflicts = []
+        for line, user in zip(self._user_lines, users):
+            username = by_id.setdefault(user.pk, user.username)
+            pk = by_username.setdefault(user.username, user.pk)
+            if username != user.username:
+                pk = user.pk
+            elif pk != user.pk:
+                username = user.username
+            else:
+                continue
+            conflicts.append(f"line {line}: user {user.pk} {user.username!r} conflicts with user {pk} {username!r}")
+        if conflicts:
+            more = f" and {len(conflicts) - 5} more" if len(conflicts) > 5 else ""
+            raise ImportDataError("; ".join(conflicts[:5]) + more)
+
+    def _without_missing_references(self, record_type, objs):
+        # Foreign keys are only checked at commit, which would fail the
+        # whole batch, so rows pointing at nothing are dropped up front.
+        for field, model in REFERENCES.get(record_type, {}).items():
+            if not objs:
+                break
+            ids = {getattr(obj, field) for obj in objs}
+            existing = set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+            kept = [obj for obj in objs if getattr(obj, field) in existing]
+            self.skipped[record_type] += len(objs) - len(kept)
+            objs = kept
+        return objs
+
+    def _reset_sequences(self):
+        # Rows keep their source ids, so new rows must start after them.
+        statements = connection.ops.sequence_reset_sql(no_style(), list(MODELS.values()))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _load_checkpoint(self, source):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if state["source"] != source:
+            raise ImportDataError(f"checkpoint {self.checkpoint} belongs to {state['source']}")
+        return state["position"]
+
+    def _save_checkpoint(self, source, position):
+        if not self.checkpoint:
+            return
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": source, "position": position}, f)
+        os.replace(tmp, self.checkpoint)
+
+    def _report(self, final=False):
+        self._reported = time.perf_counter()
+        if self.report is None:
+            return
+        rows = sum(self.imported.values())
+        elapsed = self._reported - self._started
+        rate = rows / elapsed if elapsed else 0
+        counts = ", ".join(f"{record_type} {self.imported[record_type]}" for record_type in ORDER)
+        message = f"{rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s): {counts}"
+        skipped = +self.skipped
+        if final and skipped:
+            skipped = ", ".join(f"{record_type} {count}" for record_type, count in skipped.items())
+            message += f"; skipped for missing references: {skipped}"
+        duplicates = +self.duplicates
+        if final and duplicates:
+            duplicates = ", ".join(f"{record_type} {count}" for record_type, count in duplicates.items())
+            message += f"; already present: {duplicates}"
+        self.report(message)
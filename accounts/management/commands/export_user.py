@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.export import export_user
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = "Write a user's tweets, likes and follow edges as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+        parser.add_argument("--batch-size", type=int, help="Rows per query (default: EXPORT_BATCH_SIZE).")
+        parser.add_argument(
+            "--include-passwords", action="store_true", help="Include the password hash in the user record."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        lines = export_user(user, batch_size=options["batch_size"], include_password=options["include_passwords"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,37 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import ImportDataError, Importer, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load users, tweets, likes and follows from NDJSON (as written by export_user) or CSV, "
+        "then rebuild the derived counters, timelines and hashtag and mention indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["ndjson", "csv"], help="Default: guessed from the file extension.")
+        parser.add_argument("--type", choices=["user", "tweet", "like", "follow"], help="Record type of a CSV file.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--checkpoint", help="Progress file; run again with the same file to resume.")
+        parser.add_argument("--no-rebuild", action="store_true", help="Skip rebuilding the derived data.")
+
+    def handle(self, *args, **options):
+        importer = Importer(
+            batch_size=options["batch_size"],
+            checkpoint=options["checkpoint"],
+            report=self.stdout.write,
+        )
+        records = read_records(options["path"], format=options["format"], record_type=options["type"])
+        try:
+            importer.run(records, options["path"])
+        except ImportDataError as e:
+            raise CommandError(f"{options['path']}: {e}")
+        if not options["no_rebuild"]:
+            call_command("rebuild_like_counts", stdout=self.stdout)
+            call_command("rebuild_follow_counts", stdout=self.stdout)
+            call_command("rebuild_timelines", stdout=self.stdout)
+            call_command("rebuild_tags", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Imported {sum(importer.imported.values())} rows."))
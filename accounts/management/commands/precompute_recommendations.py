@@ -0,0 +1,45 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.graph import FollowGraph
+from accounts.models import User
+from accounts.recommendations import compute_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute who-to-follow recommendations for every user who logged in within "
+        "RECOMMENDATIONS['ACTIVE_DAYS'] and store them in the cache. Needs a cache "
+        "shared with the web server, such as Redis or Memcached."
+    )
+
+    def handle(self, *args, **options):
+        backend = caches["default"]
+        if isinstance(backend, (LocMemCache, DummyCache)):
+            raise CommandError(
+                f"The default cache ({type(backend).__name__}) is local to this process, so the web server "
+                "would never see the recommendations. Configure a shared cache first."
+            )
+        start = time.perf_counter()
+        graph = FollowGraph.load()
+        self.stdout.write(
+            f"Loaded {len(graph.following)} follows ({graph.nbytes() / 2**20:.1f} MiB) "
+            f"in {time.perf_counter() - start:.1f} s."
+        )
+        since = timezone.now() - datetime.timedelta(days=settings.RECOMMENDATIONS["ACTIVE_DAYS"])
+        computed = 0
+        for user_id in User.objects.filter(is_active=True, last_login__gte=since).values_list("pk", flat=True):
+            compute_recommendations(user_id, graph)
+            computed += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Computed recommendations for {computed} users in {time.perf_counter() - start:.1f} s."
+            )
+        )
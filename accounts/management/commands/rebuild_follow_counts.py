@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import FollowUser, User
+
+
+class Command(BaseCommand):
+    help = "Recompute User.follower_count and User.following_count from FollowUser."
+
+    def handle(self, *args, **options):
+        follower_count = (
+            FollowUser.objects.filter(following=OuterRef("pk"))
+            .values("following")
+            .annotate(total=Count("*"))
+            .values("total")
+        )
+        following_count = (
+            FollowUser.objects.filter(follower=OuterRef("pk"))
+            .values("follower")
+            .annotate(total=Count("*"))
+            .values("total")
+        )
+        updated = User.objects.update(
+            follower_count=Coalesce(Subquery(follower_count), 0),
+            following_count=Coalesce(Subquery(following_count), 0),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt follow counts for {updated} users."))
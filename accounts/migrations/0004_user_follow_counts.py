@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-16 23:28
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counts(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    FollowUser = apps.get_model("accounts", "FollowUser")
+    follower_count = (
+        FollowUser.objects.filter(following=models.OuterRef("pk"))
+        .values("following")
+        .annotate(total=models.Count("*"))
+        .values("total")
+    )
+    following_count = (
+        FollowUser.objects.filter(follower=models.OuterRef("pk"))
+        .values("follower")
+        .annotate(total=models.Count("*"))
+        .values("total")
+    )
+    User.objects.update(
+        follower_count=Coalesce(models.Subquery(follower_count), 0),
+        following_count=Coalesce(models.Subquery(following_count), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_followuser_unique_followuser"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="follower_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_user_follow_counts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="followuser",
+            index=models.Index(fields=["follower", "-created_at"], name="follow_follower_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="followuser",
+            index=models.Index(fields=["following", "-created_at"], name="follow_following_created_idx"),
+        ),
+    ]
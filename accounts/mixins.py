@@ -0,0 +1,12 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    async def dispatch(self, request, *args, **kwargs):
+        # Django 4.1 has no request.auser(), so loading the session-backed
+        # user is done off the event loop once; request.user is cached after.
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
@@ -4,6 +4,8 @@ from django.db import models
 
 class User(AbstractUser):
     email = models.EmailField()
+    follower_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
 
 
 class FollowUser(models.Model):
@@ -15,3 +17,7 @@ class FollowUser(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["follower", "following"], name="unique_FollowUser"),
         ]
+        indexes = [
+            models.Index(fields=["follower", "-created_at"], name="follow_follower_created_idx"),
+            models.Index(fields=["following", "-created_at"], name="follow_following_created_idx"),
+        ]
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .graph import FollowGraph
+
+logger = logging.getLogger(__name__)
+
+_graph = None
+_graph_loaded_at = 0.0
+_graph_reloading = False
+_graph_lock = threading.Lock()
+# Held only while the first copy loads, when there is nothing to serve yet.
+_graph_load_lock = threading.Lock()
+
+
+def recommendations_key(user_id):
+    return f"recommendations:{user_id}"
+
+
+def _load_graph():
+    global _graph, _graph_loaded_at, _graph_reloading
+    graph = FollowGraph.load()
+    with _graph_lock:
+        _graph, _graph_loaded_at, _graph_reloading = graph, time.monotonic(), False
+    return graph
+
+
+def _reload_graph():
+    global _graph_reloading
+    try:
+        _load_graph()
+    except Exception:
+        logger.exception("follow graph reload failed")
+        with _graph_lock:
+            _graph_reloading = False
+    finally:
+        connection.close()
+
+
+def follow_graph():
+    """
+    This process's copy of the follow graph. Once it is ``GRAPH_SECONDS`` old
+    a background thread loads a new one, and the old one is served until the
+    new one is ready; only the very first copy is loaded by a request.
+    """
+    global _graph_reloading
+    with _graph_lock:
+        graph = _graph
+        stale = (
+            graph is not None
+            and not _graph_reloading
+            and time.monotonic() - _graph_loaded_at > settings.RECOMMENDATIONS["GRAPH_SECONDS"]
+        )
+        if stale:
+            _graph_reloading = True
+    if stale:
+        threading.Thread(target=_reload_graph, name="follow-graph-reload", daemon=True).start()
+    if graph is not None:
+        return graph
+    with _graph_load_lock:
+        return _graph or _load_graph()
+
+
+def clear_follow_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+
+def compute_recommendations(user_id, graph=None):
+    options = settings.RECOMMENDATIONS
+    recommendations = (graph or follow_graph()).recommend(user_id, options["LIMIT"])
+    cache.set(recommendations_key(user_id), (time.time(), recommendations), options["CACHE_SECONDS"])
+    return recommendations
+
+
+def _refresh(user_id):
+    try:
+        compute_recommendations(user_id)
+    finally:
+        connection.close()
+
+
+def get_recommendations(user_id):
+    """
+    The cached ``(user_id, mutuals)`` recommendations of ``user_id``, computed
+    now if there are none. Entries older than ``REFRESH_SECONDS`` are still
+    served, while one background thread per user recomputes them.
+    """
+    options = settings.RECOMMENDATIONS
+    cached = cache.get(recommendations_key(user_id))
+    if cached is None:
+        return compute_recommendations(user_id)
+    computed_at, recommendations = cached
+    if time.time() - computed_at > options["REFRESH_SECONDS"] and cache.add(
+        f"recommendations_refreshing:{user_id}", True, options["REFRESH_SECONDS"]
+    ):
+        threading.Thread(target=_refresh, args=(user_id,), name="recommendations-refresh", daemon=True).start()
+    return recommendations
@@ -0,0 +1,97 @@
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from tweets.timeline import backfill_timeline, prune_timeline, refill_followers
+from tweets.versions import bump_follow_versions
+
+from .graph import follow_snapshot
+from .models import FollowUser, User
+
+# Both resolve the username in the same statement that changes the edge.
+# unique_FollowUser turns a repeated follow into a no-op, and RETURNING
+# only yields a row when the edge was actually added or removed.
+FOLLOW_SQL = """
+INSERT INTO accounts_followuser (follower_id, following_id, created_at)
+SELECT %s, id, %s FROM accounts_user WHERE username = %s AND id <> %s
+ON CONFLICT (follower_id, following_id) DO NOTHING
+RETURNING following_id
+"""
+UNFOLLOW_SQL = """
+DELETE FROM accounts_followuser
+WHERE follower_id = %s AND following_id = (SELECT id FROM accounts_user WHERE username = %s)
+RETURNING following_id
+"""
+
+
+def _change_follow_counts(follower_id, following_id, delta):
+    User.objects.filter(pk=follower_id).update(following_count=F("following_count") + delta)
+    User.objects.filter(pk=following_id).update(follower_count=F("follower_count") + delta)
+
+
+def _followed(follower, following):
+    backfill_timeline(follower, following)
+    bump_follow_versions([follower.pk, following.pk])
+    transaction.on_commit(partial(follow_snapshot.apply, follower.pk, following.pk, True))
+
+
+def _unfollowed(follower, following):
+    prune_timeline(follower, following)
+    refill_followers(following.pk)
+    bump_follow_versions([follower.pk, following.pk])
+    transaction.on_commit(partial(follow_snapshot.apply, follower.pk, following.pk, False))
+
+
+def follow_user(follower, following):
+    with transaction.atomic():
+        _, created = FollowUser.objects.get_or_create(follower=follower, following=following)
+        if created:
+            _change_follow_counts(follower.pk, following.pk, 1)
+            _followed(follower, following)
+    return created
+
+
+def unfollow_user(follower, following):
+    with transaction.atomic():
+        deleted, _ = FollowUser.objects.filter(follower=follower, following=following).delete()
+        if deleted:
+            _change_follow_counts(follower.pk, following.pk, -1)
+            _unfollowed(follower, following)
+    return bool(deleted)
+
+
+def set_following(follower, username, following):
+    """
+    Make ``follower`` follow (``following=True``) or unfollow the user called
+    ``username`` with one conditional INSERT or DELETE.
+
+    Returns ``(target, changed)`` where ``target`` is that user with their
+    follower count after the change, and sets ``follower.following_count``
+    to the follower's. ``target`` is None when there is no such user.
+    Following oneself changes nothing.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if following:
+                now = connection.ops.adapt_datetimefield_value(timezone.now())
+                cursor.execute(FOLLOW_SQL, [follower.pk, now, username, follower.pk])
+            else:
+                cursor.execute(UNFOLLOW_SQL, [follower.pk, username])
+            row = cursor.fetchone()
+        changed = row is not None
+        if changed:
+            _change_follow_counts(follower.pk, row[0], 1 if following else -1)
+        users = User.objects.filter(Q(pk=follower.pk) | Q(username=username)).only(
+            "username", "follower_count", "following_count"
+        )
+        target = None
+        for user in users:
+            if user.pk == follower.pk:
+                follower.following_count = user.following_count
+            if user.username == username:
+                target = user
+        if changed:
+            (_followed if following else _unfollowed)(follower, target)
+    return target, changed
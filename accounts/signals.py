@@ -0,0 +1,23 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+
+from tweets.versions import bump_follow_versions
+
+from .graph import follow_snapshot
+from .models import FollowUser, User
+
+
+def discount_follows_of_deleted_user(sender, instance, **kwargs):
+    # The user's FollowUser rows are about to be removed by the cascade.
+    user_ids = list(
+        FollowUser.objects.filter(follower=instance)
+        .values_list("following_id", flat=True)
+        .union(FollowUser.objects.filter(following=instance).values_list("follower_id", flat=True))
+    )
+    bump_follow_versions(user_ids)
+    # Their rows would only be loaded again; the user's own row, never.
+    transaction.on_commit(partial(follow_snapshot.forget, [instance.pk, *user_ids]))
+    User.objects.filter(following__follower=instance).update(follower_count=F("follower_count") - 1)
+    User.objects.filter(follower__following=instance).update(following_count=F("following_count") - 1)
@@ -1,11 +1,28 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from tweets.models import Tweet
+from perf.budgets import QueryBudgetTestCase
+from tweets.models import TimelineEntry, Tweet, TweetLike, TweetMention, TweetTag
+from tweets.versions import bump_follow_versions
 
+from .graph import FollowGraph, follow_snapshot
 from .models import FollowUser, User
+from .recommendations import clear_follow_graph, follow_graph, get_recommendations, recommendations_key
+from .services import follow_user, unfollow_user
 
 
 class TestSignupView(TestCase):
@@ -266,7 +283,7 @@ class TestUserProfileView(TestCase):
         self.user2 = User.objects.create_user(username="testuser2", email="test2@example.com", password="testpassword")
         self.url = reverse("accounts:user_profile", args=[self.user1.username])
         self.client.force_login(self.user1)
-        FollowUser.objects.create(following=self.user2, follower=self.user1)
+        follow_user(self.user1, self.user2)
 
     def test_success_get(self):
         Tweet.objects.create(user=self.user1, content="testcontent")
@@ -278,6 +295,72 @@ class TestUserProfileView(TestCase):
         self.assertEqual(response.context["following_count"], FollowUser.objects.filter(follower=self.user1).count())
         self.assertEqual(response.context["follower_count"], FollowUser.objects.filter(following=self.user1).count())
 
+    def test_is_following(self):
+        response = self.client.get(reverse("accounts:user_profile", args=[self.user2.username]))
+        self.assertIs(response.context["is_following"], True)
+        self.client.force_login(self.user2)
+        response = self.client.get(self.url)
+        self.assertIs(response.context["is_following"], False)
+
+    def test_usernames_of_other_pages(self):
+        for username in ["export", "recommendations", "-"]:
+            user = User.objects.create_user(username=username, password="testpassword")
+            with self.subTest(username=username):
+                response = self.client.get(reverse("accounts:user_profile", args=[username]))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["user"], user)
+
+
+class TestUserProfileConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweet = Tweet.objects.create(user=self.user2, content="testcontent")
+        self.url = reverse("accounts:user_profile", args=[self.user2.username])
+        # The first page sets the CSRF cookie, which is part of the ETag.
+        self.client.get(self.url)
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def tearDown(self):
+        cache.clear()
+
+    def get(self):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+
+    def test_not_modified(self):
+        # The session and user lookups, then the validator itself.
+        with self.assertNumQueries(3):
+            response = self.get()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+
+    def test_new_tweet(self):
+        Tweet.objects.create(user=self.user2, content="newer")
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_follow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            follow_user(self.user1, self.user2)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_unfollow_by_other_user(self):
+        follow_user(User.objects.create_user(username="testuser3"), self.user2)
+        self.etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            unfollow_user(User.objects.get(username="testuser3"), self.user2)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_like(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_unknown_user(self):
+        response = self.client.get(reverse("accounts:user_profile", args=["nobody"]), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+
 
 class TestUserProfileEditView(TestCase):
     def test_success_get(self):
@@ -309,6 +392,18 @@ class TestFollowView(TestCase):
             target_status_code=200,
         )
         self.assertEqual(FollowUser.objects.filter(follower=self.user1).count(), 1)
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.follower_count, 1)
+
+    def test_success_post_with_followed_user(self):
+        follow_user(self.user1, self.user2)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(FollowUser.objects.filter(follower=self.user1).count(), 1)
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.follower_count, 1)
 
     def test_failure_post_with_not_exist_user(self):
         response = self.client.post(reverse("accounts:follow", kwargs={"username": "user3"}))
@@ -326,7 +421,7 @@ class TestUnfollowView(TestCase):
         self.user1 = User.objects.create_user(username="testuser1", email="test1@example.com", password="testpassword")
         self.user2 = User.objects.create_user(username="testuser2", email="test2@example.com", password="testpassword")
         self.client.login(username="testuser1", password="testpassword")
-        FollowUser.objects.create(following=self.user2, follower=self.user1)
+        follow_user(self.user1, self.user2)
 
     def test_success_post(self):
         response = self.client.post(reverse("accounts:unfollow", kwargs={"username": "testuser2"}))
@@ -337,6 +432,10 @@ class TestUnfollowView(TestCase):
             target_status_code=200,
         )
         self.assertEqual(FollowUser.objects.filter(follower=self.user1).count(), 0)
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user2.follower_count, 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("accounts:unfollow", kwargs={"username": "user3"}))
@@ -373,3 +472,550 @@ class TestFollowerListView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context["follower_list"]), 1)
         self.assertEqual(response.context["follower_list"][0], self.FollowUser2)
+        self.assertTrue(response.context["follower_list"][0].viewer_follows)
+
+
+class TestFollowCount(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.user3 = User.objects.create_user(username="testuser3", password="testpassword")
+
+    def test_delete_user_discounts_follows(self):
+        follow_user(self.user1, self.user2)
+        follow_user(self.user2, self.user3)
+        self.user2.delete()
+        self.user1.refresh_from_db()
+        self.user3.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user3.follower_count, 0)
+
+    def test_rebuild_follow_counts(self):
+        FollowUser.objects.create(follower=self.user1, following=self.user2)
+        FollowUser.objects.create(follower=self.user3, following=self.user2)
+        call_command("rebuild_follow_counts", stdout=StringIO())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.follower_count, 2)
+
+
+class TestFollowApiView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+
+    def post(self, name, username="testuser2"):
+        return self.client.post(reverse(name, kwargs={"username": username}))
+
+    def test_follow_and_unfollow(self):
+        tweet = Tweet.objects.create(user=self.user2, content="testcontent")
+        for _ in range(2):
+            response = self.post("accounts:follow_api")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json(),
+                {
+                    "username": "testuser2",
+                    "is_following": True,
+                    "follower_count": 1,
+                    "following_count": 1,
+                    "url": reverse("accounts:unfollow_api", kwargs={"username": "testuser2"}),
+                },
+            )
+        self.assertTrue(FollowUser.objects.filter(follower=self.user1, following=self.user2).exists())
+        self.assertEqual(list(TimelineEntry.objects.values_list("owner", "tweet")), [(self.user1.pk, tweet.pk)])
+
+        for _ in range(2):
+            response = self.post("accounts:unfollow_api")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json(),
+                {
+                    "username": "testuser2",
+                    "is_following": False,
+                    "follower_count": 0,
+                    "following_count": 0,
+                    "url": reverse("accounts:follow_api", kwargs={"username": "testuser2"}),
+                },
+            )
+        self.assertFalse(FollowUser.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.user2.pk).follower_count, 0)
+
+    def test_follow_updates_snapshot(self):
+        follow_snapshot.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post("accounts:follow_api")
+        self.assertTrue(follow_snapshot.follows(self.user1.pk, self.user2.pk))
+
+    def test_failure_post_with_not_exist_user(self):
+        self.assertEqual(self.post("accounts:follow_api", "user3").status_code, 404)
+        self.assertEqual(self.post("accounts:unfollow_api", "user3").status_code, 404)
+
+    def test_failure_post_with_self(self):
+        self.assertEqual(self.post("accounts:follow_api", "testuser1").status_code, 400)
+        self.assertFalse(FollowUser.objects.exists())
+
+
+class TestAsyncFollowView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", email="test1@example.com", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", email="test2@example.com", password="testpassword")
+        self.async_client.force_login(self.user1)
+
+    async def test_success_post(self):
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "testuser2"}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse("tweets:home"))
+        self.assertTrue(await FollowUser.objects.filter(follower=self.user1, following=self.user2).aexists())
+
+        response = await self.async_client.post(reverse("accounts:unfollow_async", kwargs={"username": "testuser2"}))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await FollowUser.objects.aexists())
+        self.assertEqual(await User.objects.values_list("follower_count", flat=True).aget(pk=self.user2.pk), 0)
+
+    async def test_failure_post_with_not_exist_user(self):
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "user3"}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_failure_post_with_self(self):
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "testuser1"}))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await FollowUser.objects.aexists())
+
+
+class TestExportView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", email="test1@example.com", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweets = [Tweet.objects.create(user=self.user1, content=f"tweet{i}") for i in range(5)]
+        Tweet.objects.create(user=self.user2, content="other")
+        TweetLike.objects.create(tweet=self.tweets[0], user=self.user1)
+        TweetLike.objects.create(tweet=self.tweets[1], user=self.user2)
+        follow_user(self.user1, self.user2)
+        follow_user(self.user2, self.user1)
+        self.url = reverse("accounts:export")
+
+    def records(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = self.records(response)
+        self.assertEqual(records[0]["type"], "user")
+        self.assertEqual(records[0]["username"], "testuser1")
+        self.assertNotIn("password", records[0])
+        self.assertEqual([r["content"] for r in records if r["type"] == "tweet"], [t.content for t in self.tweets])
+        self.assertEqual(
+            [r for r in records if r["type"] == "like"],
+            [
+                {
+                    "type": "like",
+                    "tweet_id": self.tweets[0].pk,
+                    "user_id": self.user1.pk,
+                    "created_at": TweetLike.objects.get(user=self.user1).created_at.isoformat(),
+                }
+            ],
+        )
+        self.assertEqual(
+            [(r["follower_id"], r["following_id"]) for r in records if r["type"] == "follow"],
+            [(self.user1.pk, self.user2.pk), (self.user2.pk, self.user1.pk)],
+        )
+
+    def test_failure_get_with_anonymous_user(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f"{reverse(settings.LOGIN_URL)}?next={self.url}")
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export_user", "testuser1", "--batch-size", "3", "--include-passwords", stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[0]["password"], self.user1.password)
+        self.assertEqual(len([r for r in records if r["type"] == "tweet"]), 5)
+        self.assertEqual(len(records), 1 + 5 + 1 + 2)
+
+
+class TestImportData(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def ndjson(self, name, records):
+        return self.write(name, [json.dumps(record) for record in records])
+
+    def import_data(self, *args):
+        stdout = StringIO()
+        call_command("import_data", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_round_trip_with_export(self):
+        user1 = User.objects.create_user(username="testuser1", email="test1@example.com", password="testpassword")
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        tweet = Tweet.objects.create(user=user1, title="title", content="テスト")
+        TweetLike.objects.create(tweet=tweet, user=user1)
+        follow_user(user2, user1)
+        created_at = tweet.created_at
+        path = os.path.join(self.tmpdir.name, "export.ndjson")
+        call_command("export_user", "testuser1", "--output", path, "--include-passwords")
+        with open(path) as f:
+            lines = f.read().splitlines()
+        # The follower's own record is not part of testuser1's export.
+        lines.insert(1, json.dumps({"type": "user", "id": user2.pk, "username": "testuser2"}))
+        path = self.write("import.ndjson", lines)
+        User.objects.all().delete()
+
+        self.import_data(path)
+
+        user1 = User.objects.get(username="testuser1")
+        self.assertTrue(user1.check_password("testpassword"))
+        self.assertFalse(User.objects.get(username="testuser2").has_usable_password())
+        tweet = Tweet.objects.get()
+        self.assertEqual((tweet.content, tweet.created_at, tweet.like_count), ("テスト", created_at, 1))
+        self.assertEqual((user1.follower_count, user1.following_count), (1, 0))
+        self.assertTrue(TimelineEntry.objects.filter(owner__username="testuser2", tweet=tweet).exists())
+        # Source ids are kept, and new rows are numbered after them.
+        self.assertGreater(Tweet.objects.create(user=user1, content="new").pk, tweet.pk)
+
+    def test_duplicates_and_missing_references_are_skipped(self):
+        path = self.ndjson(
+            "data.ndjson",
+            [
+                {"type": "user", "id": 1, "username": "a"},
+                {"type": "user", "id": 2, "username": "b"},
+                {"type": "follow", "follower_id": 1, "following_id": 2, "created_at": "2020-01-01T00:00:00Z"},
+                {"type": "follow", "follower_id": 1, "following_id": 2, "created_at": "2020-01-01T00:00:00Z"},
+                {"type": "follow", "follower_id": 1, "following_id": 99},
+                {"type": "tweet", "id": 10, "user_id": 2, "content": "hello"},
+                {"type": "like", "tweet_id": 10, "user_id": 1},
+                {"type": "like", "tweet_id": 10, "user_id": 1},
+                {"type": "like", "tweet_id": 11, "user_id": 1},
+            ],
+        )
+        output = self.import_data(path, "--batch-size", "2")
+        self.assertEqual(FollowUser.objects.count(), 1)
+        self.assertEqual(TweetLike.objects.count(), 1)
+        self.assertEqual(Tweet.objects.get().like_count, 1)
+        # Duplicates dropped by the database are not counted as imported.
+        self.assertIn("already present: like 1, follow 1", output)
+        self.assertIn("Imported 5 rows.", output)
+
+    def test_tags_and_mentions_are_rebuilt(self):
+        path = self.ndjson(
+            "data.ndjson",
+            [
+                {"type": "user", "id": 1, "username": "a"},
+                {"type": "tweet", "id": 10, "user_id": 1, "content": "#django by @a"},
+            ],
+        )
+        self.import_data(path)
+        self.assertEqual(list(TweetTag.objects.values_list("tweet_id", "tag")), [(10, "django")])
+        self.assertEqual(list(TweetMention.objects.values_list("tweet_id", "user_id")), [(10, 1)])
+
+    def test_failure_with_conflicting_user(self):
+        existing = User.objects.create_user(username="testuser1")
+        for record in (
+            {"type": "user", "id": existing.pk, "username": "other"},
+            {"type": "user", "id": existing.pk + 1, "username": "testuser1"},
+        ):
+            with self.subTest(record=record):
+                path = self.ndjson(
+                    "data.ndjson", [record, {"type": "tweet", "id": 10, "user_id": record["id"], "content": "hello"}]
+                )
+                with self.assertRaisesMessage(CommandError, "line 1: user"):
+                    self.import_data(path)
+                self.assertFalse(Tweet.objects.exists())
+                self.assertEqual(User.objects.get(), existing)
+
+    def test_reimport_is_not_a_conflict(self):
+        path = self.ndjson("users.ndjson", [{"type": "user", "id": 1, "username": "a"}])
+        self.import_data(path, "--no-rebuild")
+        self.assertIn("already present: user 1", self.import_data(path, "--no-rebuild"))
+
+    def test_csv(self):
+        User.objects.create_user(username="testuser1")
+        path = self.write("tweets.csv", ["id,user_id,title,content,created_at", "5,1,,csv tweet,2020-01-01 09:00:00"])
+        self.import_data(path, "--type", "tweet")
+        tweet = Tweet.objects.get()
+        self.assertEqual((tweet.pk, tweet.title, tweet.content, tweet.created_at.year), (5, None, "csv tweet", 2020))
+
+    def test_resume_from_checkpoint(self):
+        path = self.ndjson("users.ndjson", [{"type": "user", "id": i, "username": f"user{i}"} for i in range(1, 5)])
+        checkpoint = os.path.join(self.tmpdir.name, "checkpoint.json")
+        with open(checkpoint, "w") as f:
+            json.dump({"source": path, "position": 2}, f)
+        self.import_data(path, "--checkpoint", checkpoint, "--no-rebuild")
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["user3", "user4"])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_failure_with_invalid_record(self):
+        path = self.ndjson("bad.ndjson", [{"type": "user", "id": 1, "username": "a"}, {"type": "tweet", "id": 1}])
+        checkpoint = os.path.join(self.tmpdir.name, "checkpoint.json")
+        with self.assertRaisesMessage(CommandError, "line 2: tweet record is missing 'user_id'"):
+            self.import_data(path, "--batch-size", "1", "--checkpoint", checkpoint)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)["position"], 1)
+
+
+class TestFollowSnapshot(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        follow_snapshot.clear()
+        self.a, self.b, self.c = (User.objects.create_user(username=name) for name in "abc")
+
+    def tearDown(self):
+        cache.clear()
+        follow_snapshot.clear()
+
+    def test_checks_hit_memory(self):
+        follow_user(self.a, self.b)
+        with self.assertNumQueries(1):
+            self.assertTrue(follow_snapshot.follows(self.a.pk, self.b.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_snapshot.follows(self.a.pk, self.b.pk))
+            self.assertFalse(follow_snapshot.follows(self.a.pk, self.c.pk))
+
+    def test_follows_apply_in_place(self):
+        follow_user(self.a, self.c)
+        follow_snapshot.following(self.a.pk)
+        follow_user(self.a, self.b)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(follow_snapshot.following(self.a.pk)), [self.b.pk, self.c.pk])
+        unfollow_user(self.a, self.c)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(follow_snapshot.following(self.a.pk)), [self.b.pk])
+
+    def test_other_writes_reload(self):
+        follow_snapshot.following(self.a.pk)
+        # As another process would: the edge and the version change, but not this snapshot.
+        FollowUser.objects.create(follower=self.a, following=self.b)
+        bump_follow_versions([self.a.pk])
+        with self.assertNumQueries(1):
+            self.assertTrue(follow_snapshot.follows(self.a.pk, self.b.pk))
+
+    def test_rows_read_in_transaction_are_not_kept(self):
+        with transaction.atomic():
+            follow_user(self.a, self.b)
+            self.assertTrue(follow_snapshot.follows(self.a.pk, self.b.pk))
+            transaction.set_rollback(True)
+        with self.assertNumQueries(1):
+            self.assertFalse(follow_snapshot.follows(self.a.pk, self.b.pk))
+
+    @override_settings(FOLLOW_SNAPSHOT={"MAX_ROWS": 2})
+    def test_least_recently_used_rows_are_evicted(self):
+        follow_snapshot.load([self.a.pk, self.b.pk])
+        follow_snapshot.following(self.a.pk)
+        follow_snapshot.load([self.c.pk])
+        with self.assertNumQueries(0):
+            follow_snapshot.following(self.a.pk)
+            follow_snapshot.following(self.c.pk)
+        with self.assertNumQueries(1):
+            follow_snapshot.following(self.b.pk)
+
+    def test_deleted_user_rows_are_dropped(self):
+        follow_user(self.a, self.b)
+        follow_user(self.c, self.b)
+        follow_snapshot.load([self.a.pk, self.b.pk, self.c.pk])
+        self.assertEqual(follow_snapshot.edges(), 2)
+        self.b.delete()
+        self.assertEqual(follow_snapshot.edges(), 0)
+
+    def test_nbytes(self):
+        follow_user(self.a, self.b)
+        follow_snapshot.load([self.a.pk, self.b.pk])
+        self.assertEqual(follow_snapshot.edges(), 1)
+        self.assertGreater(follow_snapshot.nbytes(), 0)
+
+
+class TestRecommendations(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_follow_graph()
+        self.users = {name: User.objects.create_user(username=name, password="testpassword") for name in "abcdefg"}
+        self.follow("a", "b", "c")
+        self.follow("b", "d", "e")
+        self.follow("c", "d", "f")
+        self.follow("e", "g")
+        self.follow("f", "g")
+        self.client.force_login(self.users["a"])
+
+    def tearDown(self):
+        cache.clear()
+        clear_follow_graph()
+
+    def follow(self, name, *names):
+        FollowUser.objects.bulk_create(
+            FollowUser(follower=self.users[name], following=self.users[other]) for other in names
+        )
+
+    def ids(self, *names):
+        return [self.users[name].pk for name in names]
+
+    def test_graph(self):
+        graph = FollowGraph.load()
+        self.assertEqual(list(graph.users), self.ids("a", "b", "c", "e", "f"))
+        self.assertEqual(list(graph.following_of(self.users["c"].pk)), self.ids("d", "f"))
+        self.assertEqual(list(graph.following_of(self.users["d"].pk)), [])
+        self.assertEqual(graph.nbytes(), 8 * (5 + 6 + 8))
+
+    def test_recommend(self):
+        graph = FollowGraph.load()
+        a, b, c, d, e, f, g = self.ids(*"abcdefg")
+        # Both accounts a follows follow d; e and f are tied on mutuals and
+        # followers, so the lower id wins.
+        self.assertEqual(graph.recommend(a, 3), [(d, 2), (e, 1), (f, 1)])
+        # g follows nobody, so the most followed accounts fill in.
+        self.assertEqual(graph.recommend(g, 3), [(d, 0), (b, 0), (c, 0)])
+
+    def test_cached(self):
+        self.assertEqual(get_recommendations(self.users["a"].pk)[0], (self.users["d"].pk, 2))
+        self.follow("a", "d")
+        clear_follow_graph()
+        self.assertEqual(get_recommendations(self.users["a"].pk)[0], (self.users["d"].pk, 2))
+
+    def test_stale_entries_refresh_in_background(self):
+        user_id = self.users["a"].pk
+        cache.set(recommendations_key(user_id), (time.time() - 2 * 3600, [(self.users["g"].pk, 0)]))
+        with mock.patch("accounts.recommendations.threading.Thread") as thread:
+            self.assertEqual(get_recommendations(user_id), [(self.users["g"].pk, 0)])
+            get_recommendations(user_id)
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+        thread.call_args.kwargs["target"](*thread.call_args.kwargs["args"])
+        self.assertEqual(get_recommendations(user_id)[0], (self.users["d"].pk, 2))
+
+    def test_view(self):
+        response = self.client.get(reverse("accounts:recommendations"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user.username for user in response.context["recommendations"]], ["d", "e", "f", "g"])
+        self.assertEqual(response.context["recommendations"][0].mutuals, 2)
+        follow_user(self.users["a"], self.users["d"])
+        response = self.client.get(reverse("accounts:recommendations"))
+        self.assertEqual([user.username for user in response.context["recommendations"]], ["e", "f", "g"])
+
+    def test_graph_reloads_in_background(self):
+        graph = follow_graph()
+        self.follow("a", "d")
+        later = time.monotonic() + 601
+        with mock.patch("accounts.recommendations.time.monotonic", return_value=later), mock.patch(
+            "accounts.recommendations.threading.Thread"
+        ) as thread:
+            # The old copy is served while the new one loads.
+            self.assertIs(follow_graph(), graph)
+            self.assertIs(follow_graph(), graph)
+        thread.assert_called_once()
+        thread.call_args.kwargs["target"]()
+        self.assertEqual(list(follow_graph().following_of(self.users["a"].pk)), self.ids("b", "c", "d"))
+
+    def test_precompute(self):
+        User.objects.filter(username="a").update(last_login=timezone.now())
+        User.objects.filter(username="b").update(last_login=timezone.now() - datetime.timedelta(days=31))
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {
+                "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory}
+            }
+            with override_settings(CACHES=shared):
+                call_command("precompute_recommendations", stdout=StringIO())
+                self.assertIsNotNone(cache.get(recommendations_key(self.users["a"].pk)))
+                self.assertIsNone(cache.get(recommendations_key(self.users["b"].pk)))
+
+    def test_precompute_needs_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, "LocMemCache"):
+            call_command("precompute_recommendations", stdout=StringIO())
+
+
+class TestQueryBudget(QueryBudgetTestCase):
+    def new_user(self):
+        return User.objects.create_user(username=f"new{User.objects.count()}")
+
+    def followed_user(self):
+        user = self.new_user()
+        follow_user(self.viewer, user)
+        return user
+
+    def post(self, name, user):
+        return self.client.post(reverse(name, kwargs={"username": user.username}))
+
+    def test_signup(self):
+        def request(username):
+            data = {
+                "username": username,
+                "email": "new@example.com",
+                "password1": "b3nchmark!",
+                "password2": "b3nchmark!",
+            }
+            return self.client.post(reverse("accounts:signup"), data)
+
+        self.assertQueryBudget(11, request, prepare=lambda: f"new{User.objects.count()}")
+
+    def test_login(self):
+        data = {"username": "viewer", "password": "testpassword"}
+        self.assertQueryBudget(6, lambda: self.client.post(reverse("accounts:login"), data))
+
+    def test_logout(self):
+        self.assertQueryBudget(
+            4,
+            lambda _: self.client.post(reverse("accounts:logout")),
+            prepare=lambda: self.client.force_login(self.viewer),
+        )
+
+    def test_export(self):
+        self.assertQueryBudget(7, lambda: self.client.get(reverse("accounts:export")))
+
+    def test_user_profile(self):
+        self.assertQueryBudget(
+            6, lambda: self.client.get(reverse("accounts:user_profile", args=[self.author.username]))
+        )
+
+    def test_follow(self):
+        self.assertQueryBudget(12, lambda user: self.post("accounts:follow", user), prepare=self.new_user)
+
+    def test_unfollow(self):
+        self.assertQueryBudget(10, lambda user: self.post("accounts:unfollow", user), prepare=self.followed_user)
+
+    def test_follow_api(self):
+        self.assertQueryBudget(9, lambda user: self.post("accounts:follow_api", user), prepare=self.new_user)
+
+    def test_unfollow_api(self):
+        self.assertQueryBudget(10, lambda user: self.post("accounts:unfollow_api", user), prepare=self.followed_user)
+
+    def test_follow_async(self):
+        self.assertQueryBudget(12, lambda user: self.post("accounts:follow_async", user), prepare=self.new_user)
+
+    def test_unfollow_async(self):
+        self.assertQueryBudget(10, lambda user: self.post("accounts:unfollow_async", user), prepare=self.followed_user)
+
+    def test_recommendations(self):
+        def prepare():
+            cache.clear()
+            clear_follow_graph()
+
+        self.assertQueryBudget(4, lambda _: self.client.get(reverse("accounts:recommendations")), prepare=prepare)
+
+    # The lists mark the accounts the viewer follows from the follow snapshot,
+    # which keeps no rows read inside the test's transaction, so its load is
+    # counted here and not in production.
+    def test_following_list(self):
+        self.assertQueryBudget(
+            5,
+            lambda: self.client.get(reverse("accounts:following_list", args=[self.viewer.username])),
+        )
+
+    def test_follower_list(self):
+        self.assertQueryBudget(
+            5,
+            lambda: self.client.get(reverse("accounts:follower_list", args=[self.author.username])),
+        )
@@ -9,9 +9,17 @@ urlpatterns = [
     path("signup/", views.SignUpView.as_view(), name="signup"),
     path("login/", views.LoginView.as_view(), name="login"),
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
+    # "-" is not a path segment any username route has below it, so these
+    # cannot shadow a profile.
+    path("-/export/", views.ExportView.as_view(), name="export"),
+    path("-/recommendations/", views.RecommendationsView.as_view(), name="recommendations"),
     path("<str:username>/", views.UserProfileView.as_view(), name="user_profile"),
     path("<str:username>/follow/", views.FollowView.as_view(), name="follow"),
     path("<str:username>/unfollow/", views.UnFollowView.as_view(), name="unfollow"),
+    path("<str:username>/follow/api/", views.FollowApiView.as_view(), name="follow_api"),
+    path("<str:username>/unfollow/api/", views.UnFollowApiView.as_view(), name="unfollow_api"),
+    path("<str:username>/follow/async/", views.AsyncFollowView.as_view(), name="follow_async"),
+    path("<str:username>/unfollow/async/", views.AsyncUnFollowView.as_view(), name="unfollow_async"),
     path("<str:username>/following_list/", views.FollowingListView.as_view(), name="following_list"),
     path("<str:username>/follower_list/", views.FollowerListView.as_view(), name="follower_list"),
 ]
@@ -1,17 +1,28 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseBadRequest
+from django.db.models import OuterRef, Subquery
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, ListView, RedirectView
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import CreateView, ListView, RedirectView, View
 
-from tweets.models import Tweet, TweetLike
+from tweets.models import Tweet
+from tweets.pagination import KeysetPaginationMixin
+from tweets.versions import TWEET_DELETES_KEY, get_versions, make_etag, user_follows_key, user_likes_key
 
+from .export import export_user
 from .forms import SignUpForm
-from .models import FollowUser, User
+from .graph import contains, follow_snapshot
+from .mixins import AsyncLoginRequiredMixin
+from .models import User
+from .recommendations import get_recommendations
+from .services import follow_user, set_following, unfollow_user
 
 
 class SignUpView(CreateView):
@@ -36,35 +47,60 @@ class LogoutView(auth_views.LogoutView):
     pass
 
 
-class UserProfileView(LoginRequiredMixin, ListView):
+def user_profile_etag(request, username):
+    latest_tweet = Tweet.objects.filter(user=OuterRef("pk")).order_by("-created_at").values("created_at")[:1]
+    row = User.objects.filter(username=username).values_list("pk", Subquery(latest_tweet)).first()
+    if row is None:
+        return None
+    user_id, latest = row
+    return make_etag(
+        request.user.pk,
+        request.META.get("CSRF_COOKIE"),
+        user_id,
+        latest,
+        get_versions([user_likes_key(user_id), user_follows_key(user_id), TWEET_DELETES_KEY]),
+    )
+
+
+@method_decorator(condition(etag_func=user_profile_etag), name="get")
+class UserProfileView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Tweet
     template_name = "accounts/profile.html"
     slug_field = "username"
     slug_url_kwarg = "username"
     context_object_name = "tweets"
+    paginate_by = 20
 
     def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
         self.user = user
         return (
-            Tweet.objects.select_related("user")
-            .prefetch_related("liked_tweet")
-            .filter(user__username=self.kwargs.get("username"))
-            .order_by("-created_at")
+            Tweet.objects.select_related("user").with_like_count().with_liked_by(self.request.user).filter(user=user)
         )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["user"] = self.user
-        context["is_following"] = FollowUser.objects.filter(follower=self.request.user, following=self.user)
-        context["following_count"] = FollowUser.objects.filter(follower=self.user).count()
-        context["follower_count"] = FollowUser.objects.filter(following=self.user).count()
-        context["liked_list"] = (
-            TweetLike.objects.prefetch_related("tweet").filter(user=self.request.user).values_list("tweet", flat=True)
-        )
+        context["is_following"] = follow_snapshot.follows(self.request.user.pk, self.user.pk)
+        context["following_count"] = self.user.following_count
+        context["follower_count"] = self.user.follower_count
         return context
 
 
+class RecommendationsView(LoginRequiredMixin, ListView):
+    template_name = "accounts/recommendations.html"
+    context_object_name = "recommendations"
+
+    def get_queryset(self):
+        mutuals = dict(get_recommendations(self.request.user.pk))
+        # The cached list may predate follows made since, so those are dropped here.
+        users = User.objects.filter(pk__in=mutuals).exclude(following__follower=self.request.user).in_bulk()
+        recommendations = [users[user_id] for user_id in mutuals if user_id in users]
+        for user in recommendations:
+            user.mutuals = mutuals[user.pk]
+        return recommendations
+
+
 class FollowView(LoginRequiredMixin, RedirectView):
     url = reverse_lazy("tweets:home")
 
@@ -73,11 +109,10 @@ class FollowView(LoginRequiredMixin, RedirectView):
         if target_user == self.request.user:
             messages.add_message(request, messages.ERROR, "自分自身をフォローすることはできません。")
             return HttpResponseBadRequest("you cannnot follow yourself.")
-        if self.request.user.following.filter(following__username=target_user.username).exists():
-            messages.add_message(request, messages.INFO, "既にフォローしています。")
-        else:
-            FollowUser.objects.create(follower=request.user, following=target_user)
+        if follow_user(request.user, target_user):
             messages.add_message(request, messages.SUCCESS, "フォローしました。")
+        else:
+            messages.add_message(request, messages.INFO, "既にフォローしています。")
         return super().post(request, *args, **kwargs)
 
 
@@ -89,15 +124,79 @@ class UnFollowView(LoginRequiredMixin, RedirectView):
         if target_user == self.request.user:
             messages.add_message(request, messages.ERROR, "自分自身はフォローできません")
             return HttpResponseBadRequest("you cannnot unfollow yourself.")
-        if FollowUser.objects.filter(following=target_user).filter(follower=self.request.user).exists():
-            target_follower = get_object_or_404(FollowUser, following=target_user, follower=self.request.user)
-            target_follower.delete()
+        if unfollow_user(request.user, target_user):
             messages.add_message(request, messages.SUCCESS, "フォロー解除しました。")
         else:
             messages.add_message(request, messages.INFO, "フォローしていないユーザーです")
         return super().post(request, *args, **kwargs)
 
 
+class FollowApiView(LoginRequiredMixin, View):
+    following = True
+
+    def post(self, request, *args, **kwargs):
+        username = self.kwargs["username"]
+        if username == request.user.username:
+            return HttpResponseBadRequest("you cannnot follow yourself.")
+        target_user, _ = set_following(request.user, username, self.following)
+        if target_user is None:
+            raise Http404
+        next_url = "accounts:unfollow_api" if self.following else "accounts:follow_api"
+        context = {
+            "username": username,
+            "is_following": self.following,
+            "follower_count": target_user.follower_count,
+            "following_count": request.user.following_count,
+            "url": reverse(next_url, kwargs={"username": username}),
+        }
+        return JsonResponse(context)
+
+
+class UnFollowApiView(FollowApiView):
+    following = False
+
+
+class AsyncFollowView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        try:
+            target_user = await User.objects.aget(username=self.kwargs["username"])
+        except User.DoesNotExist:
+            raise Http404
+        if target_user == request.user:
+            messages.add_message(request, messages.ERROR, "自分自身をフォローすることはできません。")
+            return HttpResponseBadRequest("you cannnot follow yourself.")
+        # Counters and timeline backfill must commit with the edge, which needs
+        # transaction.atomic(), so follow_user runs in one thread hop.
+        if await sync_to_async(follow_user)(request.user, target_user):
+            messages.add_message(request, messages.SUCCESS, "フォローしました。")
+        else:
+            messages.add_message(request, messages.INFO, "既にフォローしています。")
+        return HttpResponseRedirect(reverse_lazy("tweets:home"))
+
+
+class AsyncUnFollowView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        try:
+            target_user = await User.objects.aget(username=self.kwargs["username"])
+        except User.DoesNotExist:
+            raise Http404
+        if target_user == request.user:
+            messages.add_message(request, messages.ERROR, "自分自身はフォローできません")
+            return HttpResponseBadRequest("you cannnot unfollow yourself.")
+        if await sync_to_async(unfollow_user)(request.user, target_user):
+            messages.add_message(request, messages.SUCCESS, "フォロー解除しました。")
+        else:
+            messages.add_message(request, messages.INFO, "フォローしていないユーザーです")
+        return HttpResponseRedirect(reverse_lazy("tweets:home"))
+
+
+class ExportView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(export_user(request.user), content_type="application/x-ndjson")
+        response["Content-Disposition"] = f'attachment; filename="{request.user.username}.ndjson"'
+        return response
+
+
 class FollowingListView(LoginRequiredMixin, ListView):
     template_name = "accounts/followingList.html"
     context_object_name = "following_list"
@@ -113,6 +212,9 @@ class FollowingListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["user"] = self.user
+        following = follow_snapshot.following(self.request.user.pk)
+        for follow in context["following_list"]:
+            follow.viewer_follows = contains(following, follow.following_id)
         return context
 
 
@@ -131,4 +233,7 @@ class FollowerListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["user"] = self.user
+        following = follow_snapshot.following(self.request.user.pk)
+        for follow in context["follower_list"]:
+            follow.viewer_follows = contains(following, follow.follower_id)
         return context
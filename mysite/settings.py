@@ -39,9 +39,12 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "perf.apps.PerfConfig",
 ]
 
 MIDDLEWARE = [
+    "perf.middleware.ServerTimingMiddleware",
+    "perf.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -75,13 +78,26 @@ WSGI_APPLICATION = "mysite.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# perf.sqlite3 is the stock SQLite backend with WAL, tuned pragmas and
+# BEGIN IMMEDIATE transactions; see perf/sqlite3/base.py.
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "perf.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
 
+# Reads of list and detail pages go to a random alias from ALIASES (see
+# perf/routers.py); add the replicas to DATABASES and list them here. A user
+# who wrote something, and any page whose ETag versions changed, reads from the
+# primary for PIN_SECONDS afterwards, which should cover the replication lag.
+# Both are tracked in the cache, which must be shared between processes.
+DATABASE_ROUTERS = ["perf.routers.ReplicaRouter"]
+READ_REPLICAS = {
+    "ALIASES": [],
+    "PIN_SECONDS": 5,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -128,6 +144,103 @@ LOGIN_URL = "accounts:login"
 LOGIN_REDIRECT_URL = "tweets:home"
 LOGOUT_REDIRECT_URL = "accounts:login"
 
+# Tweets whose like count reaches the threshold record further likes in
+# TWEET_LIKE_SHARD_SLOTS counter rows instead of the Tweet row itself.
+TWEET_LIKE_SHARD_THRESHOLD = 1000
+TWEET_LIKE_SHARD_SLOTS = 16
+LIKE_BATCH_MAX_OPS = 100
+
+# Optional write-behind mode for LikeView/UnlikeView: intents are buffered in
+# memory and written in bulk every FLUSH_INTERVAL_MS or once MAX_EVENTS are
+# queued. Set JOURNAL to a file path to survive crashes; each process writes
+# JOURNAL.<pid> next to it (see LikeBuffer). Past MAX_PENDING queued pairs,
+# likes are written directly.
+LIKE_WRITE_BEHIND = {
+    "ENABLED": False,
+    "FLUSH_INTERVAL_MS": 200,
+    "MAX_EVENTS": 500,
+    "MAX_PENDING": 10000,
+    "JOURNAL": None,
+    "JOURNAL_FSYNC": False,
+}
+
+# Rows fetched per query by the NDJSON export (accounts/export.py).
+EXPORT_BATCH_SIZE = 2000
+
+# Home timelines are materialized per user: new tweets are pushed to every
+# follower in batches, and following someone copies in their latest tweets.
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 50
+# Authors with more followers than this are not fanned out; their tweets are
+# merged into each timeline at read time instead. None disables the merge.
+TIMELINE_FANOUT_THRESHOLD = 10000
+
+# Rendered tweet cards are kept in the fragment cache (see tweets/cards.py),
+# and the ETag versions in tweets/versions.py live here too. Those must be seen
+# by every process, so use a shared backend such as Redis or Memcached when
+# running more than one.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+# Hashtag uses are counted per BUCKET_SECONDS bucket as tweets are written
+# (tweets/tags.py). Trending ranks the LIMIT most used tags over the last
+# WINDOW_BUCKETS buckets and is cached for CACHE_SECONDS.
+TRENDING = {
+    "BUCKET_SECONDS": 300,
+    "WINDOW_BUCKETS": 12,
+    "LIMIT": 10,
+    "CACHE_SECONDS": 30,
+}
+
+# The popular feed ranks tweets created in the last WINDOW_HOURS by their likes,
+# each worth half as much every HALF_LIFE_HOURS (tweets/popular.py). Likes
+# update the scores as they happen; manage.py rescore_popular recomputes them
+# and keeps the MAX_TWEETS best, and should run periodically.
+POPULAR = {
+    "HALF_LIFE_HOURS": 6,
+    "WINDOW_HOURS": 72,
+    "MAX_TWEETS": 1000,
+}
+
+# Each process keeps whom recently active users follow in memory for follow
+# checks (accounts/graph.py), roughly 64 bytes per follow. Rows of at most
+# MAX_ROWS users are kept, dropping the least recently used first.
+FOLLOW_SNAPSHOT = {
+    "MAX_ROWS": 100000,
+}
+
+# Who-to-follow suggestions (accounts/recommendations.py) come from an
+# in-memory copy of the follow graph, reloaded in the background every
+# GRAPH_SECONDS, and are cached per user for CACHE_SECONDS. Entries older than
+# REFRESH_SECONDS are served while a background thread recomputes them.
+# manage.py precompute_recommendations fills the cache for the users who
+# logged in within ACTIVE_DAYS; it needs a cache shared with the web server,
+# not the LocMemCache configured in CACHES above.
+RECOMMENDATIONS = {
+    "LIMIT": 10,
+    "GRAPH_SECONDS": 600,
+    "CACHE_SECONDS": 86400,
+    "REFRESH_SECONDS": 3600,
+    "ACTIVE_DAYS": 30,
+}
+
+# Per-request query count, DB, view and template time (perf/middleware.py).
+# SAMPLE_RATE of the requests get a Server-Timing header and an INFO log line;
+# requests slower than SLOW_REQUEST_MS or running more than MAX_QUERIES queries
+# are logged as WARNING whether sampled or not. Off by default: the header
+# exposes timings to clients, so turn it on per deployment (perf/tests.py
+# enables it for its own tests) and keep SAMPLE_RATE low in production.
+SERVER_TIMING = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.01,
+    "SLOW_REQUEST_MS": 500,
+    "MAX_QUERIES": 50,
+}
+
 SQL_DEBUG = False
 
 if SQL_DEBUG:
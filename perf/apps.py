@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def install_query_timer(sender, connection, **kwargs):
+    from .middleware import time_queries
+
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class PerfConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "perf"
+
+    def ready(self):
+        connection_created.connect(install_query_timer)
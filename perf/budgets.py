@@ -0,0 +1,104 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import FollowUser, User
+from tweets.models import TimelineEntry, Tweet, TweetLike
+
+from .plans import plan_problems
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Declares how many queries a view may run, and that the number stays the
+    same as the data behind the page grows.
+
+    ``assertQueryBudget()`` grows the network with ``grow()`` to each of
+    ``scales`` (the author's tweets, the viewer's follows, the author's
+    followers and the likes on the author's tweets all reach that size),
+    sends the request at every scale and fails if any run goes over the
+    budget or if the count changes between scales, which is how an N+1
+    query shows up long before it reaches the budget. The queries of the
+    largest scale also go through ``assertQueryPlans()``.
+    """
+
+    scales = (1, 10, 1000)
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user(username="viewer", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.others = []
+        self.client.force_login(self.viewer)
+
+    def tearDown(self):
+        cache.clear()
+
+    def grow(self, n):
+        """Add rows until each kind of relation around the viewer and the author has ``n`` of them."""
+        start = len(self.others)
+        others = User.objects.bulk_create(User(username=f"other{i}") for i in range(start, n))
+        self.others += others
+        tweets = Tweet.objects.bulk_create(
+            Tweet(user=self.author, title=f"title {i}", content=f"tweet {i}") for i in range(start, n)
+        )
+        FollowUser.objects.bulk_create(
+            [FollowUser(follower=self.viewer, following=user) for user in others]
+            + [FollowUser(follower=user, following=self.author) for user in others]
+        )
+        if start == 0:
+            FollowUser.objects.create(follower=self.viewer, following=self.author)
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=self.viewer, tweet=tweet, author=self.author, created_at=tweet.created_at)
+            for tweet in tweets
+        )
+        TweetLike.objects.bulk_create(
+            [TweetLike(tweet=tweet, user=self.viewer) for tweet in tweets]
+            + [TweetLike(tweet=self.latest_tweet(), user=user) for user in others]
+        )
+        call_command("rebuild_like_counts", stdout=StringIO())
+        call_command("rebuild_follow_counts", stdout=StringIO())
+        for user in (self.viewer, self.author):
+            user.refresh_from_db()
+
+    def latest_tweet(self):
+        return Tweet.objects.filter(user=self.author).order_by("-created_at", "-id").first()
+
+    def assertQueryBudget(self, budget, request, prepare=None):
+        """
+        Call ``request()`` at every scale, or ``request(prepare())`` when the
+        request needs a fresh object each time (``prepare`` is not counted).
+        """
+        counts = {}
+        for n in self.scales:
+            self.grow(n)
+            args = () if prepare is None else (prepare(),)
+            with CaptureQueriesContext(connection) as captured:
+                response = request(*args)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertLess(response.status_code, 400, f"at scale {n}")
+            counts[n] = len(captured)
+            self.assertLessEqual(
+                counts[n],
+                budget,
+                f"{counts[n]} queries at scale {n}, over the budget of {budget}:\n"
+                + "\n".join(query["sql"] for query in captured.captured_queries),
+            )
+        self.assertEqual(len(set(counts.values())), 1, f"query count grows with the data: {counts}")
+        self.assertQueryPlans(captured.captured_queries)
+
+    def assertQueryPlans(self, queries):
+        """Fail if any of ``queries`` scans a whole table or sorts without an index."""
+        if connection.vendor != "sqlite":
+            return
+        problems = plan_problems(queries)
+        self.assertFalse(
+            problems,
+            "queries without a usable index:\n"
+            + "\n".join(f"{sql}\n  " + "\n  ".join(details) for sql, details in problems.items()),
+        )
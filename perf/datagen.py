@@ -0,0 +1,122 @@
+import datetime
+import itertools
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+# Shape parameters of the Pareto distributions. Following counts have a
+# finite mean; follower counts and likes per tweet are much more skewed.
+FOLLOWING_ALPHA = 2.0
+POPULARITY_ALPHA = 1.2
+ACTIVITY_ALPHA = 1.5
+PASSWORD = "password"
+# Mean of the exponentially distributed time between a tweet and its likes.
+LIKE_DELAY = datetime.timedelta(hours=6)
+
+# Tweet text is made of short Japanese sentences. Nouns are drawn with a
+# 1/rank law, so a few are in most tweets and the tail is rare, which is what
+# full-text search has to cope with.
+NOUNS = (
+    "今日 東京 仕事 ラーメン コーヒー 週末 天気 会議 映画 音楽 大阪 友達 写真 電車 カフェ 散歩 旅行 新幹線 桜 温泉 "
+    "京都 プログラミング Python Django データベース サーバー 富士山 北海道 東京タワー 朝ごはん 猫 公園 本屋 ゲーム "
+    "雨 海 夜景 お弁当"
+).split()
+PARTICLES = ["は", "が", "を", "に", "で", "と"]
+ENDINGS = (
+    "行きました 楽しかった 最高でした 食べました 見ました 疲れた 好きです 待っています 始めました 考えています"
+).split()
+NOUN_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(NOUNS) + 1)))
+
+
+def _pareto_with_mean(rng, alpha, mean):
+    # paretovariate(alpha) has mean alpha / (alpha - 1).
+    return rng.paretovariate(alpha) * mean * (alpha - 1) / alpha
+
+
+def _coprime_step(n, rng):
+    # Multiplying by a step coprime to n shuffles 0..n-1 without a table.
+    while True:
+        step = rng.randrange(1, n) if n > 2 else 1
+        if math.gcd(step, n) == 1:
+            return step
+
+
+def tweet_text(rng):
+    sentences = []
+    for _ in range(rng.randint(1, 3)):
+        first, second = rng.choices(NOUNS, cum_weights=NOUN_WEIGHTS, k=2)
+        sentences.append(f"{first}{rng.choice(PARTICLES)}{second}{rng.choice(PARTICLES)}{rng.choice(ENDINGS)}。")
+    return "".join(sentences)
+
+
+def generate_records(users=1000, tweets=10000, follows_per_user=20, likes_per_tweet=2, days=30, seed=0):
+    """
+    Yield ``(position, record)`` pairs in the import_data format for a
+    synthetic network with ids starting at 1.
+
+    Who gets followed and who tweets are drawn from Pareto-distributed
+    weights, so a few accounts have most of the followers and tweets. Tweet
+    popularity follows a Zipf-like 1/rank law over a shuffled order, so a few
+    tweets collect most of the likes, which come some hours after the tweet.
+    Tweet text comes from ``tweet_text()``. Every user's password is
+    ``PASSWORD``. Nothing is held per tweet, so the number of tweets is only
+    bounded by time and disk.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    now = timezone.now()
+    start = now - datetime.timedelta(days=days)
+    user_ids = range(1, users + 1)
+    position = itertools.count(1)
+
+    for user_id in user_ids:
+        yield next(position), {
+            "type": "user",
+            "id": user_id,
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@example.com",
+            "password": password,
+            "date_joined": start,
+        }
+
+    popularity = list(itertools.accumulate(rng.paretovariate(POPULARITY_ALPHA) for _ in user_ids))
+    for follower_id in user_ids:
+        wanted = min(users - 1, int(_pareto_with_mean(rng, FOLLOWING_ALPHA, follows_per_user)))
+        following = set(rng.choices(user_ids, cum_weights=popularity, k=wanted))
+        following.discard(follower_id)
+        for following_id in sorted(following):
+            yield next(position), {
+                "type": "follow",
+                "follower_id": follower_id,
+                "following_id": following_id,
+                "created_at": start,
+            }
+
+    activity = list(itertools.accumulate(rng.paretovariate(ACTIVITY_ALPHA) for _ in user_ids))
+    span = (now - start) / max(tweets, 1)
+    batch = 10000
+    for offset in range(0, tweets, batch):
+        authors = rng.choices(user_ids, cum_weights=activity, k=min(batch, tweets - offset))
+        for i, author_id in enumerate(authors, offset + 1):
+            yield next(position), {
+                "type": "tweet",
+                "id": i,
+                "user_id": author_id,
+                "title": f"tweet {i}",
+                "content": tweet_text(rng),
+                "created_at": start + span * i,
+            }
+
+    step = _coprime_step(tweets, rng)
+    for _ in range(tweets * likes_per_tweet):
+        # rank r is drawn with probability ~ 1/r, then mapped to a tweet id.
+        rank = int(tweets ** rng.random()) - 1
+        tweet_id = rank * step % tweets + 1
+        yield next(position), {
+            "type": "like",
+            "tweet_id": tweet_id,
+            "user_id": rng.randint(1, users),
+            "created_at": min(now, start + span * tweet_id + LIKE_DELAY * rng.expovariate(1)),
+        }
@@ -0,0 +1,53 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database(name=None, verbosity=0):
+    # Benchmarks run against a throwaway test database, never the real one.
+    # Pass a file name when several threads or processes must share it.
+    old_name = connection.settings_dict["NAME"]
+    if name is not None:
+        connection.settings_dict["TEST"]["NAME"] = name
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        if name is not None:
+            # destroy_test_db() only removes the database file itself.
+            for path in (f"{name}-wal", f"{name}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.urls import reverse
+
+from accounts.models import User
+from perf.harness import benchmark_database
+from tweets.models import Tweet
+
+VARIANTS = {
+    "like": ("tweets:like", "tweets:unlike"),
+    "like_async": ("tweets:like_async", "tweets:unlike_async"),
+    "follow": ("accounts:follow", "accounts:unfollow"),
+    "follow_async": ("accounts:follow_async", "accounts:unfollow_async"),
+}
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec of the sync and async like/follow views through the ASGI handler."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="Requests in flight at once.")
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per variant.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(name="bench_async_views.sqlite3"):
+            users = User.objects.bulk_create(User(username=f"user{i}") for i in range(options["workers"] + 1))
+            target = users.pop()
+            tweets = Tweet.objects.bulk_create(Tweet(user=target, content=f"tweet {i}") for i in range(100))
+            clients = []
+            for user in users:
+                client = AsyncClient()
+                client.force_login(user)
+                clients.append(client)
+
+            results = {}
+            for variant, (do_name, undo_name) in VARIANTS.items():
+                if variant.startswith("like"):
+                    kwargs = [{"pk": tweet.pk} for tweet in tweets]
+                    urls = [(reverse(do_name, kwargs=kw), reverse(undo_name, kwargs=kw)) for kw in kwargs]
+                else:
+                    kwargs = {"username": target.username}
+                    urls = [(reverse(do_name, kwargs=kwargs), reverse(undo_name, kwargs=kwargs))]
+                results[variant] = asyncio.run(self.run_variant(clients, urls, options["requests"]))
+                self.stdout.write(
+                    f"{variant:>13}  {results[variant]['requests_per_sec']:>8.1f} req/s  "
+                    f"errors {results[variant]['errors']}"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
+
+    async def run_variant(self, clients, urls, total):
+        per_client = total // len(clients)
+        errors = 0
+
+        async def worker(client, offset):
+            nonlocal errors
+            for i in range(per_client):
+                do_url, undo_url = urls[(offset + i // 2) % len(urls)]
+                response = await client.post(undo_url if i % 2 else do_url)
+                if response.status_code >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, offset) for offset, client in enumerate(clients)))
+        elapsed = time.perf_counter() - start
+        return {
+            "requests": per_client * len(clients),
+            "seconds": round(elapsed, 3),
+            "requests_per_sec": round(per_client * len(clients) / elapsed, 1),
+            "errors": errors,
+        }
@@ -0,0 +1,94 @@
+import json
+import random
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from accounts.graph import FollowGraph, follow_snapshot
+from accounts.importer import Importer
+from accounts.models import FollowUser, User
+from perf.datagen import generate_records
+from perf.harness import benchmark_database, measure, summarize
+
+LOAD_BATCH_SIZE = 1000
+
+
+def set_nbytes(rows):
+    # The same rows as a dict of sets of ints, for comparison.
+    total = sys.getsizeof(rows)
+    for user_id, row in rows.items():
+        total += sys.getsizeof(user_id) + sys.getsizeof(row) + sum(sys.getsizeof(i) for i in row)
+    return total
+
+
+class Command(BaseCommand):
+    help = "Measure the memory of the in-memory follow snapshot and the latency of follow checks against the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50000)
+        parser.add_argument("--follows-per-user", type=int, default=20)
+        parser.add_argument("--checks", type=int, default=10000)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        # Every user's follow version must stay in the cache, and their row in
+        # the snapshot, or it is loaded again on each check.
+        caches = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "OPTIONS": {"MAX_ENTRIES": options["users"] * 2},
+            }
+        }
+        with benchmark_database(), override_settings(
+            CACHES=caches, FOLLOW_SNAPSHOT={**settings.FOLLOW_SNAPSHOT, "MAX_ROWS": options["users"]}
+        ):
+            records = generate_records(
+                users=options["users"], tweets=0, follows_per_user=options["follows_per_user"], likes_per_tweet=0
+            )
+            Importer().run(records, "generated")
+            edges = FollowUser.objects.count()
+            user_ids = list(User.objects.values_list("pk", flat=True))
+
+            follow_snapshot.clear()
+            start = time.perf_counter()
+            for i in range(0, len(user_ids), LOAD_BATCH_SIZE):
+                follow_snapshot.load(user_ids[i : i + LOAD_BATCH_SIZE])
+            load_s = time.perf_counter() - start
+            rows = {user_id: set(follow_snapshot.following(user_id)) for user_id in user_ids}
+
+            rng = random.Random(0)
+            pairs = [(rng.choice(user_ids), rng.choice(user_ids)) for _ in range(options["checks"])]
+            pair = iter(pairs * 2)
+            memory = measure(lambda: follow_snapshot.follows(*next(pair)), options["checks"])
+            pair = iter(pairs)
+            database = measure(
+                lambda: FollowUser.objects.filter(**dict(zip(("follower_id", "following_id"), next(pair)))).exists(),
+                options["checks"],
+            )
+            results = {
+                "users": len(user_ids),
+                "edges": edges,
+                "load_s": round(load_s, 2),
+                "snapshot_mib_per_million_edges": round(follow_snapshot.nbytes() / edges * 1e6 / 2**20, 1),
+                "csr_mib_per_million_edges": round(FollowGraph.load().nbytes() / edges * 1e6 / 2**20, 1),
+                "sets_mib_per_million_edges": round(set_nbytes(rows) / edges * 1e6 / 2**20, 1),
+                "memory_check": summarize(memory),
+                "database_check": summarize(database),
+            }
+            follow_snapshot.clear()
+
+        self.stdout.write(f"{results['edges']} follows of {results['users']} users loaded in {results['load_s']} s")
+        self.stdout.write(
+            f"MiB per million follows: snapshot {results['snapshot_mib_per_million_edges']}, "
+            f"CSR {results['csr_mib_per_million_edges']}, dict of sets {results['sets_mib_per_million_edges']}"
+        )
+        self.stdout.write(
+            f"is_following p50: memory {results['memory_check']['p50_ms']:.4f} ms, "
+            f"database {results['database_check']['p50_ms']:.4f} ms"
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.importer import Importer
+from perf.datagen import generate_records
+from perf.harness import benchmark_database, measure, summarize
+from tweets.models import Tweet, TweetLike, TweetScore
+from tweets.popular import change_scores, rescore
+
+PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = "Measure the popular feed: full rescore throughput, incremental score updates and the ranked read."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--likes-per-tweet", type=int, default=2)
+        # Every generated tweet falls in the default 72 hour window.
+        parser.add_argument("--days", type=int, default=3)
+        parser.add_argument("--runs", type=int, default=5, help="Timed full rescores.")
+        parser.add_argument("--updates", type=int, default=1000, help="Timed incremental score updates.")
+        parser.add_argument(
+            "--database", help="SQLite file for the benchmark database; the default in-memory one needs a lot of RAM."
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options["database"]):
+            start = time.perf_counter()
+            records = generate_records(
+                users=options["users"],
+                tweets=options["tweets"],
+                follows_per_user=0,
+                likes_per_tweet=options["likes_per_tweet"],
+                days=options["days"],
+            )
+            Importer().run(records, "generated")
+            load_s = time.perf_counter() - start
+            likes = TweetLike.objects.count()
+            self.stdout.write(f"loaded {options['tweets']} tweets and {likes} likes in {load_s:.1f} s")
+
+            rescores = measure(rescore, options["runs"])
+            scored = TweetScore.objects.count()
+            tweets = Tweet.objects.only("created_at").in_bulk(TweetScore.objects.values_list("tweet_id", flat=True))
+            tweet_ids = list(tweets)
+            updates = measure(lambda: change_scores(tweets, {tweet_ids[len(tweet_ids) // 2]: 1.0}), options["updates"])
+            read = measure(
+                lambda: list(TweetScore.objects.order_by("-rank", "-tweet_id")[:PAGE_SIZE]), options["updates"]
+            )
+
+        rescore_s = summarize(rescores)["p50_ms"] / 1000
+        results = {
+            "load_s": round(load_s, 1),
+            "likes": likes,
+            "scored": scored,
+            "max_tweets": settings.POPULAR["MAX_TWEETS"],
+            "rescore": summarize(rescores),
+            "tweets_per_s": round(options["tweets"] / rescore_s),
+            "likes_per_s": round(likes / rescore_s),
+            "update": summarize(updates),
+            "read": summarize(read),
+        }
+        self.stdout.write(
+            f"rescore p50 {results['rescore']['p50_ms']:.0f} ms "
+            f"({results['tweets_per_s']} tweets/s, {results['likes_per_s']} likes/s), kept {scored}"
+        )
+        self.stdout.write(f"update  p50 {results['update']['p50_ms']:.3f} ms")
+        self.stdout.write(f"read    p50 {results['read']['p50_ms']:.3f} ms")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from accounts.importer import Importer
+from perf.datagen import generate_records
+from perf.harness import benchmark_database, measure, summarize
+from tweets.models import Tweet
+from tweets.search import search_tweets
+
+PAGE_SIZE = 20
+# A frequent noun, the rarest one, a two-character term that the trigram
+# index cannot serve, and a word no tweet contains.
+TERMS = {
+    "common": "ラーメン",
+    "rare": "お弁当",
+    "short": "夜景",
+    "missing": "スカイツリー",
+}
+
+
+class Command(BaseCommand):
+    help = "Compare the FTS5 tweet search with a LIKE scan over synthetic Japanese tweets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--searches", type=int, default=20)
+        parser.add_argument(
+            "--database", help="SQLite file for the benchmark database; the default in-memory one needs a lot of RAM."
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options["database"]):
+            start = time.perf_counter()
+            records = generate_records(
+                users=options["users"], tweets=options["tweets"], follows_per_user=0, likes_per_tweet=0
+            )
+            Importer().run(records, "generated")
+            load_s = time.perf_counter() - start
+            self.stdout.write(f"loaded {options['tweets']} tweets with the search index in {load_s:.1f} s")
+
+            results = {"load_s": round(load_s, 1)}
+            for kind, term in TERMS.items():
+                results[kind] = {
+                    "term": term,
+                    "fts": summarize(measure(lambda: search_tweets(term, PAGE_SIZE), options["searches"])),
+                    "like": summarize(measure(lambda: self.like_scan(term), options["searches"])),
+                    "matches": Tweet.objects.filter(content__contains=term).count(),
+                }
+
+        for kind in TERMS:
+            result = results[kind]
+            self.stdout.write(
+                f"{kind:>8} {result['term']:<8} {result['matches']:>8} matches  "
+                f"fts p50 {result['fts']['p50_ms']:>9.3f} ms  like p50 {result['like']['p50_ms']:>9.3f} ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
+
+    def like_scan(self, term):
+        # The newest page of a content__icontains search: it stops early when
+        # the term is common, and reads every row when it is rare.
+        matches = Tweet.objects.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        return list(matches.order_by("-created_at", "-id")[:PAGE_SIZE])
@@ -0,0 +1,105 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from perf.harness import benchmark_database, summarize
+from tweets.models import Tweet
+
+ENGINES = {
+    "stock": "django.db.backends.sqlite3",
+    "tuned": "perf.sqlite3",
+}
+
+
+class Command(BaseCommand):
+    help = "Hammer LikeView from many threads and compare lock errors of the stock and tuned SQLite backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=100, help="Requests per thread.")
+        parser.add_argument("--tweets", type=int, default=20, help="Tweets the threads like and unlike.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        results = {}
+        # Request logging would only add noise from every slow request.
+        with benchmark_database(name="bench_sqlite_locks.sqlite3"), override_settings(
+            SERVER_TIMING={**settings.SERVER_TIMING, "ENABLED": False}
+        ):
+            users = User.objects.bulk_create(User(username=f"user{i}") for i in range(options["threads"]))
+            tweets = Tweet.objects.bulk_create(
+                Tweet(user=users[0], content=f"tweet {i}") for i in range(options["tweets"])
+            )
+            tweet_ids = [tweet.pk for tweet in tweets]
+            for mode, engine in ENGINES.items():
+                # Connections are per thread and built from these settings,
+                # so only the worker threads below pick up the engine.
+                connection.settings_dict["ENGINE"] = engine
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode = DELETE")
+                results[mode] = self.run_mode(users, tweet_ids, options["requests"])
+                self.stdout.write(
+                    f"{mode:>6}  {results[mode]['requests_per_sec']:>7.1f} req/s  "
+                    f"lock errors {results[mode]['lock_error_rate']:>6.2%}  "
+                    f"p50 {results[mode]['latency']['p50_ms']:>8.2f} ms  "
+                    f"p99 {results[mode]['latency']['p99_ms']:>8.2f} ms"
+                )
+            connection.settings_dict["ENGINE"] = ENGINES["tuned"]
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
+
+    def run_mode(self, users, tweet_ids, requests):
+        outcomes, samples = Counter(), []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(users))
+
+        def worker(user, seed):
+            rng = random.Random(seed)
+            client = Client()
+            client.force_login(user)
+            liked = set()
+            barrier.wait()
+            try:
+                for _ in range(requests):
+                    tweet_id = rng.choice(tweet_ids)
+                    name = "tweets:unlike" if tweet_id in liked else "tweets:like"
+                    start = time.perf_counter()
+                    try:
+                        response = client.post(reverse(name, kwargs={"pk": tweet_id}))
+                        outcome = "ok" if response.status_code == 200 else f"status {response.status_code}"
+                        if outcome == "ok":
+                            liked.symmetric_difference_update({tweet_id})
+                    except OperationalError as e:
+                        outcome = "lock error" if "locked" in str(e) else "other error"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        outcomes[outcome] += 1
+                        samples.append(elapsed)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(user, i)) for i, user in enumerate(users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        total = sum(outcomes.values())
+        return {
+            "outcomes": dict(outcomes),
+            "lock_error_rate": outcomes["lock error"] / total,
+            "requests_per_sec": total / elapsed,
+            "latency": summarize(samples),
+        }
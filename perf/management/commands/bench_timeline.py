@@ -0,0 +1,107 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from accounts.models import FollowUser, User
+from perf.harness import benchmark_database, measure, summarize
+from tweets.models import TimelineEntry, Tweet
+from tweets.timeline import backfill_timeline, push_tweet, read_timeline
+
+PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = "Compare write cost and read latency of push, hybrid and pull home timelines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--followers", type=int, default=20000, help="Followers of the high-follower author.")
+        parser.add_argument("--authors", type=int, default=50, help="Regular authors the reader follows.")
+        parser.add_argument("--tweets-per-author", type=int, default=200)
+        parser.add_argument("--writes", type=int, default=20)
+        parser.add_argument("--reads", type=int, default=200)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.populate(options)
+            threshold = options["followers"] // 2
+            results = {
+                "push": self.run_mode(options, threshold=None),
+                "hybrid": self.run_mode(options, threshold=threshold),
+                "pull": self.run_pull(options),
+            }
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>6}  write p50 {result['write']['p50_ms']:>9.3f} ms  "
+                f"rows/write {result['rows_per_write']:>8}  "
+                f"read p50 {result['read']['p50_ms']:>7.3f} ms  p95 {result['read']['p95_ms']:>7.3f} ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
+
+    def populate(self, options):
+        self.reader = User.objects.create(username="reader")
+        self.celebrity = User.objects.create(username="celebrity")
+        authors = User.objects.bulk_create(User(username=f"author{i}") for i in range(options["authors"]))
+        followers = User.objects.bulk_create(User(username=f"follower{i}") for i in range(options["followers"] - 1))
+        FollowUser.objects.bulk_create(
+            [FollowUser(follower=user, following=self.celebrity) for user in [self.reader, *followers]]
+            + [FollowUser(follower=self.reader, following=author) for author in authors],
+            batch_size=5000,
+        )
+        call_command("rebuild_follow_counts", stdout=self.stderr)
+        self.celebrity.refresh_from_db()
+        self.followees = [self.celebrity, *authors]
+        Tweet.objects.bulk_create(
+            (
+                Tweet(user=author, content=f"tweet {i}")
+                for author in self.followees
+                for i in range(options["tweets_per_author"])
+            ),
+            batch_size=5000,
+        )
+
+    def reset_reader_timeline(self):
+        TimelineEntry.objects.filter(owner=self.reader).delete()
+        backfill_timeline(self.reader, self.reader)
+        for author in self.followees:
+            backfill_timeline(self.reader, author)
+
+    def measure_writes(self, options):
+        before = TimelineEntry.objects.count()
+
+        def write():
+            with transaction.atomic():
+                push_tweet(Tweet.objects.create(user=self.celebrity, content="new tweet"))
+
+        samples = measure(write, options["writes"])
+        rows = (TimelineEntry.objects.count() - before) // options["writes"]
+        return samples, rows
+
+    def run_mode(self, options, threshold):
+        with override_settings(TIMELINE_FANOUT_THRESHOLD=threshold):
+            self.reset_reader_timeline()
+            writes, rows = self.measure_writes(options)
+            reads = measure(lambda: read_timeline(self.reader, PAGE_SIZE), options["reads"])
+        return {"write": summarize(writes), "rows_per_write": rows, "read": summarize(reads)}
+
+    def run_pull(self, options):
+        author_ids = [self.reader.pk, *(author.pk for author in self.followees)]
+
+        def write():
+            Tweet.objects.create(user=self.celebrity, content="new tweet")
+
+        def read():
+            return list(
+                Tweet.objects.filter(user_id__in=author_ids)
+                .order_by("-created_at", "-id")
+                .values_list("created_at", "id")[:PAGE_SIZE]
+            )
+
+        writes = measure(write, options["writes"])
+        reads = measure(read, options["reads"])
+        return {"write": summarize(writes), "rows_per_write": 0, "read": summarize(reads)}
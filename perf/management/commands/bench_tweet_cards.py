@@ -0,0 +1,53 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.test import RequestFactory, override_settings
+
+from accounts.models import User
+from perf.harness import benchmark_database, measure, summarize
+from tweets.models import Tweet
+
+TEMPLATE = '{% for tweet in tweets %}{% include "tweets/tweet_card.html" %}{% endfor %}'
+DUMMY_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    help = "Compare the render time of a list of tweet cards with and without the fragment cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=100)
+        parser.add_argument("--renders", type=int, default=200)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create(username="reader")
+            Tweet.objects.bulk_create(
+                Tweet(user=user, title=f"title {i}", content=f"tweet {i}") for i in range(options["cards"])
+            )
+            request = RequestFactory().get("/")
+            request.user = user
+            tweets = list(Tweet.objects.select_related("user").with_like_count().with_liked_by(user))
+            template = engines["django"].from_string(TEMPLATE)
+
+            def render():
+                return template.render({"tweets": tweets}, request)
+
+            with override_settings(CACHES=DUMMY_CACHE):
+                uncached = measure(render, options["renders"])
+            cache.clear()
+            render()
+            cached = measure(render, options["renders"])
+            cache.clear()
+
+        results = {"uncached": summarize(uncached), "cached": summarize(cached)}
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>8}  {options['cards']} cards  "
+                f"p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": options, "results": results}, f, indent=2, default=str)
@@ -0,0 +1,221 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+
+from accounts.models import User
+from perf.datagen import PASSWORD
+from perf.harness import benchmark_database, summarize
+from perf.management.commands.generate_data import add_generator_arguments, generate
+from tweets.models import Tweet
+from tweets.timeline import push_tweet
+
+APPS = ("tweets", "accounts")
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic network and drive every tweets/accounts URL through the test client, "
+        "reporting latency percentiles, query counts and peak memory per URL."
+    )
+
+    def add_arguments(self, parser):
+        add_generator_arguments(parser)
+        parser.add_argument("--requests", type=int, default=50, help="Timed requests per URL.")
+        parser.add_argument("--memory-samples", type=int, default=3, help="Extra requests per URL under tracemalloc.")
+        parser.add_argument("--only", nargs="*", help="URL names to run, e.g. tweets:home.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--baseline", help="A previous --output file to compare p50 latencies against.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            generate({**options, "skip_timelines": False}, StringIO())
+            self.prepare(options["requests"] + options["memory_samples"])
+            scenarios = self.scenarios()
+            names = [
+                f"{app}:{name}"
+                for app in APPS
+                for name in get_resolver().namespace_dict[app][1].reverse_dict
+                if isinstance(name, str)
+            ]
+            missing = sorted(set(names) - set(scenarios))
+            if missing:
+                raise CommandError(f"No benchmark scenario for {', '.join(missing)}.")
+            results = {}
+            for name, scenario in scenarios.items():
+                if options["only"] and name not in options["only"]:
+                    continue
+                results[name] = self.run_scenario(scenario, options["requests"], options["memory_samples"])
+                self.report(name, results[name])
+
+        output = {"commit": current_commit(), "options": options, "results": results}
+        if options["baseline"]:
+            self.compare(options["baseline"], results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(output, f, indent=2, default=str)
+
+    def prepare(self, count):
+        # The reader follows the most accounts, so their timeline is the
+        # most expensive one; the author is the most followed account.
+        self.viewer = User.objects.order_by("-following_count", "pk").first()
+        self.author = User.objects.order_by("-follower_count", "pk").first()
+        self.tweet = Tweet.objects.order_by("-like_count", "pk").first()
+        self.unliked = list(
+            Tweet.objects.exclude(liked_tweet__user=self.viewer).values_list("pk", flat=True)[: count * 4]
+        )
+        self.unfollowed = list(
+            User.objects.exclude(following__follower=self.viewer)
+            .exclude(pk=self.viewer.pk)
+            .values_list("username", flat=True)[: count * 2]
+        )
+        self.client = Client()
+        self.client.force_login(self.viewer)
+
+    def scenarios(self):
+        # Each scenario maps a request index to (method, path, data, options).
+        # Anything done before returning, like creating the tweet to delete,
+        # is not timed.
+        count = len(self.unliked) // 4
+        viewer, author = self.viewer.username, self.author.username
+
+        def get(name, **kwargs):
+            return lambda i: ("get", reverse(name, kwargs=kwargs), None, {})
+
+        def on_tweets(name, offset):
+            return lambda i: ("post", reverse(name, kwargs={"pk": self.unliked[offset + i]}), None, {})
+
+        def on_users(name, offset):
+            return lambda i: ("post", reverse(name, kwargs={"username": self.unfollowed[offset + i]}), None, {})
+
+        def delete(i):
+            tweet = Tweet.objects.create(user=self.viewer, content=f"to delete {i}")
+            push_tweet(tweet)
+            return "post", reverse("tweets:delete", kwargs={"pk": tweet.pk}), None, {}
+
+        def like_batch(i):
+            ops = [{"tweet_id": pk, "op": "like" if i % 2 == 0 else "unlike"} for pk in self.unliked[:10]]
+            return "post", reverse("tweets:like_batch"), json.dumps({"ops": ops}), {"content_type": "application/json"}
+
+        def signup(i):
+            data = {
+                "username": f"bench{i}",
+                "email": f"bench{i}@example.com",
+                "password1": "b3nchmark!pass",
+                "password2": "b3nchmark!pass",
+            }
+            return "post", reverse("accounts:signup"), data, {"relogin": True}
+
+        return {
+            "tweets:home": get("tweets:home"),
+            "tweets:create": lambda i: (
+                "post",
+                reverse("tweets:create"),
+                {"title": "bench", "content": f"benchmark {i}"},
+                {},
+            ),
+            "tweets:detail": get("tweets:detail", pk=self.tweet.pk),
+            "tweets:search": lambda i: ("get", reverse("tweets:search") + "?q=ラーメン", None, {}),
+            "tweets:tag": get("tweets:tag", tag="bench"),
+            "tweets:mention": get("tweets:mention", username=viewer),
+            "tweets:popular": get("tweets:popular"),
+            "tweets:trending": get("tweets:trending"),
+            "tweets:delete": delete,
+            "tweets:like": on_tweets("tweets:like", 0),
+            "tweets:unlike": on_tweets("tweets:unlike", 0),
+            "tweets:like_async": on_tweets("tweets:like_async", count),
+            "tweets:unlike_async": on_tweets("tweets:unlike_async", count),
+            "tweets:like_batch": like_batch,
+            "accounts:signup": signup,
+            "accounts:login": lambda i: (
+                "post",
+                reverse("accounts:login"),
+                {"username": viewer, "password": PASSWORD},
+                {},
+            ),
+            "accounts:logout": lambda i: ("post", reverse("accounts:logout"), None, {"relogin": True}),
+            "accounts:export": get("accounts:export"),
+            "accounts:recommendations": get("accounts:recommendations"),
+            "accounts:user_profile": get("accounts:user_profile", username=author),
+            "accounts:follow": on_users("accounts:follow", 0),
+            "accounts:unfollow": on_users("accounts:unfollow", 0),
+            "accounts:follow_async": on_users("accounts:follow_async", count),
+            "accounts:unfollow_async": on_users("accounts:unfollow_async", count),
+            "accounts:follow_api": on_users("accounts:follow_api", 0),
+            "accounts:unfollow_api": on_users("accounts:unfollow_api", 0),
+            "accounts:following_list": get("accounts:following_list", username=viewer),
+            "accounts:follower_list": get("accounts:follower_list", username=author),
+        }
+
+    def request(self, scenario, i, trace=False):
+        method, path, data, extra = scenario(i)
+        kwargs = {"content_type": extra["content_type"]} if "content_type" in extra else {}
+        if trace:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(path, data, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline if trace else None
+        if extra.get("relogin"):
+            self.client.force_login(self.viewer)
+        return {"status": response.status_code, "elapsed": elapsed, "queries": len(captured), "peak": peak}
+
+    def run_scenario(self, scenario, requests, memory_samples):
+        timed = [self.request(scenario, i) for i in range(requests)]
+        tracemalloc.start()
+        try:
+            traced = [self.request(scenario, i, trace=True) for i in range(requests, requests + memory_samples)]
+        finally:
+            tracemalloc.stop()
+
+        queries = [sample["queries"] for sample in timed]
+        statuses = {}
+        for sample in timed:
+            statuses[sample["status"]] = statuses.get(sample["status"], 0) + 1
+        return {
+            "status": statuses,
+            "latency": summarize([sample["elapsed"] for sample in timed]),
+            "queries": {"mean": round(statistics.fmean(queries), 1), "max": max(queries)},
+            "peak_memory_kib": round(max((sample["peak"] for sample in traced), default=0) / 1024, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<26} p50 {result['latency']['p50_ms']:>8.2f} ms  p95 {result['latency']['p95_ms']:>8.2f} ms  "
+            f"p99 {result['latency']['p99_ms']:>8.2f} ms  queries {result['queries']['mean']:>6}  "
+            f"peak {result['peak_memory_kib']:>8.1f} KiB  status {result['status']}"
+        )
+
+    def compare(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or path}:")
+        for name, result in results.items():
+            before = baseline["results"].get(name)
+            if before is None:
+                continue
+            old, new = before["latency"]["p50_ms"], result["latency"]["p50_ms"]
+            change = (new - old) / old * 100 if old else 0
+            self.stdout.write(
+                f"{name:<26} p50 {old:>8.2f} -> {new:>8.2f} ms ({change:+.0f}%)  "
+                f"queries {before['queries']['mean']} -> {result['queries']['mean']}"
+            )
@@ -0,0 +1,48 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import Importer
+from accounts.models import User
+from perf.datagen import PASSWORD, generate_records
+
+
+def add_generator_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tweets", type=int, default=10000)
+    parser.add_argument(
+        "--follows-per-user", type=int, default=20, help="Mean follows drawn per user; repeats are dropped."
+    )
+    parser.add_argument("--likes-per-tweet", type=int, default=2, help="Mean likes per tweet.")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generate(options, stdout):
+    records = generate_records(
+        users=options["users"],
+        tweets=options["tweets"],
+        follows_per_user=options["follows_per_user"],
+        likes_per_tweet=options["likes_per_tweet"],
+        seed=options["seed"],
+    )
+    Importer(report=stdout.write).run(records, "generated")
+    call_command("rebuild_like_counts", stdout=stdout)
+    call_command("rebuild_follow_counts", stdout=stdout)
+    call_command("rescore_popular", stdout=stdout)
+    if not options.get("skip_timelines"):
+        call_command("rebuild_timelines", stdout=stdout)
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a synthetic power-law follow graph, tweets and likes."
+
+    def add_arguments(self, parser):
+        add_generator_arguments(parser)
+        parser.add_argument(
+            "--skip-timelines", action="store_true", help="Do not materialize home timelines (slow at large scale)."
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.exists():
+            raise CommandError("The database already has users; generate_data only fills an empty one.")
+        generate(options, self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Generated data. Every user's password is {PASSWORD!r}."))
@@ -0,0 +1,222 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.views.generic.detail import BaseDetailView
+from django.views.generic.list import BaseListView
+
+from .routers import request_routing
+
+logger = logging.getLogger(__name__)
+
+# The QueryTimer of the request being handled. A context variable rather
+# than a per-connection wrapper, as the queries of async requests run on
+# another thread, with that thread's connections, but in a copy of the
+# request's context.
+_query_timer = ContextVar("query_timer", default=None)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def time_queries(execute, sql, params, many, context):
+    """Execute wrapper that PerfConfig installs on every connection."""
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+class ServerTimingMiddleware:
+    """
+    Measure query count, database time, view time and template render time
+    of each request.
+
+    A sampled share of requests (``SERVER_TIMING["SAMPLE_RATE"]``) gets a
+    ``Server-Timing`` header and an INFO log line; requests over
+    ``SLOW_REQUEST_MS`` or ``MAX_QUERIES`` are always logged, as WARNING.
+    Both carry the resolved URL name. Template time covers the rendering of
+    ``TemplateResponse``s, which is where the generic views render; the
+    content of streaming responses is produced after the middleware returns
+    and is not included. It runs natively in sync and async stacks, so async
+    views are not moved onto a thread by it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.SERVER_TIMING["ENABLED"]:
+            return self.get_response(request)
+        with self.measure(request) as measured:
+            measured["response"] = self.get_response(request)
+        return self.report(request, **measured)
+
+    async def __acall__(self, request):
+        if not settings.SERVER_TIMING["ENABLED"]:
+            return await self.get_response(request)
+        with self.measure(request) as measured:
+            measured["response"] = await self.get_response(request)
+        return self.report(request, **measured)
+
+    @contextmanager
+    def measure(self, request):
+        timer = QueryTimer()
+        request._server_timing = {}
+        measured = {"timer": timer, "start": time.perf_counter()}
+        token = _query_timer.set(timer)
+        try:
+            yield measured
+        finally:
+            _query_timer.reset(token)
+        measured["end"] = time.perf_counter()
+
+    def report(self, request, response, timer, start, end):
+        options = settings.SERVER_TIMING
+        timings = request._server_timing
+        metrics = {
+            "queries": timer.count,
+            "db_ms": timer.duration * 1000,
+            "view_ms": (timings.get("view_end", end) - timings.get("view_start", start)) * 1000,
+            "template_ms": (timings["render_end"] - timings["view_end"]) * 1000 if "render_end" in timings else 0.0,
+            "total_ms": (end - start) * 1000,
+        }
+        over = metrics["total_ms"] >= options["SLOW_REQUEST_MS"] or metrics["queries"] > options["MAX_QUERIES"]
+        sampled = random.random() < options["SAMPLE_RATE"]
+        if not (sampled or over):
+            return response
+
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+        if sampled:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={metrics["db_ms"]:.2f};desc="{metrics["queries"]} queries"',
+                    f'view;dur={metrics["view_ms"]:.2f}',
+                    f'tpl;dur={metrics["template_ms"]:.2f}',
+                    f'total;dur={metrics["total_ms"]:.2f};desc="{url_name}"',
+                ]
+            )
+        logger.log(
+            logging.WARNING if over else logging.INFO,
+            "%s %s %s %d: %d queries, db %.2f ms, view %.2f ms, template %.2f ms, total %.2f ms",
+            url_name,
+            request.method,
+            request.path,
+            response.status_code,
+            metrics["queries"],
+            metrics["db_ms"],
+            metrics["view_ms"],
+            metrics["template_ms"],
+            metrics["total_ms"],
+            extra={
+                "url_name": url_name,
+                "method": request.method,
+                "status": response.status_code,
+                **{key: round(value, 3) for key, value in metrics.items()},
+            },
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, "_server_timing"):
+            request._server_timing["view_start"] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, "_server_timing", None)
+        if timings is not None:
+            timings["view_end"] = time.perf_counter()
+            response.add_post_render_callback(lambda response: timings.update(render_end=time.perf_counter()))
+        return response
+
+
+def primary_pin_key(user_id):
+    return f"primary_pin:{user_id}"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve the reads of GET and HEAD requests to ListView and DetailView
+    subclasses from one of ``READ_REPLICAS["ALIASES"]``.
+
+    A request that writes anything pins its user to the primary for
+    ``READ_REPLICAS["PIN_SECONDS"]``, long enough for replication to catch
+    up, so users see their own tweets, likes and follows at once on every
+    device. The pin is kept in the cache, and the session and user it is
+    looked up by are read from the primary, as a login may not have reached
+    the replica yet. Like ServerTimingMiddleware it runs in both sync and
+    async stacks.
+    """
+
+    read_views = (BaseListView, BaseDetailView)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with request_routing() as routing:
+            request._replica_routing = routing
+            response = self.get_response(request)
+        self.pin(request, routing)
+        return response
+
+    async def __acall__(self, request):
+        with request_routing() as routing:
+            request._replica_routing = routing
+            response = await self.get_response(request)
+        if routing.wrote:
+            # request.user may not have been loaded yet.
+            await sync_to_async(self.pin)(request, routing)
+        return response
+
+    def pin(self, request, routing):
+        options = settings.READ_REPLICAS
+        user = getattr(request, "user", None)
+        if routing.wrote and options["ALIASES"] and user is not None and user.is_authenticated:
+            cache.set(primary_pin_key(user.pk), time.time() + options["PIN_SECONDS"], options["PIN_SECONDS"])
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        options = settings.READ_REPLICAS
+        view_class = getattr(view_func, "view_class", None)
+        if (
+            options["ALIASES"]
+            and request.method in ("GET", "HEAD")
+            and view_class is not None
+            and issubclass(view_class, self.read_views)
+            and not self.pinned(request)
+        ):
+            request._replica_routing.replica = random.choice(options["ALIASES"])
+
+    def pinned(self, request):
+        user = request.user
+        return user.is_authenticated and cache.get(primary_pin_key(user.pk), 0) > time.time()
@@ -0,0 +1,38 @@
+import re
+
+from django.db import connection
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+# "SCAN tweets_tweet" reads the whole table; "SCAN ... USING INDEX" walks an
+# index in order and stops at the LIMIT, so it is not reported.
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW$)\S+$")
+TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR .*ORDER BY")
+# Ranking full-text matches sorts them however the tables are indexed, but
+# that sort covers the matches rather than the table.
+FTS_MATCH = re.compile(r"VIRTUAL TABLE INDEX \d+:M")
+
+
+def explain(sql):
+    """The detail lines of SQLite's EXPLAIN QUERY PLAN for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[3] for row in cursor.fetchall()]
+
+
+def plan_problems(queries):
+    """
+    Map each captured query whose plan has a full table scan or sorts in a
+    temporary B-tree to the offending plan lines. Sorting the matches of a
+    full-text query by rank is allowed.
+    """
+    problems = {}
+    for query in queries:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith(EXPLAINED):
+            continue
+        plan = explain(sql)
+        ranked = any(FTS_MATCH.search(detail) for detail in plan)
+        details = [detail for detail in plan if FULL_SCAN.match(detail) or (TEMP_SORT.search(detail) and not ranked)]
+        if details:
+            problems[sql] = details
+    return problems
@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_routing = ContextVar("replica_routing", default=None)
+
+
+class RequestRouting:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+@contextmanager
+def request_routing():
+    routing = RequestRouting()
+    token = _routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _routing.reset(token)
+
+
+def read_primary_if_changed(changed_at):
+    """
+    Move the current request's remaining reads to the primary when data it
+    depends on changed at ``changed_at``, less than ``PIN_SECONDS`` ago,
+    which the replica may not have yet.
+    """
+    routing = _routing.get()
+    if routing is not None and routing.replica and changed_at > time.time() - settings.READ_REPLICAS["PIN_SECONDS"]:
+        routing.replica = None
+
+
+class ReplicaRouter:
+    """
+    Send reads to a replica when ReplicaRoutingMiddleware picked one for the
+    current request, and everything else to the primary.
+
+    Reads outside a request (management commands, the like write-behind
+    thread) and reads after the request has written anything stay on the
+    primary, so a request always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        return routing.replica or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS["ALIASES"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.READ_REPLICAS["ALIASES"]:
+            return False
+        return None
@@ -0,0 +1,327 @@
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import FollowUser, User
+from perf.datagen import PASSWORD, generate_records
+from perf.middleware import ReplicaRoutingMiddleware, ServerTimingMiddleware, primary_pin_key
+from perf.plans import plan_problems
+from perf.sqlite3.base import DatabaseWrapper
+from tweets.models import Tweet, TweetLike
+
+SERVER_TIMING = {"ENABLED": True, "SAMPLE_RATE": 1.0, "SLOW_REQUEST_MS": 10000, "MAX_QUERIES": 1000}
+
+
+class TestServerTimingMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        self.tweet = Tweet.objects.create(user=self.user, content="tweet")
+
+    def metrics(self, response):
+        return {metric.split(";")[0]: metric for metric in response["Server-Timing"].split(", ")}
+
+    @override_settings(SERVER_TIMING=SERVER_TIMING)
+    def test_header_and_log(self):
+        with self.assertLogs("perf.middleware", level="INFO") as logs:
+            response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {"db", "view", "tpl", "total"})
+        self.assertIn('desc="tweets:detail"', metrics["total"])
+        record = logs.records[0]
+        self.assertEqual(record.levelname, "INFO")
+        self.assertEqual(record.url_name, "tweets:detail")
+        self.assertEqual(record.status, 200)
+        # Session, user, ETag check and the tweet itself.
+        self.assertEqual(record.queries, 4)
+        self.assertIn(f'desc="{record.queries} queries"', metrics["db"])
+        self.assertGreater(record.template_ms, 0)
+        self.assertGreaterEqual(record.total_ms, record.view_ms)
+
+    @override_settings(SERVER_TIMING={**SERVER_TIMING, "SAMPLE_RATE": 0})
+    def test_not_sampled(self):
+        with self.assertNoLogs("perf.middleware"):
+            response = self.client.get(reverse("tweets:home"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING={**SERVER_TIMING, "SAMPLE_RATE": 0, "MAX_QUERIES": 1})
+    def test_over_threshold_is_always_logged(self):
+        with self.assertLogs("perf.middleware", level="WARNING") as logs:
+            response = self.client.get(reverse("tweets:home"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(logs.records[0].url_name, "tweets:home")
+
+    @override_settings(SERVER_TIMING={**SERVER_TIMING, "ENABLED": False})
+    def test_disabled(self):
+        response = self.client.get(reverse("tweets:home"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING=SERVER_TIMING)
+    def test_json_view(self):
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertIn('desc="tweets:like"', self.metrics(response)["total"])
+        self.assertIn("tpl;dur=0.00", response["Server-Timing"])
+
+    @override_settings(SERVER_TIMING=SERVER_TIMING)
+    async def test_async_view(self):
+        with self.assertLogs("perf.middleware", level="INFO") as logs:
+            response = await self.async_client.post(reverse("tweets:like_async", kwargs={"pk": self.tweet.pk}))
+        self.assertIn('desc="tweets:like_async"', self.metrics(response)["total"])
+        self.assertGreater(logs.records[0].queries, 0)
+        self.assertIn("tweets:like_async POST", logs.output[0])
+
+    def test_sync_and_async_capable(self):
+        async def get_response(request):
+            pass
+
+        for middleware in (ServerTimingMiddleware, ReplicaRoutingMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertTrue(iscoroutinefunction(middleware(get_response)))
+                self.assertFalse(iscoroutinefunction(middleware(lambda request: None)))
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+
+    def problems(self, queryset):
+        with CaptureQueriesContext(connection) as captured:
+            list(queryset)
+        return list(plan_problems(captured.captured_queries).values())
+
+    def test_indexed_queries(self):
+        self.assertEqual(self.problems(Tweet.objects.filter(user=self.user)[:20]), [])
+        self.assertEqual(self.problems(self.user.follower.order_by("-created_at")), [])
+        self.assertEqual(self.problems(self.user.following.order_by("-created_at")), [])
+        self.assertEqual(self.problems(TweetLike.objects.filter(user=self.user).order_by("pk")), [])
+
+    def test_full_scan(self):
+        self.assertEqual(self.problems(Tweet.objects.filter(content="tweet").order_by()), [["SCAN tweets_tweet"]])
+
+    def test_temp_sort(self):
+        self.assertEqual(
+            self.problems(Tweet.objects.filter(user=self.user).order_by("content")), [["USE TEMP B-TREE FOR ORDER BY"]]
+        )
+
+
+class TestGenerateData(TestCase):
+    options = {"users": 20, "tweets": 50, "follows_per_user": 3, "likes_per_tweet": 2}
+
+    def records(self, seed):
+        # Timestamps are relative to now, and every password gets a new salt.
+        with mock.patch("perf.datagen.timezone.now", return_value=timezone.now().replace(microsecond=0)):
+            records = list(generate_records(**self.options, seed=seed))
+        for _, record in records:
+            record.pop("password", None)
+        return records
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(self.records(seed=1), self.records(seed=1))
+        self.assertNotEqual(self.records(seed=1), self.records(seed=2))
+
+    def test_generate_data(self):
+        records = [record for _, record in generate_records(**self.options)]
+        follows = {(r["follower_id"], r["following_id"]) for r in records if r["type"] == "follow"}
+        likes = {(r["tweet_id"], r["user_id"]) for r in records if r["type"] == "like"}
+        self.assertEqual(sum(r["type"] == "like" for r in records), 100)
+
+        call_command(
+            "generate_data",
+            *("--users", "20", "--tweets", "50", "--follows-per-user", "3", "--likes-per-tweet", "2"),
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Tweet.objects.count(), 50)
+        self.assertEqual(set(FollowUser.objects.values_list("follower_id", "following_id")), follows)
+        self.assertEqual(set(TweetLike.objects.values_list("tweet_id", "user_id")), likes)
+        self.assertEqual(sum(Tweet.objects.values_list("like_count", flat=True)), len(likes))
+        self.assertTrue(User.objects.get(username="user1").check_password(PASSWORD))
+        with self.assertRaisesMessage(CommandError, "already has users"):
+            call_command("generate_data", stdout=StringIO())
+
+
+class TestSQLiteBackend(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "db.sqlite3")
+
+    def open(self, **options):
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": self.path, "OPTIONS": options}, "locktest")
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.open(pragmas={"busy_timeout": 1234})
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+        self.assertEqual(self.pragma(wrapper, "busy_timeout"), 1234)
+        self.assertEqual(self.pragma(wrapper, "cache_size"), -64000)
+        self.assertEqual(self.pragma(wrapper, "foreign_keys"), 1)
+
+    def test_begin_immediate_retries_while_locked(self):
+        writer = self.open()
+        waiting = self.open(pragmas={"busy_timeout": 0}, begin_retries=2)
+        writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with mock.patch("perf.sqlite3.base.time.sleep") as sleep:
+            with self.assertRaisesMessage(OperationalError, "locked"):
+                waiting.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        self.assertEqual(sleep.call_count, 2)
+
+        writer.rollback()
+        writer.set_autocommit(True)
+        waiting.set_autocommit(True)
+        waiting.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        self.assertFalse(waiting.get_autocommit())
+        waiting.rollback()
+
+
+@override_settings(READ_REPLICAS={"ALIASES": ["replica"], "PIN_SECONDS": 5})
+class TestReplicaRouting(TestCase):
+    """
+    The replica is a separate SQLite file that only changes when
+    ``replicate()`` copies the primary into it, so anything written after the
+    last copy is replication lag.
+    """
+
+    def setUp(self):
+        cache.clear()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        connections.settings["replica"] = {
+            **connection.settings_dict,
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(tmpdir.name, "replica.sqlite3"),
+        }
+        self.addCleanup(self.remove_replica)
+
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="otheruser", password="testpassword")
+        self.client.force_login(self.user)
+        self.other_client = self.client_class()
+        self.other_client.force_login(self.other)
+        self.tweet = Tweet.objects.create(user=self.other, content="tweet")
+        self.replicate()
+
+    def remove_replica(self):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def replicate(self):
+        # Serializing through the primary's own connection also copies the
+        # rows of the transaction TestCase keeps open.
+        replica = connections["replica"]
+        replica.ensure_connection()
+        connection.ensure_connection()
+        replica.connection.deserialize(connection.connection.serialize())
+
+    def get(self, client, url):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            response = client.get(url)
+        return response, len(primary), len(replica)
+
+    def test_list_and_detail_reads_use_replica(self):
+        for url in [
+            reverse("tweets:home"),
+            reverse("tweets:detail", kwargs={"pk": self.tweet.pk}),
+            reverse("accounts:user_profile", kwargs={"username": self.other.username}),
+        ]:
+            with self.subTest(url=url):
+                response, primary, replica = self.get(self.client, url)
+                self.assertEqual(response.status_code, 200)
+                # Only the session and user the pin is looked up by.
+                self.assertEqual(primary, 2)
+                self.assertGreater(replica, 0)
+
+    def test_other_views_use_primary(self):
+        response, primary, replica = self.get(self.client, reverse("tweets:create"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_lagging_replica(self):
+        self.client.post(reverse("tweets:create"), {"title": "title", "content": "new"})
+        self.assertTrue(cache.get(primary_pin_key(self.user.pk)))
+        tweet = Tweet.objects.latest("pk")
+        url = reverse("tweets:detail", kwargs={"pk": tweet.pk})
+
+        # The writer is pinned to the primary and sees the tweet at once.
+        response, primary, replica = self.get(self.client, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+        # Other users read the replica, which has not caught up yet.
+        response, _, _ = self.get(self.other_client, url)
+        self.assertEqual(response.status_code, 404)
+
+        self.replicate()
+        response, primary, replica = self.get(self.other_client, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 2)
+
+    def test_pin_expires(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        response, _, replica = self.get(self.client, url)
+        self.assertEqual(response.context["tweet"].like_total, 1)
+        self.assertEqual(replica, 0)
+
+        with mock.patch("time.time", return_value=time.time() + 6):
+            response, primary, replica = self.get(self.client, url)
+        self.assertEqual(response.context["tweet"].like_total, 0)
+        self.assertEqual(primary, 2)
+
+    def test_follow_pins_to_primary(self):
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.other.username}))
+        response, _, replica = self.get(
+            self.client, reverse("accounts:following_list", kwargs={"username": "testuser"})
+        )
+        self.assertEqual(len(response.context["following_list"]), 1)
+        self.assertEqual(replica, 0)
+
+    def test_async_write_pins_to_primary(self):
+        self.client.post(reverse("tweets:like_async", kwargs={"pk": self.tweet.pk}))
+        self.assertTrue(cache.get(primary_pin_key(self.user.pk)))
+
+    def test_pin_follows_user(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        # Another browser logged in as the same user is pinned as well.
+        client = self.client_class()
+        client.force_login(self.user)
+        response, _, replica = self.get(client, reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.context["tweet"].like_total, 1)
+        self.assertEqual(replica, 0)
+
+    def test_changed_versions_read_primary(self):
+        url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        etag = self.get(self.client, url)[0]["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+
+        # The new ETag comes with the page it stands for, not the replica's old one.
+        response, _, _ = self.get(self.client, url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.context["tweet"].like_total, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_reads_outside_requests_use_primary(self):
+        Tweet.objects.create(user=self.user, content="unreplicated")
+        self.assertEqual(Tweet.objects.count(), 2)
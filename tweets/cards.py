@@ -0,0 +1,18 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+# The card fragment in tweets/tweet_card.html is keyed by tweet id and like
+# total, so a changed count never serves a stale card. Deleting the entry a
+# write has superseded just keeps it from sitting in the cache until it expires.
+
+
+def tweet_card_key(tweet_id, like_total):
+    return make_template_fragment_key("tweet_card", [tweet_id, like_total])
+
+
+def invalidate_tweet_card(tweet_id, like_total):
+    cache.delete(tweet_card_key(tweet_id, like_total))
+
+
+def invalidate_tweet_cards(versions):
+    cache.delete_many([tweet_card_key(tweet_id, like_total) for tweet_id, like_total in versions])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tweets.models import Tweet, TweetLike, TweetLikeCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute Tweet.like_count from TweetLike and clear the sharded counters."
+
+    def handle(self, *args, **options):
+        like_count = (
+            TweetLike.objects.filter(tweet=OuterRef("pk")).values("tweet").annotate(total=Count("*")).values("total")
+        )
+        with transaction.atomic():
+            updated = Tweet.objects.update(like_count=Coalesce(Subquery(like_count), 0))
+            TweetLikeCounter.objects.all().delete()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt like counts for {updated} tweets."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of tweets from the tweets table."
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('rebuild')")
+            cursor.execute("INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('optimize')")
+            cursor.execute("SELECT COUNT(*) FROM tweets_tweet_fts_docsize")
+            (indexed,) = cursor.fetchone()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index for {indexed} tweets."))
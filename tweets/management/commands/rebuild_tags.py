@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from tweets.models import TagCount, Tweet, TweetMention, TweetTag
+from tweets.tags import TRENDING_KEY, bucket_of, index_tweets
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hashtag and mention indexes and the trending counts from tweet contents, "
+        "committing every --batch-size tweets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        # Only tweets still in the trending window are counted.
+        oldest = bucket_of(time.time()) - settings.TRENDING["WINDOW_BUCKETS"]
+        with transaction.atomic():
+            TweetTag.objects.all().delete()
+            TweetMention.objects.all().delete()
+            TagCount.objects.all().delete()
+            # Tweets written after this are indexed as they are created.
+            last = Tweet.objects.aggregate(last=Max("pk"))["last"] or 0
+        indexed, after = 0, 0
+        while True:
+            batch = list(
+                Tweet.objects.filter(pk__gt=after, pk__lte=last)
+                .order_by("pk")
+                .only("content", "created_at")[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                index_tweets(batch, oldest, batch_size)
+            indexed += len(batch)
+            after = batch[-1].pk
+        cache.delete(TRENDING_KEY)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt hashtags and mentions of {indexed} tweets."))
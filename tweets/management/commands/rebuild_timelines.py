@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import User
+from tweets.models import TimelineEntry
+from tweets.timeline import backfill_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild every materialized home timeline from the follow graph."
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        for user in User.objects.only("pk").iterator():
+            with transaction.atomic():
+                TimelineEntry.objects.filter(owner=user).delete()
+                backfill_timeline(user, user)
+                # is_pulled_author() reads follower_count of every followed user.
+                for following in User.objects.filter(following__follower=user).only("pk", "follower_count"):
+                    backfill_timeline(user, following)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines."))
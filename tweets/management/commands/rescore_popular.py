@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tweets.popular import rescore
+
+
+class Command(BaseCommand):
+    help = "Recompute the decayed like scores of recent tweets and keep the best POPULAR['MAX_TWEETS']."
+
+    def handle(self, *args, **options):
+        scored = rescore()
+        self.stdout.write(self.style.SUCCESS(f"Rescored {scored} popular tweets."))
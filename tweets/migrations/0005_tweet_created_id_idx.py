@@ -0,0 +1,16 @@
+# Generated by Django 4.1.13 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0004_tweetlike_tweetlike_unique_like"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(fields=["-created_at", "-id"], name="tweet_created_id_idx"),
+        ),
+    ]
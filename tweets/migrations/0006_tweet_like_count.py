@@ -0,0 +1,50 @@
+# Generated by Django 4.1.13 on 2026-10-16 23:27
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_like_count(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    TweetLike = apps.get_model("tweets", "TweetLike")
+    like_count = (
+        TweetLike.objects.filter(tweet=models.OuterRef("pk"))
+        .values("tweet")
+        .annotate(total=models.Count("*"))
+        .values("total")
+    )
+    Tweet.objects.update(like_count=Coalesce(models.Subquery(like_count), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0005_tweet_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="TweetLikeCounter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("slot", models.PositiveSmallIntegerField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="like_counters", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="tweetlikecounter",
+            constraint=models.UniqueConstraint(fields=("tweet", "slot"), name="unique_like_counter_slot"),
+        ),
+    ]
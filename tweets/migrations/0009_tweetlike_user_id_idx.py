@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-17 00:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0008_tweet_user_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tweetlike",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="liked_user",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweetlike",
+            index=models.Index(fields=["user", "id"], name="tweetlike_user_id_idx"),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# An external-content FTS5 index over Tweet.title and Tweet.content. The
+# trigram tokenizer needs no word boundaries, so Japanese text is searchable
+# by any substring of three or more characters. Triggers keep it in sync with
+# every write, including bulk_create and queryset updates; the UPDATE trigger
+# only fires when title or content is written, not on like count updates.
+# Rebuild it with "manage.py rebuild_search_index".
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE tweets_tweet_fts USING fts5(
+        title, content, content='tweets_tweet', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(tweets_tweet_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_update AFTER UPDATE OF title, content ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(tweets_tweet_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO tweets_tweet_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    "INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER tweets_tweet_fts_update",
+    "DROP TRIGGER tweets_tweet_fts_delete",
+    "DROP TRIGGER tweets_tweet_fts_insert",
+    "DROP TABLE tweets_tweet_fts",
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0009_tweetlike_user_id_idx"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FTS, DROP_FTS),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.1.13 on 2026-10-17 00:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0010_tweet_fts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=50)),
+                ("bucket", models.PositiveIntegerField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TweetTag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=50)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="tags", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TweetMention",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="mentions", to="tweets.tweet"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mentioned_in",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="tagcount",
+            constraint=models.UniqueConstraint(fields=("bucket", "tag"), name="unique_tag_count"),
+        ),
+        migrations.AddIndex(
+            model_name="tweettag",
+            index=models.Index(fields=["tag", "-created_at", "-tweet"], name="tweettag_tag_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="tweettag",
+            constraint=models.UniqueConstraint(fields=("tweet", "tag"), name="unique_tweet_tag"),
+        ),
+        migrations.AddIndex(
+            model_name="tweetmention",
+            index=models.Index(fields=["user", "-created_at", "-tweet"], name="mention_user_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="tweetmention",
+            constraint=models.UniqueConstraint(fields=("tweet", "user"), name="unique_tweet_mention"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-17 00:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0011_tags_and_mentions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TweetScore",
+            fields=[
+                (
+                    "tweet",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="tweets.tweet",
+                    ),
+                ),
+                ("score", models.FloatField(default=0)),
+                ("scored_at", models.FloatField()),
+                ("rank", models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="tweetlike",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="tweetscore",
+            index=models.Index(fields=["-rank", "-tweet"], name="tweetscore_rank_idx"),
+        ),
+    ]
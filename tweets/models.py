@@ -1,26 +1,143 @@
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 
 from accounts.models import User
 
 
+class TweetQuerySet(models.QuerySet):
+    def with_like_count(self):
+        shard_total = (
+            TweetLikeCounter.objects.filter(tweet=OuterRef("pk"))
+            .values("tweet")
+            .annotate(total=Sum("count"))
+            .values("total")
+        )
+        return self.annotate(like_total=F("like_count") + Coalesce(Subquery(shard_total), 0))
+
+    def with_liked_by(self, user):
+        # Evaluated per fetched row against unique_like, so only the tweets on
+        # the page are looked at, however many likes the viewer has made.
+        return self.annotate(is_liked=Exists(TweetLike.objects.filter(tweet=OuterRef("pk"), user=user)))
+
+
 class Tweet(models.Model):
     title = models.CharField(max_length=30, null=True)
     content = models.CharField(max_length=150)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    like_count = models.IntegerField(default=0)
+
+    objects = TweetQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="tweet_created_id_idx"),
+            models.Index(fields=["user", "-created_at", "-id"], name="tweet_user_created_id_idx"),
+        ]
 
 
 class TweetLike(models.Model):
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="liked_tweet")
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="liked_user")
+    # Indexed by tweetlike_user_id_idx, which also keeps the export's keyset order.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="liked_user", db_index=False)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["tweet", "user"], name="unique_like"),
         ]
+        indexes = [
+            models.Index(fields=["user", "id"], name="tweetlike_user_id_idx"),
+        ]
+
+
+class TweetLikeCounter(models.Model):
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="like_counters")
+    slot = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "slot"], name="unique_like_counter_slot"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline_entries")
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "tweet"], name="unique_timeline_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-tweet"], name="timeline_owner_created_idx"),
+        ]
+
+
+class TweetTag(models.Model):
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="tags")
+    tag = models.CharField(max_length=50)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "tag"], name="unique_tweet_tag"),
+        ]
+        indexes = [
+            models.Index(fields=["tag", "-created_at", "-tweet"], name="tweettag_tag_created_idx"),
+        ]
+
+
+class TweetMention(models.Model):
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="mentioned_in", db_index=False)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "user"], name="unique_tweet_mention"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-tweet"], name="mention_user_created_idx"),
+        ]
+
+
+class TagCount(models.Model):
+    """Uses of ``tag`` in the tweets created during one time bucket (see tags.py)."""
+
+    tag = models.CharField(max_length=50)
+    bucket = models.PositiveIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["bucket", "tag"], name="unique_tag_count"),
+        ]
+
+
+class TweetScore(models.Model):
+    """
+    Time-decayed like score of a recent tweet (see popular.py).
+
+    ``score`` is the decayed like mass as of ``scored_at`` (epoch seconds).
+    ``rank`` is the same score moved to a fixed epoch in log2 units, which does
+    not change as time passes, so ordering by it orders by the current score.
+    """
+
+    tweet = models.OneToOneField(Tweet, on_delete=models.CASCADE, primary_key=True, related_name="popularity")
+    score = models.FloatField(default=0)
+    scored_at = models.FloatField()
+    rank = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-rank", "-tweet"], name="tweetscore_rank_idx"),
+        ]
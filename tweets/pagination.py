@@ -0,0 +1,106 @@
+import base64
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    payload = json.dumps([str(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, fields):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw, list) or len(raw) != len(fields):
+            raise ValueError
+        return [field.to_python(value) for field, value in zip(fields, raw)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest("invalid cursor")
+
+
+def _seek(keys, values, lookup):
+    # (k1, k2) < (v1, v2)  ==>  k1 < v1 OR (k1 = v1 AND k2 < v2)
+    condition = Q()
+    for i, key in enumerate(keys):
+        clause = Q(**{f"{key}__{lookup}": values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            clause &= Q(**{prev_key: prev_value})
+        condition |= clause
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, keys, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # Cursors are taken from the rows themselves, so object_list may later
+        # be swapped for the objects those rows point at.
+        self.next_cursor = self.previous_cursor = None
+        if object_list and has_next:
+            self.next_cursor = encode_cursor(getattr(object_list[-1], key) for key in keys)
+        if object_list and has_previous:
+            self.previous_cursor = encode_cursor(getattr(object_list[0], key) for key in keys)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+def keyset_slice(queryset, keys, limit, before=None, after=None):
+    """
+    Up to ``limit`` rows of ``queryset`` past the cursor, nearest first.
+
+    ``before`` walks towards older rows (descending ``keys``), ``after`` back
+    towards newer ones (ascending). Either way it is a single
+    ``WHERE (keys) < cursor LIMIT n`` seek, so the cost does not depend on how
+    deep the cursor is.
+    """
+    fields = [queryset.model._meta.get_field(key) for key in keys]
+    if after is not None:
+        values = decode_cursor(after, fields)
+        return list(queryset.filter(_seek(keys, values, "gt")).order_by(*keys)[:limit])
+    if before is not None:
+        queryset = queryset.filter(_seek(keys, decode_cursor(before, fields), "lt"))
+    return list(queryset.order_by(*(f"-{key}" for key in keys))[:limit])
+
+
+def page_from_slice(rows, keys, per_page, before=None, after=None):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if after is not None:
+        return KeysetPage(rows[::-1], keys, has_next=True, has_previous=has_more)
+    return KeysetPage(rows, keys, has_next=has_more, has_previous=before is not None)
+
+
+def paginate_keyset(queryset, keys, per_page, before=None, after=None):
+    rows = keyset_slice(queryset, keys, per_page + 1, before=before, after=after)
+    return page_from_slice(rows, keys, per_page, before=before, after=after)
+
+
+class KeysetPaginationMixin:
+    keyset_keys = ("created_at", "id")
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(
+            queryset,
+            self.keyset_keys,
+            page_size,
+            before=self.request.GET.get("before"),
+            after=self.request.GET.get("after"),
+        )
+        return None, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,99 @@
+import datetime
+import math
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Log, Power
+
+from .models import TweetScore
+
+# Ranks are counted in half-lives from this fixed point (2026-01-01 UTC).
+EPOCH = 1767225600
+# A like and its unlike rarely cancel exactly in floating point, and log2()
+# needs a positive score, so what is left is clamped to this.
+MIN_SCORE = 1e-6
+# Every like of the tweets created in the window, decayed to now. julianday()
+# reads the stored UTC datetimes; 2440587.5 is the Julian day of 1970-01-01.
+SCORES_SQL = """
+SELECT l.tweet_id, SUM(POWER(2, ((julianday(l.created_at) - 2440587.5) * 86400 - %s) / %s)) AS score
+FROM tweets_tweet t JOIN tweets_tweetlike l ON l.tweet_id = t.id
+WHERE t.created_at >= %s
+GROUP BY l.tweet_id
+ORDER BY score DESC
+LIMIT %s
+"""
+
+
+def half_life():
+    return settings.POPULAR["HALF_LIFE_HOURS"] * 3600
+
+
+def like_weight(liked_at, now):
+    # What a like made at liked_at still adds to a score taken at now.
+    return 2 ** ((liked_at.timestamp() - now) / half_life())
+
+
+def is_recent(tweet, now):
+    return tweet.created_at.timestamp() >= now - settings.POPULAR["WINDOW_HOURS"] * 3600
+
+
+def change_scores(tweets, weights, now=None):
+    """
+    Add ``weights`` (tweet id -> like weight at ``now``) to the decayed scores
+    of ``tweets`` (tweet id -> Tweet) with one UPDATE.
+
+    Each score is first decayed from its ``scored_at`` to ``now``. Tweets
+    without a score row get one when they are still in the window and gained
+    weight; anything else is left for the next ``rescore()``.
+    """
+    now = time.time() if now is None else now
+    weights = {tweet_id: weight for tweet_id, weight in weights.items() if weight}
+    if not weights:
+        return
+    new = [tweet_id for tweet_id, weight in weights.items() if weight > 0 and is_recent(tweets[tweet_id], now)]
+    if new:
+        TweetScore.objects.bulk_create(
+            [TweetScore(tweet_id=tweet_id, scored_at=now, rank=0) for tweet_id in new], ignore_conflicts=True
+        )
+    weight = Case(
+        *(When(pk=tweet_id, then=Value(w)) for tweet_id, w in weights.items()),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    score = Greatest(F("score") * Power(2, (F("scored_at") - now) / half_life()) + weight, Value(MIN_SCORE))
+    TweetScore.objects.filter(pk__in=weights).update(
+        score=score, scored_at=now, rank=Log(2, score) + (now - EPOCH) / half_life()
+    )
+
+
+def rescore(now=None):
+    """
+    Recompute the scores of the tweets created in the last ``WINDOW_HOURS``
+    from their likes and keep the ``MAX_TWEETS`` best, dropping every other
+    row. Returns how many tweets were scored.
+
+    Between runs like and unlike events keep the scores current, so this only
+    has to run often enough to bound the table and drop tweets that left the
+    window. The scores are read outside any transaction and swapped in with a
+    short write, so the window-wide aggregate never holds the write lock; a
+    like made in between is counted again by the next run.
+    """
+    now = time.time() if now is None else now
+    options = settings.POPULAR
+    since = datetime.datetime.fromtimestamp(now - options["WINDOW_HOURS"] * 3600, tz=datetime.timezone.utc)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SCORES_SQL, [now, half_life(), connection.ops.adapt_datetimefield_value(since), options["MAX_TWEETS"]]
+        )
+        scores = cursor.fetchall()
+    offset = (now - EPOCH) / half_life()
+    rows = [
+        TweetScore(tweet_id=tweet_id, score=score, scored_at=now, rank=math.log2(score) + offset)
+        for tweet_id, score in scores
+    ]
+    with transaction.atomic():
+        TweetScore.objects.all().delete()
+        TweetScore.objects.bulk_create(rows)
+    return len(rows)
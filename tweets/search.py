@@ -0,0 +1,84 @@
+from django.db.models import FloatField, IntegerField, Q
+
+from .models import Tweet
+from .pagination import KeysetPage, decode_cursor, keyset_slice, page_from_slice
+
+# The trigram tokenizer indexes every run of three characters. Shorter terms,
+# common in Japanese, have no trigram of their own and are matched with LIKE.
+TRIGRAM_LENGTH = 3
+RANK_KEYS = ("score", "id")
+RANK_FIELDS = [FloatField(), IntegerField()]
+RECENCY_KEYS = ("created_at", "id")
+# bm25() weights of the title and content columns.
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+# Ranking has to score every match, so a term found in a fifth of all tweets
+# costs as much as a table scan. Only the newest RANKED_MATCHES matches are
+# ranked; the rowid floor they set is applied by FTS5 while it walks the index.
+RANKED_MATCHES = 10000
+
+
+def _phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _like_filters(unindexed):
+    sql = " ".join("AND (t.title LIKE %s ESCAPE '\\' OR t.content LIKE %s ESCAPE '\\')" for _ in unindexed)
+    return sql, [pattern for term in unindexed for pattern in [_like_pattern(term)] * 2]
+
+
+def _ranked_rows(indexed, unindexed, limit, cursor):
+    # The short terms filter the newest matches that set the rowid floor as
+    # well, or older tweets matching every term could fall below it.
+    join = "JOIN tweets_tweet t ON t.id = tweets_tweet_fts.rowid" if unindexed else ""
+    likes, like_params = _like_filters(unindexed)
+    sql = [
+        "SELECT tweets_tweet_fts.rowid AS id, bm25(tweets_tweet_fts, %s, %s) AS score FROM tweets_tweet_fts",
+        join,
+        "WHERE tweets_tweet_fts MATCH %s",
+        "AND tweets_tweet_fts.rowid >= (SELECT MIN(rowid) FROM (",
+        f"SELECT tweets_tweet_fts.rowid FROM tweets_tweet_fts {join} WHERE tweets_tweet_fts MATCH %s {likes}",
+        "ORDER BY tweets_tweet_fts.rowid DESC LIMIT %s",
+        "))",
+        likes,
+    ]
+    match = " ".join(_phrase(term) for term in indexed)
+    params = [TITLE_WEIGHT, CONTENT_WEIGHT, match, match, *like_params, RANKED_MATCHES, *like_params]
+    if cursor is not None:
+        score, tweet_id = decode_cursor(cursor, RANK_FIELDS)
+        sql.append("AND (score > %s OR (score = %s AND tweets_tweet_fts.rowid > %s))")
+        params += [score, score, tweet_id]
+    sql.append("ORDER BY score, tweets_tweet_fts.rowid LIMIT %s")
+    params.append(limit)
+    return list(Tweet.objects.raw(" ".join(sql), params))
+
+
+def search_tweets(text, per_page, cursor=None):
+    """
+    One page of the tweets matching every whitespace-separated term of
+    ``text``, as rows with the tweet ``id``.
+
+    With at least one term of three or more characters the FTS5 index finds
+    the matches, ranked by BM25 with the title weighted over the content and
+    paged by a ``(score, id)`` cursor; shorter terms only filter those
+    matches. Only the newest ``RANKED_MATCHES`` matches of all the terms are
+    ranked. Queries made only of short terms cannot use the index and fall
+    back to a LIKE scan in ``created_at`` order, newest first.
+    """
+    terms = text.split()
+    indexed = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+    unindexed = [term for term in terms if len(term) < TRIGRAM_LENGTH]
+    if not terms:
+        return KeysetPage([], RANK_KEYS, has_next=False, has_previous=False)
+    if not indexed:
+        queryset = Tweet.objects.filter(
+            *(Q(title__icontains=term) | Q(content__icontains=term) for term in unindexed)
+        ).only("created_at")
+        rows = keyset_slice(queryset, RECENCY_KEYS, per_page + 1, before=cursor)
+        return page_from_slice(rows, RECENCY_KEYS, per_page, before=cursor)
+    rows = _ranked_rows(indexed, unindexed, per_page + 1, cursor)
+    return KeysetPage(rows[:per_page], RANK_KEYS, has_next=len(rows) > per_page, has_previous=cursor is not None)
@@ -0,0 +1,114 @@
+import random
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from .models import Tweet, TweetLike, TweetLikeCounter
+from .popular import change_scores, like_weight
+from .versions import bump_like_versions
+
+
+def _change_sharded_like_count(tweet_id, delta):
+    # Popular tweets spread their writes over several counter rows so that
+    # concurrent likes do not all queue up on the same Tweet row.
+    slot = random.randrange(settings.TWEET_LIKE_SHARD_SLOTS)
+    counters = TweetLikeCounter.objects.filter(tweet_id=tweet_id, slot=slot)
+    if not counters.update(count=F("count") + delta):
+        TweetLikeCounter.objects.bulk_create([TweetLikeCounter(tweet_id=tweet_id, slot=slot)], ignore_conflicts=True)
+        counters.update(count=F("count") + delta)
+
+
+def change_like_count(tweet, delta):
+    if tweet.like_count < settings.TWEET_LIKE_SHARD_THRESHOLD:
+        Tweet.objects.filter(pk=tweet.pk).update(like_count=F("like_count") + delta)
+    else:
+        _change_sharded_like_count(tweet.pk, delta)
+    bump_like_versions([(tweet.pk, tweet.user_id)])
+
+
+def change_like_counts(tweets, deltas):
+    direct = {}
+    for tweet_id, delta in deltas.items():
+        if not delta:
+            continue
+        if tweets[tweet_id].like_count < settings.TWEET_LIKE_SHARD_THRESHOLD:
+            direct[tweet_id] = delta
+        else:
+            _change_sharded_like_count(tweet_id, delta)
+    if direct:
+        delta = Case(*(When(pk=tweet_id, then=Value(d)) for tweet_id, d in direct.items()), default=Value(0))
+        Tweet.objects.filter(pk__in=direct).update(like_count=F("like_count") + delta)
+    bump_like_versions((tweet_id, tweets[tweet_id].user_id) for tweet_id, delta in deltas.items() if delta)
+
+
+def get_like_count(tweet_id):
+    return Tweet.objects.with_like_count().values_list("like_total", flat=True).get(pk=tweet_id)
+
+
+def like_tweet(user, tweet):
+    with transaction.atomic():
+        _, created = TweetLike.objects.get_or_create(tweet=tweet, user=user)
+        if created:
+            change_like_count(tweet, 1)
+            change_scores({tweet.pk: tweet}, {tweet.pk: 1.0})
+    return created
+
+
+def unlike_tweet(user, tweet):
+    with transaction.atomic():
+        likes = TweetLike.objects.filter(tweet=tweet, user=user)
+        liked_at = list(likes.values_list("created_at", flat=True))
+        deleted, _ = likes.delete()
+        if deleted:
+            now = time.time()
+            change_like_count(tweet, -1)
+            change_scores({tweet.pk: tweet}, {tweet.pk: -like_weight(liked_at[0], now)}, now)
+    return bool(deleted)
+
+
+def apply_like_changes(changes):
+    """
+    Bring every ``(user_id, tweet_id)`` in ``changes`` to the wanted liked
+    state (``True``/``False``) with one bulk insert and one bulk delete.
+
+    Pairs whose tweet does not exist are ignored. Returns how much the like
+    count of each tweet that was found changed.
+    """
+    tweets = Tweet.objects.only("like_count", "user_id", "created_at").in_bulk({tweet_id for _, tweet_id in changes})
+    changes = {key: liked for key, liked in changes.items() if key[1] in tweets}
+    if not changes:
+        return {}
+    with transaction.atomic():
+        existing = {
+            (user_id, tweet_id): liked_at
+            for user_id, tweet_id, liked_at in TweetLike.objects.filter(
+                user_id__in={user_id for user_id, _ in changes}, tweet_id__in={tweet_id for _, tweet_id in changes}
+            ).values_list("user_id", "tweet_id", "created_at")
+        }
+        to_create = [key for key, liked in changes.items() if liked and key not in existing]
+        to_delete = [key for key, liked in changes.items() if not liked and key in existing]
+        TweetLike.objects.bulk_create(
+            [TweetLike(user_id=user_id, tweet_id=tweet_id) for user_id, tweet_id in to_create], ignore_conflicts=True
+        )
+        if to_delete:
+            by_user = defaultdict(list)
+            for user_id, tweet_id in to_delete:
+                by_user[user_id].append(tweet_id)
+            condition = Q()
+            for user_id, tweet_ids in by_user.items():
+                condition |= Q(user_id=user_id, tweet_id__in=tweet_ids)
+            TweetLike.objects.filter(condition).delete()
+        deltas = Counter(tweet_id for _, tweet_id in to_create)
+        deltas.subtract(tweet_id for _, tweet_id in to_delete)
+        change_like_counts(tweets, deltas)
+        now = time.time()
+        weights = Counter()
+        for _, tweet_id in to_create:
+            weights[tweet_id] += 1.0
+        for key in to_delete:
+            weights[key[1]] -= like_weight(existing[key], now)
+        change_scores(tweets, weights, now)
+    return {tweet_id: deltas[tweet_id] for _, tweet_id in changes}
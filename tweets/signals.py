@@ -0,0 +1,13 @@
+from django.db.models import F
+
+from .models import Tweet
+from .versions import TWEET_DELETES_KEY, bump_like_versions, bump_versions
+
+
+def discount_likes_of_deleted_user(sender, instance, **kwargs):
+    # The user's TweetLike rows are about to be removed by the cascade.
+    liked = Tweet.objects.filter(liked_tweet__user=instance)
+    bump_like_versions(liked.values_list("id", "user_id"))
+    liked.update(like_count=F("like_count") - 1)
+    # So are the user's tweets, from every timeline and profile.
+    bump_versions([TWEET_DELETES_KEY])
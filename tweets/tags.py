@@ -0,0 +1,152 @@
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, Value, When
+
+from accounts.models import User
+
+from .models import TagCount, TweetMention, TweetTag
+
+HASHTAG = re.compile(r"(?<![\w#＃])[#＃](\w+)")
+MENTION = re.compile(r"(?<![\w@])@(\w[\w.+-]*)")
+TRENDING_KEY = "trending_tags"
+MAX_TAG_LENGTH = TweetTag._meta.get_field("tag").max_length
+
+
+def normalize_tag(tag):
+    # Full-width and half-width forms, and upper and lower case, are one tag.
+    return unicodedata.normalize("NFKC", tag).casefold()[:MAX_TAG_LENGTH]
+
+
+def extract_tags(text):
+    return list(dict.fromkeys(normalize_tag(tag) for tag in HASHTAG.findall(text)))
+
+
+def extract_mentions(text):
+    return list(dict.fromkeys(username.rstrip(".") for username in MENTION.findall(text)))
+
+
+def bucket_of(timestamp):
+    return int(timestamp // settings.TRENDING["BUCKET_SECONDS"])
+
+
+def _change_tag_counts(tags, bucket, delta):
+    if delta > 0:
+        TagCount.objects.bulk_create([TagCount(tag=tag, bucket=bucket) for tag in tags], ignore_conflicts=True)
+    TagCount.objects.filter(bucket=bucket, tag__in=tags).update(count=F("count") + delta)
+
+
+def _add_tag_counts(counts, batch_size):
+    # counts: (bucket, tag) -> uses. One UPDATE per bucket and batch of tags.
+    by_bucket = defaultdict(list)
+    for (bucket, tag), uses in counts.items():
+        by_bucket[bucket].append((tag, uses))
+    for bucket, tag_uses in by_bucket.items():
+        for start in range(0, len(tag_uses), batch_size):
+            batch = dict(tag_uses[start : start + batch_size])
+            TagCount.objects.bulk_create([TagCount(tag=tag, bucket=bucket) for tag in batch], ignore_conflicts=True)
+            uses = Case(
+                *(When(tag=tag, then=Value(n)) for tag, n in batch.items()),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            TagCount.objects.filter(bucket=bucket, tag__in=batch).update(count=F("count") + uses)
+
+
+def _prune_tag_counts(bucket):
+    # The first write of every bucket drops the buckets that have left the window.
+    options = settings.TRENDING
+    if cache.add(f"tag_counts_pruned:{bucket}", True, options["BUCKET_SECONDS"]):
+        TagCount.objects.filter(bucket__lt=bucket - options["WINDOW_BUCKETS"]).delete()
+
+
+def index_tweet(tweet, count=True):
+    """Record the hashtags and mentions of a new tweet and, with ``count``, count its hashtags as trending."""
+    tags = extract_tags(tweet.content)
+    usernames = extract_mentions(tweet.content)
+    if tags:
+        TweetTag.objects.bulk_create(TweetTag(tweet=tweet, tag=tag, created_at=tweet.created_at) for tag in tags)
+    if tags and count:
+        bucket = bucket_of(tweet.created_at.timestamp())
+        _change_tag_counts(tags, bucket, 1)
+        _prune_tag_counts(bucket)
+    if usernames:
+        TweetMention.objects.bulk_create(
+            TweetMention(tweet=tweet, user_id=user_id, created_at=tweet.created_at)
+            for user_id in User.objects.filter(username__in=usernames).values_list("pk", flat=True)
+        )
+
+
+def index_tweets(tweets, oldest_bucket, batch_size=1000):
+    """
+    Bulk form of ``index_tweet()`` for rebuilding the indexes: record the
+    hashtags and mentions of ``tweets`` and count the hashtags of those
+    created since ``oldest_bucket``, with a fixed number of queries per batch.
+    Rows already present, such as those of tweets indexed as they were
+    written, are left alone.
+    """
+    tags, mentions, counts = [], [], Counter()
+    for tweet in tweets:
+        bucket = bucket_of(tweet.created_at.timestamp())
+        for tag in extract_tags(tweet.content):
+            tags.append(TweetTag(tweet=tweet, tag=tag, created_at=tweet.created_at))
+            if bucket >= oldest_bucket:
+                counts[bucket, tag] += 1
+        mentions += [(tweet, username) for username in extract_mentions(tweet.content)]
+    TweetTag.objects.bulk_create(tags, batch_size=batch_size, ignore_conflicts=True)
+    user_ids = dict(
+        User.objects.filter(username__in={username for _, username in mentions}).values_list("username", "pk")
+    )
+    TweetMention.objects.bulk_create(
+        [
+            TweetMention(tweet=tweet, user_id=user_ids[username], created_at=tweet.created_at)
+            for tweet, username in mentions
+            if username in user_ids
+        ],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    _add_tag_counts(counts, batch_size)
+
+
+def unindex_tweet(tweet):
+    """Take a tweet that is about to be deleted out of the trending counts."""
+    bucket = bucket_of(tweet.created_at.timestamp())
+    # Its bucket may already be pruned, and must not come back holding -1.
+    if bucket < bucket_of(time.time()) - settings.TRENDING["WINDOW_BUCKETS"]:
+        return
+    tags = list(tweet.tags.values_list("tag", flat=True))
+    if tags:
+        _change_tag_counts(tags, bucket, -1)
+
+
+def trending_tags(now=None):
+    """
+    The most used hashtags of the last ``WINDOW_BUCKETS`` buckets as
+    ``(tag, count)`` pairs, most used first.
+
+    Counts are kept per ``BUCKET_SECONDS`` bucket and updated as tweets are
+    written, so this only reads the rows of the buckets in the window. The
+    oldest bucket is partly outside the window and is weighted by the share
+    of it still inside, which makes the window slide smoothly rather than
+    jump from bucket to bucket. Unless ``now`` is given, the result is cached
+    for ``CACHE_SECONDS``.
+    """
+    if now is None:
+        trending = cache.get(TRENDING_KEY)
+        if trending is None:
+            trending = trending_tags(time.time())
+            cache.set(TRENDING_KEY, trending, settings.TRENDING["CACHE_SECONDS"])
+        return trending
+    options = settings.TRENDING
+    current = bucket_of(now)
+    oldest = current - options["WINDOW_BUCKETS"]
+    oldest_weight = 1 - (now % options["BUCKET_SECONDS"]) / options["BUCKET_SECONDS"]
+    totals = Counter()
+    for tag, bucket, count in TagCount.objects.filter(bucket__gte=oldest).values_list("tag", "bucket", "count"):
+        totals[tag] += count * oldest_weight if bucket == oldest else count
+    return [(tag, round(total, 2)) for tag, total in totals.most_common(options["LIMIT"]) if total > 0]
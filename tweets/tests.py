@@ -1,9 +1,39 @@
-from django.test import TestCase
+import datetime
+import math
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncClient, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from accounts.models import User
+from accounts.services import follow_user, unfollow_user
+from perf.budgets import QueryBudgetTestCase
 
-from .models import Tweet, TweetLike
+from .cards import tweet_card_key
+from .models import (
+    TagCount,
+    TimelineEntry,
+    Tweet,
+    TweetLike,
+    TweetLikeCounter,
+    TweetMention,
+    TweetScore,
+    TweetTag,
+)
+from .popular import MIN_SCORE, change_scores, rescore
+from .services import get_like_count
+from .tags import bucket_of, extract_mentions, extract_tags, trending_tags
+from .timeline import push_tweet
+from .writebehind import LikeBuffer, get_like_buffer, stop_like_buffer
 
 
 class TestHomeView(TestCase):
@@ -13,11 +43,176 @@ class TestHomeView(TestCase):
         self.client.login(username="testuser", password="testpassword")
 
     def test_success_get(self):
-        Tweet.objects.create(user=self.user, content="test tweet")
+        push_tweet(Tweet.objects.create(user=self.user, content="test tweet"))
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertQuerysetEqual(response.context["object_list"], Tweet.objects.all())
 
+    def test_success_get_with_followed_user(self):
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        push_tweet(Tweet.objects.create(user=user2, content="before follow"))
+        follow_user(self.user, user2)
+        push_tweet(Tweet.objects.create(user=user2, content="after follow"))
+        push_tweet(Tweet.objects.create(user=user3, content="not followed"))
+
+        response = self.client.get(self.url)
+        self.assertQuerysetEqual(response.context["object_list"], Tweet.objects.filter(user=user2))
+
+        unfollow_user(self.user, user2)
+        response = self.client.get(self.url)
+        self.assertQuerysetEqual(response.context["object_list"], [])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_success_get_with_pulled_author(self):
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        follow_user(self.user, user2)
+        user2.refresh_from_db()
+        tweets = [Tweet.objects.create(user=user2, content=f"tweet{i}") for i in range(3)]
+        for tweet in tweets:
+            push_tweet(tweet)
+        push_tweet(Tweet.objects.create(user=self.user, content="own tweet"))
+        # An entry fanned out before user2 crossed the threshold.
+        TimelineEntry.objects.create(owner=self.user, tweet=tweets[0], author=user2, created_at=tweets[0].created_at)
+
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.user, author=user2).count(), 1)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["object_list"]), list(Tweet.objects.order_by("-created_at", "-id")))
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_success_get_after_author_falls_below_threshold(self):
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        follow_user(self.user, user2)
+        follow_user(user3, user2)
+        user2.refresh_from_db()
+        tweets = [Tweet.objects.create(user=user2, content=f"tweet{i}") for i in range(3)]
+        for tweet in tweets:
+            push_tweet(tweet)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user).exists())
+
+        unfollow_user(user3, user2)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.user, author=user2).count(), 3)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["object_list"]), list(Tweet.objects.order_by("-created_at", "-id")))
+
+    def test_rebuild_command(self):
+        users = [User.objects.create_user(username=f"author{i}", password="testpassword") for i in range(3)]
+        for user in users:
+            follow_user(self.user, user)
+            push_tweet(Tweet.objects.create(user=user, content=f"by {user.username}"))
+        TimelineEntry.objects.all().delete()
+        with mock.patch.object(User, "refresh_from_db", side_effect=AssertionError("deferred field loaded")):
+            call_command("rebuild_timelines", stdout=StringIO())
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["object_list"]), list(Tweet.objects.order_by("-created_at", "-id")))
+
+    def test_success_get_with_liked_state(self):
+        liked = Tweet.objects.create(user=self.user, content="liked")
+        not_liked = Tweet.objects.create(user=self.user, content="not liked")
+        push_tweet(liked)
+        push_tweet(not_liked)
+        TweetLike.objects.create(tweet=liked, user=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            {t.content: t.is_liked for t in response.context["object_list"]}, {"liked": True, "not liked": False}
+        )
+
+    def test_success_get_with_cursor(self):
+        for i in range(25):
+            push_tweet(Tweet.objects.create(user=self.user, content=f"tweet{i}"))
+        tweets = list(Tweet.objects.order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        page = response.context["page_obj"]
+        self.assertEqual(list(response.context["object_list"]), tweets[:20])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+        response = self.client.get(self.url, {"before": page.next_cursor})
+        page = response.context["page_obj"]
+        self.assertEqual(list(response.context["object_list"]), tweets[20:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+        response = self.client.get(self.url, {"after": page.previous_cursor})
+        self.assertEqual(list(response.context["object_list"]), tweets[:20])
+        self.assertFalse(response.context["page_obj"].has_previous())
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"before": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        follow_user(self.user, self.user2)
+        self.tweet = Tweet.objects.create(user=self.user2, content="tweet")
+        push_tweet(self.tweet)
+        self.home_url = reverse("tweets:home")
+        self.detail_url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def revalidate(self, url):
+        etag = self.client.get(url)["ETag"]
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified_skips_main_query(self):
+        for url in [self.home_url, self.detail_url]:
+            etag = self.client.get(url)["ETag"]
+            # The session and user lookups, then the validator itself.
+            with self.assertNumQueries(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.templates, [])
+
+    def test_new_tweet_changes_home_etag(self):
+        etag = self.client.get(self.home_url)["ETag"]
+        push_tweet(Tweet.objects.create(user=self.user2, content="newer"))
+        response = self.client.get(self.home_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pulled_author_tweet_changes_home_etag(self):
+        User.objects.filter(pk=self.user2.pk).update(follower_count=10)
+        with self.settings(TIMELINE_FANOUT_THRESHOLD=5):
+            etag = self.client.get(self.home_url)["ETag"]
+            Tweet.objects.create(user=self.user2, content="not pushed")
+            response = self.client.get(self.home_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_like_changes_etags(self):
+        home_etag = self.client.get(self.home_url)["ETag"]
+        detail_etag = self.client.get(self.detail_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.client.get(self.home_url, HTTP_IF_NONE_MATCH=home_etag).status_code, 200)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_follow_changes_home_etag(self):
+        etag = self.client.get(self.home_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            unfollow_user(self.user, self.user2)
+        self.assertEqual(self.client.get(self.home_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleted_tweet(self):
+        etag = self.client.get(self.home_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tweet.delete()
+            self.client.post(reverse("tweets:delete", kwargs={"pk": Tweet.objects.create(user=self.user).pk}))
+        self.assertEqual(self.client.get(self.home_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_etag_depends_on_viewer(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        self.client.force_login(self.user2)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
 
 class TestTweetCreateView(TestCase):
     def setUp(self):
@@ -31,9 +226,15 @@ class TestTweetCreateView(TestCase):
 
     def test_success_post(self):
         test_tweet = {"title": "test", "content": "testtweet"}
+        follower = User.objects.create_user(username="follower", password="testpassword")
+        follow_user(follower, self.user)
         response = self.client.post(self.url, test_tweet)
         self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
-        self.assertTrue(Tweet.objects.filter(content=test_tweet["content"]).exists())
+        tweet = Tweet.objects.get(content=test_tweet["content"])
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(tweet=tweet).values_list("owner", flat=True)),
+            {self.user.pk, follower.pk},
+        )
 
     def test_failure_post_with_empty_content(self):
         empty_tweet = {"title": "test", "content": ""}
@@ -68,6 +269,341 @@ class TestTweetDetailView(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context["tweet"], self.tweet)
+        self.assertFalse(response.context["tweet"].is_liked)
+
+    def test_success_get_with_liked_tweet(self):
+        TweetLike.objects.create(tweet=self.tweet, user=self.user)
+        response = self.client.get(self.url)
+        self.assertTrue(response.context["tweet"].is_liked)
+
+
+class TestTweetSearchView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:search")
+        self.tower = Tweet.objects.create(user=self.user, title="旅行", content="東京タワーに行きました")
+        self.ramen = Tweet.objects.create(user=self.user, title="東京タワー", content="ラーメンを食べました")
+        self.castle = Tweet.objects.create(user=self.user, title="旅行", content="大阪城と通天閣")
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_japanese_substring(self):
+        response = self.search("タワー")
+        # The title is weighted over the content.
+        self.assertEqual(response.context["tweets"], [self.ramen, self.tower])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search("タワー 行きました").context["tweets"], [self.tower])
+        self.assertEqual(self.search("TOKYO").context["tweets"], [])
+
+    def test_short_terms(self):
+        self.assertEqual(self.search("大阪").context["tweets"], [self.castle])
+        self.assertEqual(self.search("タワー 東京 食べ").context["tweets"], [self.ramen])
+
+    def test_quotes_and_operators_are_literal(self):
+        Tweet.objects.create(user=self.user, content='"AND" OR NOT*')
+        self.assertEqual(len(self.search('"AND" OR').context["tweets"]), 1)
+        self.assertEqual(self.search("100%").context["tweets"], [])
+
+    def test_index_follows_updates_and_deletes(self):
+        Tweet.objects.filter(pk=self.tower.pk).update(content="スカイツリーに行きました")
+        self.assertEqual(self.search("タワー").context["tweets"], [self.ramen])
+        self.assertEqual(self.search("スカイツリー").context["tweets"], [Tweet.objects.get(pk=self.tower.pk)])
+        self.ramen.delete()
+        self.assertEqual(self.search("タワー").context["tweets"], [])
+
+    def test_cursor_pagination(self):
+        tweets = Tweet.objects.bulk_create(Tweet(user=self.user, content=f"検索テスト {i}") for i in range(45))
+        seen, cursor = [], None
+        while True:
+            page = self.search("検索テスト", **({"cursor": cursor} if cursor else {})).context["page_obj"]
+            seen += page.object_list
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(set(seen), set(tweets))
+
+    def test_short_term_cursor_pagination(self):
+        Tweet.objects.bulk_create(Tweet(user=self.user, content=f"猫 {i}") for i in range(25))
+        first = self.search("猫").context["page_obj"]
+        second = self.search("猫", cursor=first.next_cursor).context["page_obj"]
+        self.assertEqual(len(first) + len(second), 25)
+        self.assertFalse(second.has_next())
+
+    def test_only_newest_matches_are_ranked(self):
+        with mock.patch("tweets.search.RANKED_MATCHES", 1):
+            self.assertEqual(self.search("タワー").context["tweets"], [self.ramen])
+            self.assertEqual(self.search("行きました").context["tweets"], [self.tower])
+            # Short terms narrow the newest matches too, so older ones still count.
+            self.assertEqual(self.search("タワー 行き").context["tweets"], [self.tower])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"q": "タワー", "cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_query(self):
+        self.assertEqual(self.search("").context["tweets"], [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search("タワー").context["tweets"], [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("3 tweets", out.getvalue())
+        self.assertEqual(len(self.search("タワー").context["tweets"]), 2)
+
+
+class TestTags(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other.user", password="testpassword")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def create(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"title": "title", "content": content})
+        return Tweet.objects.latest("pk")
+
+    def test_extract(self):
+        self.assertEqual(extract_tags("#Django と ＃東京 と #django、a#b #"), ["django", "東京"])
+        self.assertEqual(extract_mentions("@other.user: hi @testuser. mail@example.com"), ["other.user", "testuser"])
+
+    def test_create_indexes_tags_and_mentions(self):
+        tweet = self.create("#Python を @other.user と @nobody に #python")
+        self.assertEqual(list(TweetTag.objects.values_list("tweet", "tag")), [(tweet.pk, "python")])
+        self.assertEqual(list(TweetMention.objects.values_list("tweet", "user")), [(tweet.pk, self.other.pk)])
+        self.assertEqual(TweetTag.objects.get().created_at, tweet.created_at)
+
+    def test_tag_view(self):
+        tweets = [self.create(f"#東京 tweet {i}") for i in range(25)]
+        self.create("#大阪")
+        response = self.client.get(reverse("tweets:tag", kwargs={"tag": "東京"}))
+        self.assertEqual(response.context["tweets"], tweets[:-21:-1])
+        response = self.client.get(
+            reverse("tweets:tag", kwargs={"tag": "東京"}), {"before": response.context["page_obj"].next_cursor}
+        )
+        self.assertEqual(response.context["tweets"], tweets[4::-1])
+
+    def test_tag_view_normalizes(self):
+        tweet = self.create("#Django")
+        response = self.client.get(reverse("tweets:tag", kwargs={"tag": "ＤＪＡＮＧＯ"}))
+        self.assertEqual(response.context["tweets"], [tweet])
+
+    def test_mention_view(self):
+        tweet = self.create("@other.user こんにちは")
+        self.create("@testuser")
+        response = self.client.get(reverse("tweets:mention", kwargs={"username": "other.user"}))
+        self.assertEqual(response.context["tweets"], [tweet])
+        response = self.client.get(reverse("tweets:mention", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_trending(self):
+        for content in ["#a #b", "#a", "#a #c", "#b"]:
+            self.create(content)
+        response = self.client.get(reverse("tweets:trending"))
+        self.assertEqual(
+            [(tag["tag"], tag["count"]) for tag in response.json()["tags"]], [("a", 3), ("b", 2), ("c", 1)]
+        )
+        self.assertEqual(response.json()["tags"][0]["url"], reverse("tweets:tag", kwargs={"tag": "a"}))
+
+    def test_trending_counts_are_incremental(self):
+        self.create("#a")
+        self.create("#a")
+        self.assertEqual(list(TagCount.objects.values_list("tag", "count")), [("a", 2)])
+
+    def test_delete_uncounts(self):
+        tweet = self.create("#a #b")
+        self.client.post(reverse("tweets:delete", kwargs={"pk": tweet.pk}))
+        self.assertFalse(TweetTag.objects.exists())
+        self.assertEqual(trending_tags(time.time()), [])
+
+    def test_delete_after_bucket_pruned(self):
+        tweet = self.create("#a")
+        Tweet.objects.filter(pk=tweet.pk).update(created_at=timezone.now() - datetime.timedelta(days=1))
+        TagCount.objects.all().delete()
+        self.client.post(reverse("tweets:delete", kwargs={"pk": tweet.pk}))
+        self.assertFalse(TagCount.objects.exists())
+
+    @override_settings(TRENDING={"BUCKET_SECONDS": 60, "WINDOW_BUCKETS": 5, "LIMIT": 2, "CACHE_SECONDS": 30})
+    def test_sliding_window(self):
+        TagCount.objects.bulk_create(
+            [
+                TagCount(tag="old", bucket=100, count=10),
+                TagCount(tag="edge", bucket=104, count=2),
+                TagCount(tag="new", bucket=108, count=3),
+                TagCount(tag="newest", bucket=109, count=1),
+            ]
+        )
+        # At the start of bucket 109 the window still covers all of bucket 104.
+        self.assertEqual(trending_tags(109 * 60), [("new", 3), ("edge", 2)])
+        # Three quarters through, a quarter of it is still inside and it counts 0.5.
+        self.assertEqual(trending_tags(109 * 60 + 45), [("new", 3), ("newest", 1)])
+        self.assertEqual(trending_tags(110 * 60), [("new", 3), ("newest", 1)])
+
+    @override_settings(TRENDING={"BUCKET_SECONDS": 60, "WINDOW_BUCKETS": 5, "LIMIT": 10, "CACHE_SECONDS": 30})
+    def test_old_buckets_are_pruned(self):
+        TagCount.objects.create(tag="old", bucket=1, count=10)
+        self.create("#new")
+        self.assertEqual(list(TagCount.objects.values_list("tag", flat=True)), ["new"])
+
+    def test_rebuild_command(self):
+        tweet = self.create("#a @other.user")
+        Tweet.objects.create(user=self.user, content="#b imported")
+        Tweet.objects.create(user=self.user, content="#a #b @nobody")
+        TagCount.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_tags", "--batch-size", "2", stdout=out)
+        self.assertIn("3 tweets", out.getvalue())
+        self.assertEqual(set(TweetTag.objects.values_list("tag", flat=True)), {"a", "b"})
+        self.assertEqual(list(TweetMention.objects.values_list("tweet", flat=True)), [tweet.pk])
+        # Counts from different batches add up.
+        self.assertEqual(trending_tags(time.time()), [("a", 2), ("b", 2)])
+
+
+@override_settings(POPULAR={"HALF_LIFE_HOURS": 1, "WINDOW_HOURS": 24, "MAX_TWEETS": 2})
+class TestPopular(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.others = [User.objects.create_user(username=f"user{i}", password="testpassword") for i in range(3)]
+        self.client.force_login(self.user)
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"tweet {i}") for i in range(3)]
+
+    def like(self, tweet, user, hours_ago):
+        like = TweetLike.objects.create(tweet=tweet, user=user)
+        TweetLike.objects.filter(pk=like.pk).update(created_at=timezone.now() - datetime.timedelta(hours=hours_ago))
+
+    def test_like_and_unlike_update_score(self):
+        tweet = self.tweets[0]
+        self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+        self.assertAlmostEqual(TweetScore.objects.get(tweet=tweet).score, 1.0)
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": tweet.pk}))
+        self.assertAlmostEqual(TweetScore.objects.get(tweet=tweet).score, MIN_SCORE)
+
+    def test_scores_decay(self):
+        tweets = {tweet.pk: tweet for tweet in self.tweets}
+        now = time.time()
+        change_scores(tweets, {self.tweets[0].pk: 1.0, self.tweets[1].pk: 1.0}, now)
+        change_scores(tweets, {self.tweets[1].pk: 1.0}, now + 3600)
+        change_scores(tweets, {self.tweets[0].pk: 1.0}, now + 7200)
+        scores = TweetScore.objects.in_bulk()
+        self.assertAlmostEqual(scores[self.tweets[0].pk].score, 1.25)
+        self.assertAlmostEqual(scores[self.tweets[1].pk].score, 1.5)
+        # 1.5 an hour ago is 0.75 now, less than 1.25.
+        self.assertGreater(scores[self.tweets[0].pk].rank, scores[self.tweets[1].pk].rank)
+        self.assertAlmostEqual(scores[self.tweets[0].pk].rank - scores[self.tweets[1].pk].rank, math.log2(1.25 / 0.75))
+
+    def test_old_tweets_are_not_scored(self):
+        tweet = self.tweets[0]
+        Tweet.objects.filter(pk=tweet.pk).update(created_at=timezone.now() - datetime.timedelta(hours=25))
+        self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+        self.assertFalse(TweetScore.objects.exists())
+
+    def test_like_batch_updates_scores(self):
+        self.like(self.tweets[0], self.user, hours_ago=1)
+        change_scores({self.tweets[0].pk: self.tweets[0]}, {self.tweets[0].pk: 0.5})
+        ops = [{"tweet_id": self.tweets[0].pk, "op": "unlike"}, {"tweet_id": self.tweets[1].pk, "op": "like"}]
+        self.client.post(reverse("tweets:like_batch"), {"ops": ops}, content_type="application/json")
+        scores = TweetScore.objects.in_bulk()
+        self.assertAlmostEqual(scores[self.tweets[0].pk].score, MIN_SCORE)
+        self.assertAlmostEqual(scores[self.tweets[1].pk].score, 1.0)
+
+    def test_rescore(self):
+        self.like(self.tweets[0], self.others[0], hours_ago=0)
+        self.like(self.tweets[1], self.others[0], hours_ago=1)
+        self.like(self.tweets[1], self.others[1], hours_ago=2)
+        self.like(self.tweets[2], self.others[0], hours_ago=3)
+        old = Tweet.objects.create(user=self.user, content="old")
+        Tweet.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(hours=25))
+        self.like(old, self.others[0], hours_ago=0)
+        TweetScore.objects.create(tweet=old, score=100, scored_at=time.time(), rank=100)
+
+        self.assertEqual(rescore(), 2)
+        scores = TweetScore.objects.in_bulk()
+        # Only the MAX_TWEETS best tweets of the window are kept.
+        self.assertEqual(set(scores), {self.tweets[0].pk, self.tweets[1].pk})
+        self.assertAlmostEqual(scores[self.tweets[0].pk].score, 1.0, places=3)
+        self.assertAlmostEqual(scores[self.tweets[1].pk].score, 0.75, places=3)
+
+    def test_rescore_agrees_with_updates(self):
+        self.like(self.tweets[0], self.others[0], hours_ago=2)
+        rescore()
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweets[0].pk}))
+        updated = TweetScore.objects.get()
+        rescore()
+        self.assertAlmostEqual(TweetScore.objects.get().rank, updated.rank, places=3)
+
+    def test_popular_view(self):
+        with override_settings(POPULAR={**settings.POPULAR, "MAX_TWEETS": 100}):
+            tweets = [Tweet.objects.create(user=self.user, content=f"popular {i}") for i in range(25)]
+            for i, tweet in enumerate(tweets):
+                self.like(tweet, self.others[0], hours_ago=(25 - i) / 10)
+            rescore()
+        response = self.client.get(reverse("tweets:popular"))
+        self.assertEqual(response.context["tweets"], tweets[:-21:-1])
+        response = self.client.get(reverse("tweets:popular"), {"before": response.context["page_obj"].next_cursor})
+        self.assertEqual(response.context["tweets"], tweets[4::-1])
+
+
+class TestTweetCard(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, title="test", content="testtweet")
+        self.url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_card_is_cached(self):
+        self.client.get(self.url)
+        self.assertIn("testtweet", cache.get(tweet_card_key(self.tweet.pk, 0)))
+        # Served from the cache until the version changes.
+        Tweet.objects.filter(pk=self.tweet.pk).update(content="edited")
+        self.assertContains(self.client.get(self.url), "testtweet")
+
+    def test_viewer_parts_are_not_cached(self):
+        delete_url = reverse("tweets:delete", kwargs={"pk": self.tweet.pk})
+        self.assertContains(self.client.get(self.url), delete_url)
+        self.client.login(username="testuser2", password="testpassword")
+        TweetLike.objects.create(tweet=self.tweet, user=self.user2)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=0)
+        response = self.client.get(self.url)
+        self.assertNotContains(response, delete_url)
+        self.assertContains(response, 'data-liked="true"')
+
+    def test_like_and_unlike_invalidate_card(self):
+        self.client.get(self.url)
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertIsNone(cache.get(tweet_card_key(self.tweet.pk, 0)))
+        self.assertContains(self.client.get(self.url), f'<span class="count_{self.tweet.pk}">1</span>')
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.assertIsNone(cache.get(tweet_card_key(self.tweet.pk, 1)))
+
+    def test_batch_invalidates_card(self):
+        self.client.get(self.url)
+        self.client.post(
+            reverse("tweets:like_batch"),
+            {"ops": [{"tweet_id": self.tweet.pk, "op": "like"}]},
+            content_type="application/json",
+        )
+        self.assertIsNone(cache.get(tweet_card_key(self.tweet.pk, 0)))
+
+    def test_delete_invalidates_card(self):
+        self.client.get(self.url)
+        self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.assertIsNone(cache.get(tweet_card_key(self.tweet.pk, 0)))
 
 
 class TestTweetDeleteView(TestCase):
@@ -84,9 +620,11 @@ class TestTweetDeleteView(TestCase):
         self.url2 = reverse("tweets:delete", kwargs={"pk": self.tweet2.pk})
 
     def test_success_post(self):
+        push_tweet(self.tweet)
         response = self.client.post(self.url)
         self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
         self.assertEqual(Tweet.objects.filter(content="tweet").count(), 0)
+        self.assertFalse(TimelineEntry.objects.exists())
 
     def test_failure_post_with_incorrect_user(self):
         response = self.client.post(self.url2)
@@ -110,6 +648,17 @@ class TestLikeView(TestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(TweetLike.objects.count(), 1)
+        self.assertEqual(response.json()["like_count"], 1)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+
+    @override_settings(TWEET_LIKE_SHARD_THRESHOLD=0)
+    def test_success_post_with_sharded_counter(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.json()["like_count"], 1)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 0)
+        self.assertEqual(TweetLikeCounter.objects.get(tweet=self.tweet).count, 1)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:like", kwargs={"pk": "1000"}))
@@ -118,9 +667,11 @@ class TestLikeView(TestCase):
 
     def test_failure_post_with_liked_tweet(self):
         TweetLike.objects.create(tweet=self.tweet, user=self.user)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(TweetLike.objects.count(), 1)
+        self.assertEqual(response.json()["like_count"], 1)
 
 
 class TestUnLikeView(TestCase):
@@ -129,12 +680,14 @@ class TestUnLikeView(TestCase):
         self.client.login(username="testuser", password="testpassword")
         self.tweet = Tweet.objects.create(user=self.user, title="test", content="testtweet")
         TweetLike.objects.create(tweet=self.tweet, user=self.user)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
         self.url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})
 
     def test_success_post(self):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(TweetLike.objects.count(), 0)
+        self.assertEqual(response.json()["like_count"], 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:unlike", kwargs={"pk": "1000"}))
@@ -143,5 +696,332 @@ class TestUnLikeView(TestCase):
 
     def test_failure_post_with_unliked_tweet(self):
         TweetLike.objects.filter(tweet=self.tweet, user=self.user).delete()
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=0)
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["like_count"], 0)
+
+
+class TestLikeCount(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, title="test", content="testtweet")
+
+    def test_rebuild_like_counts(self):
+        TweetLike.objects.create(tweet=self.tweet, user=self.user)
+        TweetLike.objects.create(tweet=self.tweet, user=self.user2)
+        TweetLikeCounter.objects.create(tweet=self.tweet, slot=0, count=5)
+        call_command("rebuild_like_counts", stdout=StringIO())
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 2)
+        self.assertFalse(TweetLikeCounter.objects.exists())
+
+    def test_delete_user_discounts_likes(self):
+        TweetLike.objects.create(tweet=self.tweet, user=self.user2)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
+        self.user2.delete()
+        self.assertEqual(get_like_count(self.tweet.pk), 0)
+
+
+class TestLikeBatchView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        self.tweet1 = Tweet.objects.create(user=self.user, content="tweet1")
+        self.tweet2 = Tweet.objects.create(user=self.user, content="tweet2")
+        self.tweet3 = Tweet.objects.create(user=self.user, content="tweet3")
+        TweetLike.objects.create(tweet=self.tweet2, user=self.user)
+        TweetLike.objects.create(tweet=self.tweet2, user=self.user2)
+        Tweet.objects.filter(pk=self.tweet2.pk).update(like_count=2)
+        self.url = reverse("tweets:like_batch")
+
+    def post(self, ops):
+        return self.client.post(self.url, {"ops": ops}, content_type="application/json")
+
+    def test_success_post(self):
+        response = self.post(
+            [
+                {"tweet_id": self.tweet1.pk, "op": "like"},
+                {"tweet_id": self.tweet2.pk, "op": "unlike"},
+                {"tweet_id": self.tweet3.pk, "op": "like"},
+                {"tweet_id": self.tweet3.pk, "op": "unlike"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.json()["tweets"], key=lambda t: t["tweet_id"]),
+            [
+                {"tweet_id": self.tweet1.pk, "is_liked": True, "like_count": 1},
+                {"tweet_id": self.tweet2.pk, "is_liked": False, "like_count": 1},
+                {"tweet_id": self.tweet3.pk, "is_liked": False, "like_count": 0},
+            ],
+        )
+        self.assertEqual(
+            set(TweetLike.objects.values_list("tweet", "user")),
+            {(self.tweet1.pk, self.user.pk), (self.tweet2.pk, self.user2.pk)},
+        )
+
+    def test_success_post_with_repeated_ops(self):
+        ops = [{"tweet_id": self.tweet2.pk, "op": "like"}, {"tweet_id": self.tweet1.pk, "op": "unlike"}]
+        response = self.post(ops)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_like_count(self.tweet1.pk), 0)
+        self.assertEqual(get_like_count(self.tweet2.pk), 2)
+
+    def test_success_post_with_not_exist_tweet(self):
+        response = self.post([{"tweet_id": 1000, "op": "like"}, {"tweet_id": self.tweet1.pk, "op": "like"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["tweet_id"] for t in response.json()["tweets"]], [self.tweet1.pk])
+
+    def test_failure_post_with_invalid_ops(self):
+        response = self.post([{"tweet_id": self.tweet1.pk, "op": "retweet"}])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, "not json", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        for tweet_id in [2**70, 2**63, 0, -1]:
+            with self.subTest(tweet_id=tweet_id):
+                response = self.post([{"tweet_id": tweet_id, "op": "like"}])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.content, b"invalid operations")
+        self.assertEqual(TweetLike.objects.count(), 2)
+
+
+class TestAsyncLikeView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.async_client.force_login(self.user)
+        self.tweet = Tweet.objects.create(user=self.user, title="test", content="testtweet")
+
+    async def test_success_post(self):
+        response = await self.async_client.post(reverse("tweets:like_async", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["like_count"], 1)
+        self.assertEqual(await TweetLike.objects.acount(), 1)
+
+        response = await self.async_client.post(reverse("tweets:unlike_async", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["like_count"], 0)
+        self.assertEqual(await TweetLike.objects.acount(), 0)
+
+    async def test_failure_post_with_not_exist_tweet(self):
+        response = await self.async_client.post(reverse("tweets:like_async", kwargs={"pk": 1000}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_failure_post_with_anonymous_user(self):
+        response = await AsyncClient().post(reverse("tweets:like_async", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await TweetLike.objects.acount(), 0)
+
+
+@override_settings(LIKE_WRITE_BEHIND={**settings.LIKE_WRITE_BEHIND, "ENABLED": True, "FLUSH_INTERVAL_MS": None})
+class TestLikeWriteBehind(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, title="test", content="testtweet")
+        self.addCleanup(stop_like_buffer)
+
+    def test_success_post(self):
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json()["like_count"], 1)
+        self.assertFalse(TweetLike.objects.exists())
+        self.assertEqual(get_like_buffer().metrics()["depth"], 1)
+
+        get_like_buffer().flush()
+        self.assertTrue(TweetLike.objects.filter(tweet=self.tweet, user=self.user).exists())
+        self.assertEqual(get_like_count(self.tweet.pk), 1)
+        self.assertEqual(get_like_buffer().metrics()["flushed_changes"], 1)
+
+    def test_success_post_with_opposite_ops(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json()["like_count"], 0)
+        self.assertEqual(get_like_buffer().metrics()["depth"], 0)
+
+    def test_flush_when_full(self):
+        tweets = [Tweet.objects.create(user=self.user, content=f"tweet{i}") for i in range(3)]
+        with override_settings(LIKE_WRITE_BEHIND={**settings.LIKE_WRITE_BEHIND, "MAX_EVENTS": 3}):
+            stop_like_buffer()
+            for tweet in tweets:
+                self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+        self.assertEqual(TweetLike.objects.count(), 3)
+        self.assertEqual(get_like_buffer().metrics()["depth"], 0)
+
+    def test_bounded_when_flushes_fail(self):
+        buffer = LikeBuffer(max_events=5, max_pending=10)
+        with mock.patch("tweets.writebehind.apply_like_changes", side_effect=OperationalError("locked")) as apply:
+            accepted = [buffer.record(self.user.pk, pk, liked=True, was_liked=False) for pk in range(1, 51)]
+        self.assertEqual(accepted.count(True), 10)
+        # The failed flush is not retried by every request that follows.
+        self.assertEqual(apply.call_count, 1)
+        self.assertEqual(buffer.metrics()["depth"], 10)
+        self.assertEqual(buffer.pending_delta(1), 1)
+        self.assertEqual(buffer.pending_delta(11), 0)
+
+        buffer._retry_at = 0.0
+        buffer.flush()
+        self.assertEqual(buffer.metrics()["depth"], 0)
+        self.assertEqual(buffer.pending_delta(1), 0)
+
+    def test_full_buffer_writes_directly(self):
+        with override_settings(LIKE_WRITE_BEHIND={**settings.LIKE_WRITE_BEHIND, "MAX_PENDING": 0}):
+            stop_like_buffer()
+            response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json()["like_count"], 1)
+        self.assertTrue(TweetLike.objects.filter(tweet=self.tweet, user=self.user).exists())
+        self.assertEqual(get_like_buffer().metrics()["rejected"], 1)
+
+    def test_replay_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = os.path.join(directory, "likes.journal")
+            buffer = LikeBuffer(journal=journal)
+            buffer.record(self.user.pk, self.tweet.pk, liked=True, was_liked=False)
+            # The process dies before flushing; a new one replays the journal.
+            buffer._journal_lock.close()
+            LikeBuffer(journal=journal).start()
+            self.assertEqual(os.listdir(directory), ["likes.journal.%d.lock" % os.getpid()])
+        self.assertEqual(get_like_count(self.tweet.pk), 1)
+
+    def test_journal_per_process(self):
+        other = Tweet.objects.create(user=self.user, content="other")
+        with tempfile.TemporaryDirectory() as directory:
+            journal = os.path.join(directory, "likes.journal")
+            with mock.patch("tweets.writebehind.os.getpid", return_value=1):
+                first = LikeBuffer(journal=journal)
+                first.record(self.user.pk, self.tweet.pk, liked=True, was_liked=False)
+            with mock.patch("tweets.writebehind.os.getpid", return_value=2):
+                second = LikeBuffer(journal=journal)
+                second.record(self.user.pk, other.pk, liked=True, was_liked=False)
+                second.flush()
+            # A worker starting while the others are alive leaves their journals alone.
+            with mock.patch("tweets.writebehind.os.getpid", return_value=3):
+                LikeBuffer(journal=journal).start()
+            self.assertEqual(get_like_count(self.tweet.pk), 0)
+            self.assertTrue(os.path.exists(f"{journal}.1"))
+
+            # The first worker dies; the next one to start replays its journal.
+            first._journal_lock.close()
+            with mock.patch("tweets.writebehind.os.getpid", return_value=4):
+                LikeBuffer(journal=journal).start()
+            self.assertFalse(os.path.exists(f"{journal}.1"))
+        self.assertEqual(get_like_count(self.tweet.pk), 1)
+        self.assertEqual(get_like_count(other.pk), 1)
+
+
+class TestQueryBudget(QueryBudgetTestCase):
+    def new_tweet(self, liked=False):
+        tweet = Tweet.objects.create(user=self.author, content="new")
+        if liked:
+            TweetLike.objects.create(tweet=tweet, user=self.viewer)
+            Tweet.objects.filter(pk=tweet.pk).update(like_count=1)
+        return tweet
+
+    def post(self, name, tweet):
+        return self.client.post(reverse(name, kwargs={"pk": tweet.pk}))
+
+    def test_home(self):
+        self.assertQueryBudget(6, lambda: self.client.get(reverse("tweets:home")))
+
+    def test_create(self):
+        self.assertQueryBudget(
+            7, lambda: self.client.post(reverse("tweets:create"), {"title": "title", "content": "tweet"})
+        )
+
+    def test_detail(self):
+        self.assertQueryBudget(
+            5, lambda: self.client.get(reverse("tweets:detail", kwargs={"pk": self.latest_tweet().pk}))
+        )
+
+    def test_search(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("tweets:search"), {"q": "tweet"}))
+
+    def test_create_with_tags(self):
+        def prepare():
+            # Old trending buckets are pruned by the first write of a bucket only.
+            cache.add(f"tag_counts_pruned:{bucket_of(time.time())}", True)
+
+        self.assertQueryBudget(
+            12,
+            lambda _: self.client.post(
+                reverse("tweets:create"), {"title": "title", "content": "#tag @author @viewer #other"}
+            ),
+            prepare=prepare,
+        )
+
+    def test_tag(self):
+        def prepare():
+            tweets = Tweet.objects.filter(user=self.author).exclude(tags__tag="tag")
+            TweetTag.objects.bulk_create(
+                TweetTag(tweet=tweet, tag="tag", created_at=tweet.created_at) for tweet in tweets
+            )
+
+        self.assertQueryBudget(
+            4, lambda _: self.client.get(reverse("tweets:tag", kwargs={"tag": "tag"})), prepare=prepare
+        )
+
+    def test_mention(self):
+        def prepare():
+            tweets = Tweet.objects.filter(user=self.author).exclude(mentions__user=self.viewer)
+            TweetMention.objects.bulk_create(
+                TweetMention(tweet=tweet, user=self.viewer, created_at=tweet.created_at) for tweet in tweets
+            )
+
+        self.assertQueryBudget(
+            5, lambda _: self.client.get(reverse("tweets:mention", kwargs={"username": "viewer"})), prepare=prepare
+        )
+
+    def test_popular(self):
+        def prepare():
+            TweetScore.objects.bulk_create(
+                [TweetScore(tweet=tweet, score=1, scored_at=0, rank=tweet.pk) for tweet in Tweet.objects.all()],
+                ignore_conflicts=True,
+            )
+
+        self.assertQueryBudget(4, lambda _: self.client.get(reverse("tweets:popular")), prepare=prepare)
+
+    def test_trending(self):
+        def prepare():
+            cache.clear()
+            TagCount.objects.all().delete()
+            bucket = int(time.time() // settings.TRENDING["BUCKET_SECONDS"])
+            TagCount.objects.bulk_create(
+                TagCount(tag=f"tag{i}", bucket=bucket, count=i) for i in range(len(self.others))
+            )
+
+        self.assertQueryBudget(3, lambda _: self.client.get(reverse("tweets:trending")), prepare=prepare)
+
+    def test_delete(self):
+        def prepare():
+            tweet = Tweet.objects.create(user=self.viewer, content="to delete")
+            push_tweet(tweet)
+            return tweet
+
+        self.assertQueryBudget(17, lambda tweet: self.post("tweets:delete", tweet), prepare=prepare)
+
+    def test_like(self):
+        self.assertQueryBudget(13, lambda tweet: self.post("tweets:like", tweet), prepare=self.new_tweet)
+
+    def test_unlike(self):
+        self.assertQueryBudget(
+            10, lambda tweet: self.post("tweets:unlike", tweet), prepare=lambda: self.new_tweet(liked=True)
+        )
+
+    def test_like_async(self):
+        self.assertQueryBudget(13, lambda tweet: self.post("tweets:like_async", tweet), prepare=self.new_tweet)
+
+    def test_unlike_async(self):
+        self.assertQueryBudget(
+            10,
+            lambda tweet: self.post("tweets:unlike_async", tweet),
+            prepare=lambda: self.new_tweet(liked=True),
+        )
+
+    def test_like_batch(self):
+        def request(tweets):
+            ops = [{"tweet_id": tweet.pk, "op": "like"} for tweet in tweets]
+            ops.append({"tweet_id": self.latest_tweet().pk, "op": "unlike"})
+            return self.client.post(reverse("tweets:like_batch"), {"ops": ops}, content_type="application/json")
+
+        self.assertQueryBudget(12, request, prepare=lambda: [self.new_tweet() for _ in range(5)])
@@ -0,0 +1,152 @@
+import heapq
+from collections import namedtuple
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+
+from accounts.models import FollowUser, User
+
+from .models import TimelineEntry, Tweet
+from .pagination import keyset_slice, page_from_slice
+
+TimelineRow = namedtuple("TimelineRow", ["created_at", "tweet_id"])
+ROW_KEYS = ("created_at", "tweet_id")
+
+
+def is_pulled_author(user):
+    # Authors above the threshold are never fanned out; their tweets are
+    # merged into each reader's timeline when it is read.
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    return threshold is not None and user.follower_count > threshold
+
+
+def _insert(entries):
+    batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+    entries = iter(entries)
+    while batch := list(islice(entries, batch_size)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def push_tweet(tweet):
+    owner_ids = [tweet.user_id]
+    if not is_pulled_author(tweet.user):
+        follower_ids = (
+            FollowUser.objects.filter(following_id=tweet.user_id)
+            .values_list("follower_id", flat=True)
+            .iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE)
+        )
+        owner_ids = chain(owner_ids, follower_ids)
+    _insert(
+        TimelineEntry(owner_id=owner_id, tweet_id=tweet.pk, author_id=tweet.user_id, created_at=tweet.created_at)
+        for owner_id in owner_ids
+    )
+
+
+def retract_tweet(tweet):
+    TimelineEntry.objects.filter(tweet_id=tweet.pk).delete()
+
+
+def backfill_timeline(owner, author):
+    if owner.pk != author.pk and is_pulled_author(author):
+        return
+    recent = (
+        Tweet.objects.filter(user_id=author.pk)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[: settings.TIMELINE_BACKFILL_SIZE]
+    )
+    _insert(
+        TimelineEntry(owner_id=owner.pk, tweet_id=tweet_id, author_id=author.pk, created_at=created_at)
+        for tweet_id, created_at in recent
+    )
+
+
+def refill_followers(author_id):
+    """
+    Fan out the recent tweets of an author whose follower count just fell to
+    the threshold. Their tweets were merged in on read while they were above
+    it, so their followers have no entries for them.
+    """
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    if threshold is None or not User.objects.filter(pk=author_id, follower_count=threshold).exists():
+        return
+    recent = list(
+        Tweet.objects.filter(user_id=author_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[: settings.TIMELINE_BACKFILL_SIZE]
+    )
+    follower_ids = (
+        FollowUser.objects.filter(following_id=author_id)
+        .values_list("follower_id", flat=True)
+        .iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE)
+    )
+    _insert(
+        TimelineEntry(owner_id=owner_id, tweet_id=tweet_id, author_id=author_id, created_at=created_at)
+        for owner_id in follower_ids
+        for tweet_id, created_at in recent
+    )
+
+
+def prune_timeline(owner, author):
+    TimelineEntry.objects.filter(owner_id=owner.pk, author_id=author.pk).delete()
+
+
+def _pulled_follows(owner):
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    if threshold is None:
+        return FollowUser.objects.none()
+    return FollowUser.objects.filter(follower=owner, following__follower_count__gt=threshold)
+
+
+def pulled_author_ids(owner):
+    return list(_pulled_follows(owner).values_list("following_id", flat=True))
+
+
+def timeline_version(owner):
+    """
+    The newest ``created_at`` among ``owner``'s entries and among the pulled
+    authors' tweets, read in one query. New tweets move it forward; follows
+    and deletions are tracked by cached versions instead (see versions.py).
+    """
+    latest_entry = TimelineEntry.objects.filter(owner=owner).order_by("-created_at").values("created_at")[:1]
+    # The newest of each pulled author's newest tweet: one index seek per
+    # author rather than sorting all of their tweets.
+    author_latest = Tweet.objects.filter(user=OuterRef("following")).order_by("-created_at").values("created_at")[:1]
+    latest_pulled = (
+        _pulled_follows(owner)
+        .order_by()
+        .values("follower")
+        .annotate(latest=Max(Subquery(author_latest)))
+        .values("latest")
+    )
+    return User.objects.filter(pk=owner.pk).values_list(Subquery(latest_entry), Subquery(latest_pulled)).get()
+
+
+def read_timeline(owner, per_page, before=None, after=None):
+    """
+    One page of ``owner``'s home timeline as ``TimelineRow``s.
+
+    The materialized entries and a ``created_at``-ordered slice of each
+    pulled author's tweets are k-way merged; every source is a single
+    indexed seek of at most ``per_page + 1`` rows.
+    """
+    limit = per_page + 1
+    entries = TimelineEntry.objects.filter(owner=owner).only("created_at", "tweet")
+    sources = [[TimelineRow(e.created_at, e.tweet_id) for e in keyset_slice(entries, ROW_KEYS, limit, before, after)]]
+    for author_id in pulled_author_ids(owner):
+        tweets = Tweet.objects.filter(user_id=author_id).only("created_at")
+        sources.append(
+            [TimelineRow(t.created_at, t.pk) for t in keyset_slice(tweets, ("created_at", "id"), limit, before, after)]
+        )
+
+    rows, seen = [], set()
+    # An author who crossed the threshold may still have older entries
+    # fanned out, so the same tweet can come from two sources.
+    for row in heapq.merge(*sources, reverse=after is None):
+        if row.tweet_id in seen:
+            continue
+        seen.add(row.tweet_id)
+        rows.append(row)
+        if len(rows) == limit:
+            break
+    return page_from_slice(rows, ROW_KEYS, per_page, before=before, after=after)
@@ -7,8 +7,16 @@ app_name = "tweets"
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
+    path("search/", views.TweetSearchView.as_view(), name="search"),
+    path("tags/<str:tag>/", views.TagView.as_view(), name="tag"),
+    path("mentions/<str:username>/", views.MentionView.as_view(), name="mention"),
+    path("popular/", views.PopularView.as_view(), name="popular"),
+    path("trending/", views.TrendingView.as_view(), name="trending"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("likes/", views.LikeBatchView.as_view(), name="like_batch"),
+    path("<int:pk>/like/async/", views.AsyncLikeView.as_view(), name="like_async"),
+    path("<int:pk>/unlike/async/", views.AsyncUnlikeView.as_view(), name="unlike_async"),
 ]
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from perf.routers import read_primary_if_changed
+
+# Version counters kept in the cache so that pages can build an ETag without
+# running their main queries. A counter that is missing, because it was never
+# set or was evicted, restarts from the clock rather than from zero so it can
+# never repeat a value an old ETag was built from.
+#
+# Each bump also records when it happened, for PIN_SECONDS. A page whose
+# versions changed that recently is read from the primary, or the replica
+# could serve the old page under the new ETag and clients would keep it.
+
+LIKES_KEY = "version:likes"
+TWEET_DELETES_KEY = "version:tweet_deletes"
+
+
+def tweet_likes_key(tweet_id):
+    return f"version:tweet:{tweet_id}:likes"
+
+
+def user_likes_key(user_id):
+    # Likes on any tweet written by the user.
+    return f"version:user:{user_id}:likes"
+
+
+def user_follows_key(user_id):
+    return f"version:user:{user_id}:follows"
+
+
+def changed_at_key(key):
+    return f"{key}:changed_at"
+
+
+def get_versions(keys):
+    changed_keys = [changed_at_key(key) for key in keys]
+    versions = cache.get_many([*keys, *changed_keys])
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    read_primary_if_changed(max((versions.get(key, 0) for key in changed_keys), default=0))
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    keys = list(keys)
+
+    def bump():
+        # Marked first, so a reader that sees the new version also sees it as fresh.
+        cache.set_many(
+            {changed_at_key(key): time.time() for key in keys}, timeout=settings.READ_REPLICAS["PIN_SECONDS"]
+        )
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), timeout=None)
+
+    # Readers must not see the new version before the data it stands for.
+    transaction.on_commit(bump)
+
+
+def bump_like_versions(tweets):
+    """Bump the like versions for ``(tweet_id, author_id)`` pairs."""
+    keys = {LIKES_KEY}
+    for tweet_id, author_id in tweets:
+        keys.add(tweet_likes_key(tweet_id))
+        keys.add(user_likes_key(author_id))
+    bump_versions(keys)
+
+
+def bump_follow_versions(user_ids):
+    bump_versions(user_follows_key(user_id) for user_id in user_ids)
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
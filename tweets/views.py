@@ -1,26 +1,176 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import CreateView, DeleteView, DetailView, ListView, View
+
+from accounts.mixins import AsyncLoginRequiredMixin
+from accounts.models import User
+
+from .cards import invalidate_tweet_card, invalidate_tweet_cards, tweet_card_key
+from .models import TimelineEntry, Tweet, TweetMention, TweetScore, TweetTag
+from .pagination import paginate_keyset
+from .search import search_tweets
+from .services import apply_like_changes, get_like_count, like_tweet, unlike_tweet
+from .tags import index_tweet, normalize_tag, trending_tags, unindex_tweet
+from .timeline import ROW_KEYS, push_tweet, read_timeline, retract_tweet, timeline_version
+from .versions import (
+    LIKES_KEY,
+    TWEET_DELETES_KEY,
+    bump_versions,
+    get_versions,
+    make_etag,
+    tweet_likes_key,
+    user_follows_key,
+)
+from .writebehind import buffer_like
+
+# Largest id SQLite's 64-bit INTEGER can hold.
+MAX_ID = 2**63 - 1
+
+
+def parse_id(value):
+    tweet_id = int(value)
+    if not 0 < tweet_id <= MAX_ID:
+        raise ValueError(f"id out of range: {tweet_id}")
+    return tweet_id
+
+
+def tweets_in_order(user, tweet_ids):
+    tweets = Tweet.objects.select_related("user").with_like_count().with_liked_by(user).in_bulk(tweet_ids)
+    return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
+
+def home_etag(request, *args, **kwargs):
+    # Any like changes the home page's counts, so it follows the global
+    # like version; the detail and profile pages use narrower ones.
+    user = request.user
+    return make_etag(
+        user.pk,
+        request.META.get("CSRF_COOKIE"),
+        timeline_version(user),
+        get_versions([LIKES_KEY, TWEET_DELETES_KEY, user_follows_key(user.pk)]),
+    )
 
-from .models import Tweet, TweetLike
 
+def tweet_detail_etag(request, pk):
+    if not Tweet.objects.filter(pk=pk).exists():
+        return None
+    return make_etag(request.user.pk, request.META.get("CSRF_COOKIE"), pk, get_versions([tweet_likes_key(pk)]))
 
+
+@method_decorator(condition(etag_func=home_etag), name="get")
 class HomeView(LoginRequiredMixin, ListView):
     template_name = "tweets/home.html"
-    model = Tweet
-    queryset = model.objects.select_related("user").prefetch_related("liked_tweet").order_by("-created_at")
     context_object_name = "tweets"
+    paginate_by = 20
+
+    def get_queryset(self):
+        return TimelineEntry.objects.filter(owner=self.request.user)
+
+    def paginate_queryset(self, queryset, page_size):
+        page = read_timeline(
+            self.request.user,
+            page_size,
+            before=self.request.GET.get("before"),
+            after=self.request.GET.get("after"),
+        )
+        page.object_list = tweets_in_order(self.request.user, [row.tweet_id for row in page])
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class TweetSearchView(LoginRequiredMixin, ListView):
+    template_name = "tweets/search.html"
+    context_object_name = "tweets"
+    paginate_by = 20
+
+    def get_queryset(self):
+        return Tweet.objects.none()
+
+    def paginate_queryset(self, queryset, page_size):
+        page = search_tweets(self.request.GET.get("q", ""), page_size, cursor=self.request.GET.get("cursor"))
+        page.object_list = tweets_in_order(self.request.user, [row.id for row in page])
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["liked_list"] = (
-            TweetLike.objects.select_related("tweet").filter(user=self.request.user).values_list("tweet", flat=True)
+        context["query"] = self.request.GET.get("q", "")
+        return context
+
+
+class TweetRowListView(LoginRequiredMixin, ListView):
+    """Keyset-paginated tweets that the ``row_keys`` rows of ``get_queryset()`` point at."""
+
+    context_object_name = "tweets"
+    paginate_by = 20
+    row_keys = ROW_KEYS
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(
+            queryset.only(*self.row_keys),
+            self.row_keys,
+            page_size,
+            before=self.request.GET.get("before"),
+            after=self.request.GET.get("after"),
         )
+        page.object_list = tweets_in_order(self.request.user, [row.tweet_id for row in page])
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class TagView(TweetRowListView):
+    template_name = "tweets/tag.html"
+
+    def get_queryset(self):
+        self.tag = normalize_tag(self.kwargs["tag"])
+        return TweetTag.objects.filter(tag=self.tag)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["tag"] = self.tag
+        return context
+
+
+class MentionView(TweetRowListView):
+    template_name = "tweets/mention.html"
+
+    def get_queryset(self):
+        self.mentioned = get_object_or_404(User, username=self.kwargs["username"])
+        return TweetMention.objects.filter(user=self.mentioned)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["mentioned"] = self.mentioned
         return context
 
 
+class PopularView(TweetRowListView):
+    template_name = "tweets/popular.html"
+    row_keys = ("rank", "tweet_id")
+
+    def get_queryset(self):
+        return TweetScore.objects.all()
+
+
+class TrendingView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(
+            {
+                "tags": [
+                    {"tag": tag, "count": count, "url": reverse("tweets:tag", kwargs={"tag": tag})}
+                    for tag, count in trending_tags()
+                ]
+            }
+        )
+
+
 class TweetCreateView(LoginRequiredMixin, CreateView):
     model = Tweet
     template_name = "tweets/create.html"
@@ -29,7 +179,11 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            push_tweet(self.object)
+            index_tweet(self.object)
+        return response
 
 
 class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
@@ -40,31 +194,39 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         return self.get_object().user == self.request.user
 
+    def form_valid(self, form):
+        tweet_id = self.object.pk
+        like_count = get_like_count(tweet_id)
+        with transaction.atomic():
+            retract_tweet(self.object)
+            unindex_tweet(self.object)
+            response = super().form_valid(form)
+        invalidate_tweet_card(tweet_id, like_count)
+        bump_versions([TWEET_DELETES_KEY])
+        return response
 
+
+@method_decorator(condition(etag_func=tweet_detail_etag), name="get")
 class TweetDetailView(LoginRequiredMixin, DetailView):
     template_name = "tweets/detail.html"
     model = Tweet
-    queryset = Tweet.objects.select_related("user")
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        liked_list = (
-            TweetLike.objects.filter(tweet=self.object, user=self.request.user)
-            .prefetch_related("user")
-            .values_list("tweet", flat=True)
-        )
-        context["liked_list"] = liked_list
-        return context
+    def get_queryset(self):
+        return Tweet.objects.select_related("user").with_like_count().with_liked_by(self.request.user)
 
 
 class LikeView(LoginRequiredMixin, ListView):
     def post(self, request, *args, **kwargs):
         tweet_id = self.kwargs["pk"]
         tweet = get_object_or_404(Tweet, id=tweet_id)
-        TweetLike.objects.get_or_create(tweet=tweet, user=self.request.user)
+        if settings.LIKE_WRITE_BEHIND["ENABLED"]:
+            like_count = buffer_like(self.request.user, tweet, liked=True)
+        else:
+            liked = like_tweet(self.request.user, tweet)
+            like_count = get_like_count(tweet_id)
+            if liked:
+                invalidate_tweet_card(tweet_id, like_count - 1)
         unlike_url = reverse("tweets:unlike", kwargs={"pk": tweet_id})
-        tweet = Tweet.objects.prefetch_related("liked_tweet").get(id=tweet_id)
-        like_count = tweet.liked_tweet.count()
         is_liked = True
         context = {
             "like_count": like_count,
@@ -79,12 +241,15 @@ class UnlikeView(LoginRequiredMixin, ListView):
     def post(self, request, *args, **kwargs):
         tweet_id = self.kwargs["pk"]
         tweet = get_object_or_404(Tweet, pk=tweet_id)
-        if like := TweetLike.objects.filter(user=self.request.user, tweet=tweet):
-            like.delete()
+        if settings.LIKE_WRITE_BEHIND["ENABLED"]:
+            like_count = buffer_like(self.request.user, tweet, liked=False)
+        else:
+            unliked = unlike_tweet(self.request.user, tweet)
+            like_count = get_like_count(tweet_id)
+            if unliked:
+                invalidate_tweet_card(tweet_id, like_count + 1)
         is_liked = False
         like_url = reverse("tweets:like", kwargs={"pk": tweet_id})
-        tweet = Tweet.objects.prefetch_related("liked_tweet").get(id=tweet_id)
-        like_count = tweet.liked_tweet.count()
         context = {
             "like_count": like_count,
             "tweet_id": tweet_id,
@@ -92,3 +257,72 @@ class UnlikeView(LoginRequiredMixin, ListView):
             "like_url": like_url,
         }
         return JsonResponse(context)
+
+
+class LikeBatchView(LoginRequiredMixin, View):
+    ops = {"like": True, "unlike": False}
+
+    def post(self, request, *args, **kwargs):
+        try:
+            operations = json.loads(request.body)["ops"]
+            # Later operations on the same tweet win, so rapid toggles collapse.
+            changes = {(request.user.pk, parse_id(op["tweet_id"])): self.ops[op["op"]] for op in operations}
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest("invalid operations")
+        if len(operations) > settings.LIKE_BATCH_MAX_OPS:
+            return HttpResponseBadRequest("too many operations")
+
+        deltas = apply_like_changes(changes)
+        like_counts = Tweet.objects.with_like_count().filter(pk__in=deltas).order_by().values_list("id", "like_total")
+        invalidate_tweet_cards(
+            (tweet_id, like_count - deltas[tweet_id]) for tweet_id, like_count in like_counts if deltas[tweet_id]
+        )
+        context = {
+            "tweets": [
+                {"tweet_id": tweet_id, "is_liked": changes[(request.user.pk, tweet_id)], "like_count": like_count}
+                for tweet_id, like_count in like_counts
+            ]
+        }
+        return JsonResponse(context)
+
+
+class AsyncLikeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        tweet_id = self.kwargs["pk"]
+        try:
+            tweet = await Tweet.objects.only("like_count", "user_id", "created_at").aget(pk=tweet_id)
+        except Tweet.DoesNotExist:
+            raise Http404
+        # The like and its counter update share one transaction, which the
+        # async ORM cannot open, so that unit runs in a single thread hop.
+        liked = await sync_to_async(like_tweet)(request.user, tweet)
+        like_count = await Tweet.objects.with_like_count().values_list("like_total", flat=True).aget(pk=tweet_id)
+        if liked:
+            await cache.adelete(tweet_card_key(tweet_id, like_count - 1))
+        context = {
+            "like_count": like_count,
+            "tweet_id": tweet_id,
+            "is_liked": True,
+            "unlike_url": reverse("tweets:unlike_async", kwargs={"pk": tweet_id}),
+        }
+        return JsonResponse(context)
+
+
+class AsyncUnlikeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        tweet_id = self.kwargs["pk"]
+        try:
+            tweet = await Tweet.objects.only("like_count", "user_id", "created_at").aget(pk=tweet_id)
+        except Tweet.DoesNotExist:
+            raise Http404
+        unliked = await sync_to_async(unlike_tweet)(request.user, tweet)
+        like_count = await Tweet.objects.with_like_count().values_list("like_total", flat=True).aget(pk=tweet_id)
+        if unliked:
+            await cache.adelete(tweet_card_key(tweet_id, like_count + 1))
+        context = {
+            "like_count": like_count,
+            "tweet_id": tweet_id,
+            "is_liked": False,
+            "like_url": reverse("tweets:like_async", kwargs={"pk": tweet_id}),
+        }
+        return JsonResponse(context)
@@ -0,0 +1,319 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from .models import TweetLike
+from .services import apply_like_changes, get_like_count, like_tweet, unlike_tweet
+
+logger = logging.getLogger(__name__)
+
+# Failed flushes are retried after a delay that doubles up to this.
+MAX_RETRY_SECONDS = 30
+
+
+class LikeBuffer:
+    """
+    In-process write-behind buffer for like/unlike intents.
+
+    Intents are keyed by ``(user_id, tweet_id)`` and only the latest one is
+    kept, so a like followed by an unlike cancels out before reaching the
+    database. A background thread writes the net changes in bulk every
+    ``flush_interval_ms``, and a request that fills the buffer to
+    ``max_events`` flushes it itself. After a failed flush both wait, for a
+    delay that doubles with every failure, before trying again. The buffer
+    never holds more than ``max_pending`` pairs: ``record()`` refuses new
+    ones beyond that and the caller writes them directly.
+
+    Without a journal, intents still in memory are lost if the process dies
+    (at most one flush interval's worth). With ``journal`` set, every intent
+    is appended to this process's ``{journal}.{pid}`` before it is
+    acknowledged. The process holds a lock on its journal while it runs, so
+    on start-up every journal whose lock can be taken was left behind by a
+    process that died, and is replayed and removed. Replaying is safe because
+    a flush sets each pair to its wanted state rather than toggling it.
+    """
+
+    def __init__(self, flush_interval_ms=None, max_events=500, max_pending=10000, journal=None, journal_fsync=False):
+        self.flush_interval_ms = flush_interval_ms
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self.journal = journal
+        self.journal_fsync = journal_fsync
+        self.journal_path = f"{journal}.{os.getpid()}" if journal else None
+        self._journal_lock = None
+        self._lock = threading.Lock()
+        # Taken before self._lock is released, so journal writes keep the
+        # order of the changes they record without holding up readers.
+        self._journal_write_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (user_id, tweet_id) -> (liked in the database, wanted)
+        self._pending = {}
+        self._flushing = {}
+        # tweet_id -> like count change of its pending and in-flight intents
+        self._deltas = Counter()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = Counter()
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def start(self):
+        if self.journal:
+            self.replay()
+        if self.flush_interval_ms:
+            self._thread = threading.Thread(target=self._run, name="like-write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._journal_lock is not None:
+            with self._lock:
+                if not self._pending:
+                    if os.path.exists(self.journal_path):
+                        os.remove(self.journal_path)
+                    os.remove(f"{self.journal_path}.lock")
+                self._journal_lock.close()
+                self._journal_lock = None
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.flush_interval_ms / 1000):
+                if time.monotonic() >= self._retry_at:
+                    self.flush()
+        finally:
+            connection.close()
+
+    def record(self, user_id, tweet_id, liked, was_liked):
+        """
+        Queue an intent. ``was_liked`` is the state the caller read from the
+        database. Returns False, queuing nothing, when the buffer is full and
+        holds nothing for the pair yet.
+        """
+        key = (user_id, tweet_id)
+        with self._lock:
+            if key in self._pending:
+                was_liked = self._pending[key][0]
+            elif key in self._flushing:
+                was_liked = self._flushing[key][1]
+            elif len(self._pending) >= self.max_pending:
+                self._metrics["rejected"] += 1
+                return False
+            self._set_pending(key, None if liked == was_liked else (was_liked, liked))
+            depth = len(self._pending)
+            self._metrics["recorded"] += 1
+            if self.journal:
+                self._journal_write_lock.acquire()
+        if self.journal:
+            try:
+                self._append_journal(key, liked)
+            finally:
+                self._journal_write_lock.release()
+        if depth >= self.max_events and time.monotonic() >= self._retry_at:
+            self.flush()
+        return True
+
+    def _set_pending(self, key, entry):
+        # Must hold self._lock. entry is (was_liked, liked), or None to drop the key.
+        old = self._pending.pop(key, None)
+        if old is not None:
+            self._deltas[key[1]] -= int(old[1]) - int(old[0])
+        if entry is not None:
+            self._pending[key] = entry
+            self._deltas[key[1]] += int(entry[1]) - int(entry[0])
+        if not self._deltas[key[1]]:
+            del self._deltas[key[1]]
+
+    def state(self, user_id, tweet_id):
+        """The liked state the user will see once the buffer drains, or None if nothing is queued."""
+        key = (user_id, tweet_id)
+        with self._lock:
+            entry = self._pending.get(key) or self._flushing.get(key)
+        return None if entry is None else entry[1]
+
+    def pending_delta(self, tweet_id):
+        with self._lock:
+            return self._deltas[tweet_id]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+                batch = self._flushing
+            if not batch:
+                return
+            start = time.perf_counter()
+            try:
+                apply_like_changes({key: liked for key, (_, liked) in batch.items()})
+            except Exception:
+                with self._lock:
+                    # Intents recorded while flushing are newer and win, but
+                    # the database still holds the state from before the batch.
+                    for key, (was_liked, liked) in batch.items():
+                        self._deltas[key[1]] -= int(liked) - int(was_liked)
+                        if key in self._pending:
+                            liked = self._pending[key][1]
+                        self._set_pending(key, None if liked == was_liked else (was_liked, liked))
+                    self._flushing = {}
+                    self._failures += 1
+                    delay = min(
+                        max(self.flush_interval_ms or 0, 100) / 1000 * 2 ** (self._failures - 1), MAX_RETRY_SECONDS
+                    )
+                    self._retry_at = time.monotonic() + delay
+                    self._metrics["failed_flushes"] += 1
+                logger.exception(
+                    "like write-behind flush failed; %d changes re-queued, retrying in %.1f s", len(batch), delay
+                )
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                for key, (was_liked, liked) in batch.items():
+                    self._deltas[key[1]] -= int(liked) - int(was_liked)
+                    if not self._deltas[key[1]]:
+                        del self._deltas[key[1]]
+                self._flushing = {}
+                self._failures = 0
+                self._retry_at = 0.0
+                self._metrics["flushes"] += 1
+                self._metrics["flushed_changes"] += len(batch)
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                depth = len(self._pending)
+                if self.journal:
+                    pending = [(key, liked) for key, (_, liked) in self._pending.items()]
+                    self._journal_write_lock.acquire()
+            if self.journal:
+                try:
+                    self._rewrite_journal(pending)
+                finally:
+                    self._journal_write_lock.release()
+            logger.info(
+                "like write-behind flush",
+                extra={"changes": len(batch), "flush_ms": round(elapsed_ms, 3), "depth": depth},
+            )
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "depth": len(self._pending),
+                "in_flight": len(self._flushing),
+                "recorded": self._metrics["recorded"],
+                "rejected": self._metrics["rejected"],
+                "flushes": self._metrics["flushes"],
+                "failed_flushes": self._metrics["failed_flushes"],
+                "flushed_changes": self._metrics["flushed_changes"],
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "max_flush_ms": round(self._max_flush_ms, 3),
+            }
+
+    def _lock_journal(self):
+        if self._journal_lock is None:
+            self._journal_lock = open(f"{self.journal_path}.lock", "a")
+            fcntl.flock(self._journal_lock, fcntl.LOCK_EX)
+
+    def _append_journal(self, key, liked):
+        self._lock_journal()
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps([*key, liked]) + "\n")
+            f.flush()
+            if self.journal_fsync:
+                os.fsync(f.fileno())
+
+    def _rewrite_journal(self, pending):
+        tmp = f"{self.journal_path}.tmp"
+        with open(tmp, "w") as f:
+            for key, liked in pending:
+                f.write(json.dumps([*key, liked]) + "\n")
+            f.flush()
+            if self.journal_fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+
+    def replay(self):
+        """Replay and remove this process's journal and those left by dead processes."""
+        self._lock_journal()
+        for path in sorted(glob.glob(f"{glob.escape(self.journal)}.*")):
+            if path.endswith((".lock", ".tmp")):
+                continue
+            if path == self.journal_path:
+                self._replay_file(path)
+                continue
+            with open(f"{path}.lock", "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another live process owns it.
+                    continue
+                if os.path.exists(path):
+                    self._replay_file(path)
+                os.remove(f"{path}.lock")
+
+    def _replay_file(self, path):
+        changes = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    user_id, tweet_id, liked = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write.
+                    continue
+                changes[(user_id, tweet_id)] = liked
+        if changes:
+            apply_like_changes(changes)
+            logger.info("like write-behind journal replayed", extra={"path": path, "changes": len(changes)})
+        os.remove(path)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = settings.LIKE_WRITE_BEHIND
+            _buffer = LikeBuffer(
+                flush_interval_ms=options["FLUSH_INTERVAL_MS"],
+                max_events=options["MAX_EVENTS"],
+                max_pending=options["MAX_PENDING"],
+                journal=options["JOURNAL"],
+                journal_fsync=options["JOURNAL_FSYNC"],
+            )
+            _buffer.start()
+        return _buffer
+
+
+@atexit.register
+def stop_like_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.stop()
+            _buffer = None
+
+
+def buffer_like(user, tweet, liked):
+    """Queue a like or unlike and return the like count the tweet will have once it is written."""
+    buffer = get_like_buffer()
+    was_liked = buffer.state(user.pk, tweet.pk)
+    if was_liked is None:
+        was_liked = TweetLike.objects.filter(tweet=tweet, user=user).exists()
+    if not buffer.record(user.pk, tweet.pk, liked, was_liked):
+        # The buffer is full, most likely because flushes are failing.
+        (like_tweet if liked else unlike_tweet)(user, tweet)
+    return get_like_count(tweet.pk) + buffer.pending_delta(tweet.pk)